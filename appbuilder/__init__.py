@@ -49,6 +49,12 @@ from .core.components.llms.dialog_summary import DialogSummary
 from .core.components.llms.is_complex_query import IsComplexQuery
 from .core.components.llms.query_decomposition import QueryDecomposition
 from .core.components.llms.playground import Playground
+from .core.components.llms.cache import (
+    CompletionCache,
+    MemoryCacheBackend,
+    SqliteCacheBackend,
+    FileCacheBackend,
+)
 
 from .core.components.asr.component import ASR
 from .core.components.general_ocr.component import GeneralOCR
@@ -61,11 +67,18 @@ from .core.components.doc_parser.doc_parser import DocParser
 from .core.components.doc_splitter.doc_splitter import DocSplitter
 from .core.components.retriever.bes_retriever import BESRetriever
 from .core.components.retriever.bes_retriever import BESVectorStoreIndex
+from .core.components.retriever.local_retriever import LocalRetriever
+from .core.components.retriever.local_retriever import LocalVectorStoreIndex
+from .core.components.retriever.hybrid_retriever import BM25Index
+from .core.components.retriever.hybrid_retriever import HybridRetriever
+from .core.components.retriever.cache import CachedRetriever
 from .core.components.dish_recognize.component import DishRecognition
 from .core.components.translate.component import Translation
 
 from .core.components.embeddings import Embedding
+from .core.components.embeddings import EmbeddingCache
 from .core.components.matching import Matching
+from .core.components.matching import MatchingIndex
 
 from .core.components.gbi.nl2sql.component import GBINL2Sql
 from .core.components.gbi.select_table.component import GBISelectTable
@@ -73,6 +86,8 @@ from .core.components.gbi.select_table.component import GBISelectTable
 from appbuilder.core.message import Message
 from appbuilder.core.agent import AgentBase
 from appbuilder.core.context import UserSession
+from appbuilder.core.session_store import SessionStore, MemorySessionStore, RedisSessionStore
+from appbuilder.core.pipeline import Pipeline
 
 from appbuilder.utils.logger_util import logger
 
@@ -81,6 +96,7 @@ from .core._exception import (
     ForbiddenException,
     NotFoundException,
     PreconditionFailedException,
+    TooManyRequestsException,
     InternalServerErrorException,
     HTTPConnectionException,
     AppBuilderServerException,
@@ -93,6 +109,7 @@ __all__ = [
     'ForbiddenException',
     'NotFoundException',
     'PreconditionFailedException',
+    'TooManyRequestsException',
     'InternalServerErrorException',
     'HTTPConnectionException',
     'AppBuilderServerException',
@@ -100,6 +117,10 @@ __all__ = [
     'StyleWriting',
     'MRC',
     'Playground',
+    'CompletionCache',
+    'MemoryCacheBackend',
+    'SqliteCacheBackend',
+    'FileCacheBackend',
     'OralQueryGeneration',
     'QAPairMining',
     'SimilarQuestion',
@@ -120,12 +141,23 @@ __all__ = [
     "DocSplitter",
     "BESRetriever",
     "BESVectorStoreIndex",
+    "LocalRetriever",
+    "LocalVectorStoreIndex",
+    "BM25Index",
+    "HybridRetriever",
+    "CachedRetriever",
     'DishRecognition',
     'Translation',
 
     'Message',
+    'Pipeline',
+    'SessionStore',
+    'MemorySessionStore',
+    'RedisSessionStore',
 
     'Embedding',
+    'EmbeddingCache',
 
     'Matching',
+    'MatchingIndex',
 ]
@@ -65,6 +65,8 @@ class BaseClient:
             raise NotFoundException(message)
         elif status_code == requests.codes.precondition_required:
             raise PreconditionFailedException(message)
+        elif status_code == requests.codes.too_many_requests:
+            raise TooManyRequestsException(message)
         elif status_code == requests.codes.internal_server_error:
             raise InternalServerErrorException(message)
         else:
@@ -47,6 +47,12 @@ class PreconditionFailedException(BaseRPCException):
     pass
 
 
+class TooManyRequestsException(BaseRPCException):
+    r"""TooManyRequestsException represent HTTP Code 429 or backend server rate limit error.
+    """
+    pass
+
+
 class InternalServerErrorException(BaseRPCException):
     r"""InternalServerErrorException represent HTTP Code 500.
     """
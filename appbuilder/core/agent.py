@@ -13,7 +13,11 @@
 # limitations under the License.
 import sys
 import os 
+import asyncio
 import logging
+import signal
+import socket
+import time
 import uuid
 import json
 import inspect
@@ -77,6 +81,20 @@ class AgentBase(BaseModel):
             )
             agent = appbuilder.AgentBase(component=component)
             agent.chainlit_demo(port=8091)
+
+        .. code-block:: python
+
+            import os
+            import appbuilder
+            os.environ["APPBUILDER_TOKEN"] = '...'
+
+            component = appbuilder.Playground(
+                prompt_template="{query}",
+                model="ernie-bot-4"
+            )
+            agent = appbuilder.AgentBase(component=component)
+            # 生产环境部署: 4个进程，每个进程最多同时处理64个请求
+            agent.serve_async(port=8092, workers=4, max_concurrency=64, timeout=300)
     """
     component: Component
     user_session_handle: UserSession
@@ -95,8 +113,9 @@ class AgentBase(BaseModel):
         
         Args:
             component (Component): 可运行的 Component
-            user_session_config (str|None): Session 配置字符串，遵循 sqlalchemy 后端定义，参考文档
+            user_session_config (str|UserSession|None): Session 配置字符串，遵循 sqlalchemy 后端定义，参考文档
               https://docs.sqlalchemy.org/en/20/core/engines.html#backend-specific-urls
+              也可以传入已配置连接池等参数的 UserSession 实例，或 memory://、redis:// 开头的 SessionStore 配置
         
         Returns:
             None
@@ -104,9 +123,13 @@ class AgentBase(BaseModel):
         user_session_config = values.get("user_session_config")
         if "user_session_config" in values:
             values.pop("user_session_config")
+        if isinstance(user_session_config, UserSession):
+            user_session_handle = user_session_config
+        else:
+            user_session_handle = UserSession(user_session_config)
         values.update({
             "component": values.get("component"),
-            "user_session_handle": UserSession(user_session_config),
+            "user_session_handle": user_session_handle,
         })
         return values
 
@@ -189,6 +212,97 @@ class AgentBase(BaseModel):
         else:
             self._save_user_session(session_id, message, answer)
             return answer
+
+    async def achat(self, message: Message, session_id: str, stream: bool = False, **args) -> Message:
+        """
+        chat 的异步版本，调用 component.arun，Session 读写在线程池中执行，不阻塞事件循环。
+        stream 为 True 时返回的 content 为异步迭代器。
+
+        Args:
+            message (Message): 该次对话用户输入的 Message
+            session_id (str): Session ID
+            stream (bool): 是否流式请求
+            **args: 其他参数，会被透传到 component
+
+        Returns:
+            Message
+        """
+        loop = asyncio.get_running_loop()
+        user_session = await loop.run_in_executor(None, self._get_user_session, session_id, 10)
+        params = inspect.signature(self.component.arun).parameters
+        if "user_session" in params:
+            answer = await self.component.arun(message=message, user_session=user_session, stream=stream, **args)
+        else:
+            answer = await self.component.arun(message=message, stream=stream, **args)
+        if stream:
+            async def iterator(iters):
+                concat_answer = ""
+                if hasattr(iters, "__aiter__"):
+                    async for it in iters:
+                        concat_answer += it
+                        yield it
+                else:
+                    # component without native async stream, read the sync iterator in thread pool
+                    iters = iter(iters)
+                    while True:
+                        it = await loop.run_in_executor(None, next, iters, StopIteration)
+                        if it is StopIteration:
+                            break
+                        concat_answer += it
+                        yield it
+                await loop.run_in_executor(
+                    None, self._save_user_session, session_id, message, Message(concat_answer))
+            return Message(iterator(answer.content))
+        else:
+            await loop.run_in_executor(None, self._save_user_session, session_id, message, answer)
+            return answer
+
+    def _parse_chat_request(self, data: Any):
+        """
+        解析 /chat 请求体
+
+        Args:
+            data (dict): 请求 json
+
+        Returns:
+            tuple: (message, session_id, stream, 透传给 component 的其他参数)
+
+        Raises:
+            ValueError: 请求参数不合法
+        """
+        if not isinstance(data, dict) or "message" not in data:
+            raise ValueError("message is required")
+        data = dict(data)
+        message = Message(data.pop('message'))
+        session_id = data.pop("session_id", None)
+        if session_id is None:
+            session_id = self._generate_session_id()
+        elif not isinstance(session_id, str):
+            raise ValueError("session_id must be str type")
+        stream = data.pop("stream", False)
+        if not isinstance(stream, bool):
+            raise ValueError("stream must be bool type")
+        return message, session_id, stream, data
+
+    @staticmethod
+    def _chat_result(session_id: str, answer: Message) -> Dict:
+        """
+        /chat 接口的返回结构，流式请求时每个 SSE 事件为该结构的 json
+        """
+        return {
+            "code": 0, "message": "",
+            "result": {
+                "session_id": session_id,
+                "answer_message": json.loads(answer.json(exclude_none=True)),
+            }
+        }
+
+    @staticmethod
+    def _sse_event(data: Dict) -> str:
+        """
+        生成一个 SSE 事件
+        """
+        return "data: " + json.dumps(data, ensure_ascii=False) + "\n\n"
         
     def serve(self, host='0.0.0.0', debug=True, port=8092):
         """
@@ -222,22 +336,10 @@ class AgentBase(BaseModel):
 
         @app.route('/chat', methods=['POST'])
         def warp():
-            data = request.get_json()
-            if "message" not in data:
-                raise BadRequest("message is required")
-            message = Message(data.pop('message'))
-            if "session_id" not in data:
-                session_id = self._generate_session_id()
-            else:
-                session_id = data.pop("session_id")
-                if not isinstance(session_id, str):
-                    raise BadRequest("session_id must be str type")
-            if "stream" not in data:
-                stream = False
-            else:
-                stream = data.pop("stream")
-                if not isinstance(stream, bool):
-                    raise BadRequest("stream must be bool type")
+            try:
+                message, session_id, stream, data = self._parse_chat_request(request.get_json())
+            except ValueError as e:
+                raise BadRequest(str(e))
 
             try:
                 answer = self.chat(message, session_id, stream, **data)
@@ -245,32 +347,162 @@ class AgentBase(BaseModel):
                     def gen_sse_resp(stream_message):
                         with app.app_context():
                             for it in stream_message.content:
-                                d = {
-                                    "code": 0, "message": "",
-                                    "result": {
-                                        "session_id": session_id, 
-                                        "answer_message": json.loads(Message(it).json(exclude_none=True)),
-                                    }
-                                }
-                                yield "data: " + json.dumps(d, ensure_ascii=False) + "\n\n"
+                                yield self._sse_event(self._chat_result(session_id, Message(it)))
                     return Response(
                         gen_sse_resp(answer), 200, 
                         {'Content-Type': 'text/event-stream; charset=utf-8'},
                     )
                 else:
-                    return {
-                        "code": 0, "message": "",
-                        "result": {
-                            "session_id": session_id,
-                            "answer_message": json.loads(answer.json(exclude_none=True)),
-                        }
-                    }
+                    return self._chat_result(session_id, answer)
             except Exception as e:
                 logging.error(e, exc_info=True)
                 raise RuntimeError(e)
             
         app.run(host=host, debug=debug, port=port)
         
+    def create_async_app(self, max_concurrency: int = 64, timeout: Optional[float] = 300):
+        """
+        创建提供 /chat 接口的 aiohttp 应用，接口参数、返回结构与 SSE 格式与 serve 相同。
+        也可以交给 gunicorn 等进程管理器运行: gunicorn app:app --worker-class aiohttp.GunicornWebWorker
+
+        Args:
+            max_concurrency (int): 单个进程同时处理的最大请求数，超出的请求排队等待
+            timeout (float|None): 单个请求的最长处理时间(秒)，流式请求包含整个生成过程，None 表示不限制
+
+        Returns:
+            aiohttp.web.Application
+        """
+        try:
+            from aiohttp import web
+        except ImportError:
+            raise ImportError("aiohttp module is not installed. Please install it using 'pip install "
+                              "aiohttp~=3.9'.")
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be greater than 0, but got {}".format(max_concurrency))
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+        timeout_result = {"code": 504, "message": "Request timeout", "result": None}
+
+        async def chat(request):
+            try:
+                message, session_id, stream, data = self._parse_chat_request(await request.json())
+            except ValueError:
+                return web.json_response(
+                    {"code": 400, "message": 'Bad request, Please check your data.', "result": None}, status=400)
+
+            async with semaphore:
+                deadline = time.monotonic() + timeout if timeout is not None else None
+
+                def remaining():
+                    return max(deadline - time.monotonic(), 0) if deadline is not None else None
+
+                try:
+                    answer = await asyncio.wait_for(self.achat(message, session_id, stream, **data), remaining())
+                    if not stream:
+                        return web.json_response(self._chat_result(session_id, answer),
+                                                 dumps=lambda d: json.dumps(d, ensure_ascii=False))
+                except asyncio.TimeoutError:
+                    return web.json_response(timeout_result, status=504)
+                except Exception as e:
+                    logging.error(e, exc_info=True)
+                    return web.json_response({"code": 1000, "message": f'RuntimeError: {e}', "result": None})
+
+                response = web.StreamResponse(
+                    status=200, headers={'Content-Type': 'text/event-stream; charset=utf-8'})
+                await response.prepare(request)
+                iterator = answer.content.__aiter__()
+                try:
+                    while True:
+                        try:
+                            it = await asyncio.wait_for(iterator.__anext__(), remaining())
+                        except StopAsyncIteration:
+                            break
+                        event = self._sse_event(self._chat_result(session_id, Message(it)))
+                        await response.write(event.encode("utf-8"))
+                except asyncio.TimeoutError:
+                    await response.write(self._sse_event(timeout_result).encode("utf-8"))
+                except ConnectionResetError:
+                    # client went away, stop generating
+                    raise
+                except Exception as e:
+                    logging.error(e, exc_info=True)
+                    error = {"code": 1000, "message": f'RuntimeError: {e}', "result": None}
+                    await response.write(self._sse_event(error).encode("utf-8"))
+                finally:
+                    await iterator.aclose()
+                await response.write_eof()
+                return response
+
+        app = web.Application()
+        app.router.add_post('/chat', chat)
+        return app
+
+    def serve_async(self, host='0.0.0.0', port=8092, workers: int = 1, max_concurrency: int = 64,
+                    timeout: Optional[float] = 300, graceful_timeout: float = 30):
+        """
+        以生产模式服务化 component，基于 aiohttp 异步处理请求，流式响应不占用线程，
+        接口与 serve 相同。收到 SIGINT/SIGTERM 后停止接收新连接，等待处理中的请求结束后退出。
+
+        Args:
+            host (str): 服务 host
+            port (int): 服务 port
+            workers (int): 进程数，多个进程共享同一个监听端口，大于 1 时仅支持可以 fork 的系统
+            max_concurrency (int): 每个进程同时处理的最大请求数
+            timeout (float|None): 单个请求的最长处理时间(秒)，None 表示不限制
+            graceful_timeout (float): 退出时等待处理中请求的最长时间(秒)
+
+        Returns:
+            None
+        """
+        try:
+            from aiohttp import web
+        except ImportError:
+            raise ImportError("aiohttp module is not installed. Please install it using 'pip install "
+                              "aiohttp~=3.9'.")
+        if workers < 1:
+            raise ValueError("workers must be greater than 0, but got {}".format(workers))
+
+        sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host, port))
+        sock.listen(1024)
+        sock.set_inheritable(True)
+
+        def run_worker(forked=False):
+            if forked:
+                # database connections opened by the parent must not be shared with worker processes
+                if self.user_session_handle.engine is not None:
+                    self.user_session_handle.engine.dispose(close=False)
+            web.run_app(self.create_async_app(max_concurrency, timeout), sock=sock,
+                        shutdown_timeout=graceful_timeout, print=None)
+
+        if workers == 1:
+            logging.info("serving on http://%s:%s", host, port)
+            run_worker()
+            return
+
+        # pre-fork: all workers accept on the listening socket created above
+        import multiprocessing
+        context = multiprocessing.get_context("fork")
+        processes = [context.Process(target=run_worker, args=(True,), daemon=False) for _ in range(workers)]
+        for process in processes:
+            process.start()
+        sock.close()
+        logging.info("serving on http://%s:%s with %d workers", host, port, workers)
+
+        def stop(signum, frame):
+            for process in processes:
+                if process.is_alive():
+                    os.kill(process.pid, signal.SIGTERM)
+
+        previous = {sig: signal.signal(sig, stop) for sig in (signal.SIGINT, signal.SIGTERM)}
+        try:
+            for process in processes:
+                process.join()
+        finally:
+            for sig, handler in previous.items():
+                signal.signal(sig, handler)
+
     def chainlit_demo(self, host='0.0.0.0', port=8091):
         """
         将 component 服务化，提供 chainlit demo 页面
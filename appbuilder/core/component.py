@@ -16,17 +16,23 @@
 base class for customized Component class, define interface method like run() batch() etc.
 subclass may choose to implement, also  provide some simple helper method for interact with backend server."""
 
+import asyncio
+import functools
 import os
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 
 import requests
 from pydantic import BaseModel
-from requests.adapters import HTTPAdapter, Retry
-from typing import Dict, List, Optional, Any
+from requests.adapters import Retry
+from typing import Dict, List, Optional, Any, Union
 
 from appbuilder.core._exception import *
 from appbuilder.core.message import Message
 from appbuilder.core.constants import GATEWAY_URL
+from appbuilder.core.transport import SharedHTTPAdapter, async_request
+from appbuilder.core.utils import RateLimiter
+from appbuilder.utils.logger_util import logger
 
 
 class ComponentArguments(BaseModel):
@@ -57,6 +63,7 @@ class ComponentArguments(BaseModel):
 
 class Component:
     r"""Component基类, 其它实现的Component子类需要继承该基类，并至少实现run方法."""
+    rate_limiter: Optional[RateLimiter] = None
 
     def __init__(self,
                  meta: Optional[ComponentArguments] = ComponentArguments(),
@@ -87,7 +94,8 @@ class Component:
             self.gateway = "https://" + self.gateway
         self.s = requests.sessions.Session()
         self.retry = Retry(total=0, backoff_factor=0.1)
-        self.s.mount(self.gateway, HTTPAdapter(max_retries=self.retry))
+        # connections to the gateway are drawn from the process wide pool, see appbuilder.core.transport
+        self.s.mount(self.gateway, SharedHTTPAdapter(self.gateway, max_retries=self.retry))
 
     def __call__(self, *inputs, **kwargs):
         r"""implement __call__ method"""
@@ -104,17 +112,97 @@ class Component:
         """
         raise NotImplementedError
 
-    def batch(self, *args, **kwargs) -> List[Message]:
-        r"""pass"""
-        return None
+    def set_rate_limit(self, rate: Optional[float], burst: Optional[int] = None):
+        r"""设置组件的调用频率上限，batch与abatch中的每次调用都会先获取令牌。
+
+            参数:
+                rate(float): 每秒允许的调用次数，为None时取消限制。
+                burst(int, 可选): 允许瞬时并发的调用次数，默认为max(1, rate)。
+            返回：
+                无
+        """
+        self.rate_limiter = RateLimiter(rate, burst) if rate is not None else None
+
+    def batch(self, messages: List[Message], max_concurrency: int = 4, **kwargs) -> List[Union[Message, Exception]]:
+        r"""
+        在线程池中并发执行run，按输入顺序返回结果。
+        单条输入执行失败不会中断整个batch，对应位置返回该异常，调用方可通过isinstance(result, Exception)判断。
+
+        Parameters:
+            messages(List[Message]): 输入消息列表，每个消息调用一次run
+            max_concurrency(int): 最大并发数，默认为4
+            **kwargs(dict): 透传给run的参数
+        """
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be greater than 0, but got {}".format(max_concurrency))
+        if not messages:
+            return []
+
+        def _run(index_message):
+            index, message = index_message
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            try:
+                return self.run(message, **kwargs)
+            except Exception as e:
+                logger.warning("{} batch item {} failed: {!r}".format(self.__class__.__name__, index, e))
+                return e
+
+        with ThreadPoolExecutor(max_workers=min(max_concurrency, len(messages))) as executor:
+            return list(executor.map(_run, enumerate(messages)))
 
     async def arun(self, *args, **kwargs) -> Optional[Message]:
-        r"""pass"""
-        return None
+        r"""
+        run的异步版本，参数与run相同。
+        默认在线程池中执行run，支持原生异步请求的子类会重写该方法，不占用线程。
 
-    async def abatch(self, *args, **kwargs) -> List[Message]:
-        r"""pass"""
-        return None
+        Parameters:
+            *inputs(tuple): unpacked tuple arguments
+            **kwargs(dict): unpacked dict arguments
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(self.run, *args, **kwargs))
+
+    async def abatch(self, messages: List[Message], max_concurrency: Optional[int] = None,
+                     **kwargs) -> List[Union[Message, Exception]]:
+        r"""
+        并发执行arun，按输入顺序返回结果，单条失败时对应位置返回该异常，同batch。
+
+        Parameters:
+            messages(List[Message]): 输入消息列表，每个消息调用一次arun
+            max_concurrency(int, 可选): 最大并发数，默认不限制
+            **kwargs(dict): 透传给arun的参数
+        """
+        if max_concurrency is not None and max_concurrency < 1:
+            raise ValueError("max_concurrency must be greater than 0, but got {}".format(max_concurrency))
+        semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+
+        async def _arun(index, message):
+            if semaphore is not None:
+                await semaphore.acquire()
+            try:
+                if self.rate_limiter is not None:
+                    await self.rate_limiter.aacquire()
+                return await self.arun(message, **kwargs)
+            except Exception as e:
+                logger.warning("{} abatch item {} failed: {!r}".format(self.__class__.__name__, index, e))
+                return e
+            finally:
+                if semaphore is not None:
+                    semaphore.release()
+
+        return list(await asyncio.gather(*[_arun(index, message) for index, message in enumerate(messages)]))
+
+    async def _apost(self, url: str, timeout: float = None, retry: int = 0, stream: bool = False, **kwargs):
+        r"""_apost is the asyncio counterpart of self.s.post, connections come from the shared async pool.
+            :param url: request url.
+            :param timeout: HTTP timeout.
+            :param retry: retry times on connection error.
+            :param stream: if True return the unread aiohttp response, the caller must release it.
+            :rtype: requests.Response.
+        """
+        return await async_request(self.gateway, "POST", url, timeout=timeout, retry=retry, stream=stream,
+                                   **kwargs)
 
     def _trace(self, **data) -> None:
         r"""pass"""
@@ -143,6 +231,8 @@ class Component:
             raise NotFoundException(message)
         elif status_code == requests.codes.precondition_required:
             raise PreconditionFailedException(message)
+        elif status_code == requests.codes.too_many_requests:
+            raise TooManyRequestsException(message)
         elif status_code == requests.codes.internal_server_error:
             raise InternalServerErrorException(message)
         else:
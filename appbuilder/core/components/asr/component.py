@@ -56,6 +56,26 @@ class ASR(Component):
         返回:
             obj:`Message`: 短语音识别结果。举例: Message(content={"result": ["北京科技馆。"]})。
         """
+        request = self._gene_request(message, audio_format, rate)
+        response = self._recognize(request, timeout, retry)
+        out = ASROutMsg(result=list(response.result))
+        return Message(content=dict(out))
+
+    async def arun(self, message: Message, audio_format: str = "pcm", rate: int = 16000,
+                   timeout: float = None, retry: int = 0) -> Message:
+        """
+        run 的异步版本，参数与返回值同 run。
+        """
+        request = self._gene_request(message, audio_format, rate)
+        response = await self._arecognize(request, timeout, retry)
+        out = ASROutMsg(result=list(response.result))
+        return Message(content=dict(out))
+
+    @staticmethod
+    def _gene_request(message: Message, audio_format: str, rate: int) -> ShortSpeechRecognitionRequest:
+        """
+        根据输入消息生成短语音识别请求。
+        """
         inp = ASRInMsg(**message.content)
         request = ShortSpeechRecognitionRequest()
         request.format = audio_format
@@ -63,9 +83,7 @@ class ASR(Component):
         request.cuid = str(uuid.uuid4())
         request.dev_pid = "80001"
         request.speech = inp.raw_audio
-        response = self._recognize(request)
-        out = ASROutMsg(result=list(response.result))
-        return Message(content=dict(out))
+        return request
 
     def _recognize(self, request: ShortSpeechRecognitionRequest, timeout: float = None,
                     retry: int = 0) -> ShortSpeechRecognitionResponse:
@@ -80,6 +98,26 @@ class ASR(Component):
         返回:
             obj:`ShortSpeechRecognitionResponse`: 接口返回的输出消息。
         """
+        headers, params = self._recognize_params(request)
+        if retry != self.retry.total:
+            self.retry.total = retry
+        response = self.s.post(self.service_url("/v1/bce/aip_speech/asrpro"), params=params, headers=headers, data=request.speech, timeout=timeout)
+        return self._parse_response(response)
+
+    async def _arecognize(self, request: ShortSpeechRecognitionRequest, timeout: float = None,
+                          retry: int = 0) -> ShortSpeechRecognitionResponse:
+        """
+        _recognize 的异步版本。
+        """
+        headers, params = self._recognize_params(request)
+        response = await self._apost(self.service_url("/v1/bce/aip_speech/asrpro"), params=params, headers=headers,
+                                     data=request.speech, timeout=timeout, retry=retry)
+        return self._parse_response(response)
+
+    def _recognize_params(self, request: ShortSpeechRecognitionRequest):
+        """
+        返回请求的header和query参数。
+        """
         ContentType = "audio/" + request.format + ";rate=" + str(request.rate)
         headers = self.auth_header()
         headers['content-type'] = ContentType
@@ -87,9 +125,12 @@ class ASR(Component):
             'dev_pid': request.dev_pid,
             'cuid': request.cuid
         }
-        if retry != self.retry.total:
-            self.retry.total = retry
-        response = self.s.post(self.service_url("/v1/bce/aip_speech/asrpro"), params=params, headers=headers, data=request.speech, timeout=timeout)
+        return headers, params
+
+    def _parse_response(self, response) -> ShortSpeechRecognitionResponse:
+        """
+        检查并解析接口返回。
+        """
         super().check_response_header(response)
         data = response.json()
         super().check_response_json(data)
@@ -54,6 +54,27 @@ class DishRecognition(Component):
             Message: 包含菜品识别结果的输出消息。
                 例如，Message(content={'result': [{'name': '剁椒鱼头', 'calorie': '127'}]})
 
+        """
+        req = self._gene_request(message)
+        result = self._recognize(req, timeout=timeout, retry=retry)
+        result_dict = proto.Message.to_dict(result)
+        out = DishRecognitionOutMsg(**result_dict)
+        return Message(content=out.dict())
+
+    async def arun(self, message: Message, timeout: float = None, retry: int = 0) -> Message:
+        """
+        run 的异步版本，参数与返回值同 run。
+        """
+        req = self._gene_request(message)
+        result = await self._arecognize(req, timeout=timeout, retry=retry)
+        result_dict = proto.Message.to_dict(result)
+        out = DishRecognitionOutMsg(**result_dict)
+        return Message(content=out.dict())
+
+    @staticmethod
+    def _gene_request(message: Message) -> DishRecognitionRequest:
+        """
+        根据输入消息生成菜品识别请求。
         """
         inp = DishRecognitionInMsg(**message.content)
         req = DishRecognitionRequest()
@@ -61,10 +82,7 @@ class DishRecognition(Component):
             req.image = base64.b64encode(inp.raw_image)
         if inp.url:
             req.url = inp.url
-        result = self._recognize(req, timeout=timeout, retry=retry)
-        result_dict = proto.Message.to_dict(result)
-        out = DishRecognitionOutMsg(**result_dict)
-        return Message(content=out.dict())
+        return req
 
     def _recognize(self, request: DishRecognitionRequest, timeout: float = None,
                    retry: int = 0) -> DishRecognitionResponse:
@@ -76,6 +94,25 @@ class DishRecognition(Component):
         :param retry: 请求失败时的重试次数，默认为 0。
         :return: 包含食物识别结果的响应对象。
         """
+        url, headers, request_data = self._recognize_params(request)
+        if retry != self.retry.total:
+            self.retry.total = retry
+        response = self.s.post(url, headers=headers, data=request_data, timeout=timeout)
+        return self._parse_response(response)
+
+    async def _arecognize(self, request: DishRecognitionRequest, timeout: float = None,
+                          retry: int = 0) -> DishRecognitionResponse:
+        """
+        _recognize 的异步版本。
+        """
+        url, headers, request_data = self._recognize_params(request)
+        response = await self._apost(url, headers=headers, data=request_data, timeout=timeout, retry=retry)
+        return self._parse_response(response)
+
+    def _recognize_params(self, request: DishRecognitionRequest):
+        """
+        校验请求并补充默认值，返回请求的url、header和body。
+        """
         if not request.image and not request.url:
             raise ValueError("one of image or url must be set")
         if not request.top_num:
@@ -83,14 +120,15 @@ class DishRecognition(Component):
         if not request.filter_threshold:
             request.filter_threshold = 0.95
         request_data = DishRecognitionRequest.to_dict(request)
-        if retry != self.retry.total:
-            self.retry.total = retry
         headers = self.auth_header()
         headers['content-type'] = 'application/x-www-form-urlencoded'
-
         url = self.service_url("/v1/bce/aip/image-classify/v2/dish")
-        response = self.s.post(url, headers=headers, data=request_data, timeout=timeout)
+        return url, headers, request_data
 
+    def _parse_response(self, response) -> DishRecognitionResponse:
+        """
+        检查并解析接口返回。
+        """
         self.check_response_header(response)
         data = response.json()
         self.check_response_json(data)
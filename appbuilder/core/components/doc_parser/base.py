@@ -77,6 +77,86 @@ class PageContent(BaseModel):
     tables: Optional[List[Table]] = []
 
 
+class LazyModelList(list):
+    """
+    延迟校验的列表，元素为 dict 时在首次通过下标或迭代访问时才转换为 model，转换结果替换原元素；
+    pop、index、count、in、==、排序与拼接等读取元素的操作同样返回或比较转换后的 model
+    """
+
+    def __init__(self, items=(), model=None):
+        super().__init__(items)
+        self.model = model
+
+    def _validate(self, index):
+        item = list.__getitem__(self, index)
+        if self.model is not None and isinstance(item, dict):
+            item = self.model.parse_obj(item)
+            list.__setitem__(self, index, item)
+        return item
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._validate(i) for i in range(*index.indices(len(self)))]
+        return self._validate(index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._validate(i)
+
+    def __reversed__(self):
+        for i in range(len(self) - 1, -1, -1):
+            yield self._validate(i)
+
+    def _validate_all(self):
+        for i in range(len(self)):
+            self._validate(i)
+
+    def pop(self, index=-1):
+        item = self._validate(index)
+        list.pop(self, index)
+        return item
+
+    def copy(self) -> "LazyModelList":
+        return LazyModelList(list.__iter__(self), self.model)
+
+    def index(self, value, *args):
+        self._validate_all()
+        return list.index(self, value, *args)
+
+    def count(self, value) -> int:
+        self._validate_all()
+        return list.count(self, value)
+
+    def sort(self, *args, **kwargs):
+        self._validate_all()
+        list.sort(self, *args, **kwargs)
+
+    def __contains__(self, value) -> bool:
+        return any(item is value or item == value for item in self)
+
+    def __eq__(self, other):
+        self._validate_all()
+        if isinstance(other, LazyModelList):
+            other._validate_all()
+        return list.__eq__(self, other)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        return list(other) + list(self)
+
+    def __mul__(self, n):
+        return list(self) * n
+
+    __rmul__ = __mul__
+    __hash__ = None
+
+
 class ParseResult(BaseModel):
     """
     解析结果整体结构
@@ -86,6 +166,17 @@ class ParseResult(BaseModel):
     pdf_data: Optional[str] = ""
     raw: Optional[Dict] = {}
 
+    @classmethod
+    def lazy_parse_obj(cls, obj: Dict) -> "ParseResult":
+        """
+        不做整体校验构造 ParseResult，para_node_tree 与 page_contents 的元素在首次访问时才校验
+        """
+        return cls.construct(
+            para_node_tree=LazyModelList(obj.get("para_node_tree") or [], ParaNode),
+            page_contents=LazyModelList(obj.get("page_contents") or [], PageContent),
+            pdf_data=obj.get("pdf_data") or "",
+            raw=obj.get("raw") or {})
+
 
 class ParserConfig(BaseModel):
     """
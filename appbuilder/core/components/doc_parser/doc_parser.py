@@ -18,15 +18,94 @@
 文档解析
 """
 import os
+import re
 import json
+import mmap
 import base64
-from typing import Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, BinaryIO, List, Optional
 from appbuilder.core._exception import AppBuilderServerException
 from appbuilder.core.component import Component, Message
 from appbuilder.utils.logger_util import logger
 from appbuilder.core.components.doc_parser.base import ParserConfig, ParseResult
 
 
+class _Base64JSONBody(object):
+    """
+    以 JSON 字符串形式流式发送文件的 base64 编码，不在内存中保留完整的请求体。
+
+    请求体为 prefix + base64(file) + suffix，长度预先计算，requests 据此设置 Content-Length；
+    支持 tell/seek(0)，连接失败重试时从头重新发送。
+    """
+    # 3 的倍数，分块编码的结果可以直接拼接
+    raw_chunk_size = 3 * 256 * 1024
+
+    def __init__(self, prefix: bytes, file: BinaryIO, suffix: bytes):
+        self.prefix = prefix
+        self.suffix = suffix
+        self.file = file
+        self.start = file.tell()
+        # mmap.seek returns None, read the position by tell
+        file.seek(0, os.SEEK_END)
+        size = file.tell() - self.start
+        file.seek(self.start)
+        self.length = len(prefix) + (size + 2) // 3 * 4 + len(suffix)
+        self.seek(0)
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(64 * 1024)
+            if not chunk:
+                return
+            yield chunk
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if offset != 0 or whence != os.SEEK_SET:
+            raise ValueError("request body can only be rewound to the start")
+        self.file.seek(self.start)
+        self.position = 0
+        self.buffer = memoryview(self.prefix)
+        self.file_done = False
+        self.suffix_done = False
+        return 0
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = self.length
+        out = []
+        wanted = size
+        while wanted > 0:
+            if not self.buffer:
+                if not self._refill():
+                    break
+            chunk = self.buffer[:wanted]
+            self.buffer = self.buffer[len(chunk):]
+            out.append(chunk)
+            wanted -= len(chunk)
+        data = b"".join(out)
+        self.position += len(data)
+        return data
+
+    def _refill(self) -> bool:
+        if not self.file_done:
+            raw = self.file.read(self.raw_chunk_size)
+            if raw:
+                self.buffer = memoryview(base64.b64encode(raw))
+                return True
+            self.file_done = True
+        if not self.suffix_done:
+            self.suffix_done = True
+            self.buffer = memoryview(self.suffix)
+            return True
+        return False
+
+
 class DocParser(Component):
     """
     文档解析组件，用于对文档的内容进行解析。
@@ -57,12 +136,12 @@ class DocParser(Component):
 
     def make_parse_result(self, response: Dict):
         """
-        将解析结果的内容转化成ParseResult的结构
+        将解析结果的内容转化成ParseResult的结构，耗时与版面元素数量成线性关系
         """
         para_nodes = response["para_nodes"] if response["para_nodes"] is not None else []
         catalog = response["catalog"] if response["catalog"] is not None else []
         pdf_data = response["pdf_data"]
-        title_node_ids = [title["node_id"] for title in catalog] if catalog else []
+        title_node_ids = {title["node_id"] for title in catalog} if catalog else set()
         page_contents = []
         for content in response["file_content"]:
             page_content = {"page_num": content["page_num"], "page_width": content["page_size"]["width"],
@@ -76,61 +155,250 @@ class DocParser(Component):
                     page_content["page_tables"].append(layout_item)
                     if para_nodes:
                         para_nodes[layout_item["node_id"]]["table"] = layout_item
-                        table_row = []
-                        for i in range(len(layout_item["matrix"])):
-                            cell_index = layout_item["matrix"][i]
-                            row_markdown = "|" + "|".join(
-                                [layout_item["children"][index]["text"] for index in set(cell_index)]) + "|"
-                            if i != len(layout_item["matrix"]) - 1:
-                                row_markdown += "\n"
-                            table_row.append(row_markdown)
-                        para_nodes[layout_item["node_id"]]["text"] = "".join(table_row)
+                        para_nodes[layout_item["node_id"]]["text"] = _table_markdown(layout_item)
                 else:
                     page_content["page_layouts"].append(layout_item)
             page_contents.append(page_content)
 
+        # 设置 page_filter 时页码不从 0 开始，按页码查找所在页
+        page_index = {page_content["page_num"]: i for i, page_content in enumerate(page_contents)}
         for title in catalog:
             page_num = title["position"][0]["pageno"]
-            page_contents[page_num]["page_titles"].append(
+            page_contents[page_index.get(page_num, page_num)]["page_titles"].append(
                 {"text": title["text"], "type": title["level"], "box": title["position"][0]["box"],
                  "node_id": title["node_id"]})
         parse_result = {"para_node_tree": para_nodes, "page_contents": page_contents, "pdf_data": pdf_data}
         # parse_result = ParseResult.parse_obj(parse_result)
         return parse_result
 
-    def run(self, input_message: Message, return_raw=False) -> Message:
+    def run(self, input_message: Message, return_raw=False, pages_per_shard: Optional[int] = None,
+            max_workers: int = 4, page_count: Optional[int] = None, lazy: bool = False) -> Message:
         """
-        对传入的文件进行解析
+        对传入的文件进行解析，文件内容分块编码后流式上传，不会一次性读入内存
         参数:
-            input_message (Message[str]): 输入为文件的路径
+            input_message (Message[str|BinaryIO]): 输入为文件的路径，或可 seek 的二进制文件对象(如 mmap)
             return_raw (bool): 是否返回云端服务的原始结果
+            pages_per_shard (int|None): 按页分片并发解析，每个分片的页数，None 表示整个文档一次解析。
+                仅支持文件路径输入；页码范围为 config.page_filter，未设置时为 PDF 的全部页
+            max_workers (int): 分片解析的最大并发数
+            page_count (int|None): 文档总页数，未设置时从 PDF 文件中统计，无法统计时整个文档一次解析
+            lazy (bool): 是否延迟校验，为 True 时 para_node_tree 与 page_contents 中的元素在首次访问时才转换为
+                pydantic 对象，适合只使用部分内容或直接使用 raw 的大文档
         返回:
             parse_result (Message[ParseResult]): 文件的解析结果。
         """
-        file_path = input_message.content
+        file = input_message.content
 
-        if not isinstance(file_path, str):
+        if pages_per_shard is not None:
+            if pages_per_shard < 1 or max_workers < 1:
+                raise ValueError("pages_per_shard and max_workers must be greater than 0")
+            if not isinstance(file, str):
+                raise ValueError("pages_per_shard requires a file path")
+            return self._parse_shards(file, return_raw, pages_per_shard, max_workers, page_count, lazy)
+        if isinstance(file, str):
+            with open(file, "rb") as f:
+                response = self._request(f, os.path.basename(file))
+        elif hasattr(file, "read") and hasattr(file, "seek"):
+            name = os.path.basename(getattr(file, "name", "") or "") or "file"
+            response = self._request(file, name)
+        else:
             raise ValueError("file_path should be str type")
+        parse_result = self.make_parse_result(response["result"]["result_list"][0])
+        if return_raw:
+            parse_result["raw"] = response
+        return Message(self._to_parse_result(parse_result, lazy))
+
+    @staticmethod
+    def _to_parse_result(parse_result: Dict, lazy: bool) -> ParseResult:
+        if lazy:
+            return ParseResult.lazy_parse_obj(parse_result)
+        return ParseResult.parse_obj(parse_result)
+
+    def _parse_shards(self, file_path: str, return_raw: bool, pages_per_shard: int, max_workers: int,
+                      page_count: Optional[int], lazy: bool) -> Message:
+        pages = self.config.page_filter
+        if not pages:
+            page_count = page_count if page_count is not None else count_pdf_pages(file_path)
+            if not page_count:
+                logger.warning("can not count pages of {}, parse it in one request".format(file_path))
+                return self.run(Message(file_path), return_raw=return_raw, lazy=lazy)
+            pages = list(range(page_count))
+        shards = [pages[i:i + pages_per_shard] for i in range(0, len(pages), pages_per_shard)]
+        name = os.path.basename(file_path)
+        base_param = self.config.dict(by_alias=True)
+
+        def parse_shard(shard):
+            param = dict(base_param, page_filter=shard)
+            with open(file_path, "rb") as f:
+                return self._request(f, name, param)
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(shards))) as executor:
+            responses = list(executor.map(parse_shard, shards))
+        merged = self.merge_shard_results([r["result"]["result_list"][0] for r in responses], shards)
+        parse_result = self.make_parse_result(merged)
+        if return_raw:
+            parse_result["raw"] = {"shards": responses}
+        return Message(self._to_parse_result(parse_result, lazy))
+
+    @staticmethod
+    def merge_shard_results(results: List[Dict], shards: List[List[int]]) -> Dict:
+        """
+        合并按页分片解析的云端结果，返回与整个文档一次解析相同结构的结果
+
+        para_nodes、file_content、catalog 按分片顺序拼接；每个分片的节点 id 加上之前分片的节点数，
+        parent、children 与版面元素的 node_id 同步调整，仍满足 para_nodes[node_id] 为对应节点。
+        分片结果的页码若为分片内的序号，转换为 shards 中对应的页码。
+        参数:
+            results (List[dict]): 各分片云端结果中的 result_list[0]
+            shards (List[List[int]]): 各分片解析的页码
+        返回:
+            dict: 合并后的结果，可直接传入 make_parse_result
+        """
+        merged = {"para_nodes": [], "catalog": [], "file_content": [], "pdf_data": ""}
+        for result, pages in zip(results, shards):
+            offset = len(merged["para_nodes"])
+            contents = result.get("file_content") or []
+            # page_filter 保留原页码时无需转换，否则页码为分片内的序号
+            local = [content["page_num"] for content in contents] != pages[:len(contents)]
+            page_map = {i: page for i, page in enumerate(pages)} if local else {}
+
+            def renumber(item):
+                item = dict(item)
+                if isinstance(item.get("node_id"), int):
+                    item["node_id"] += offset
+                if isinstance(item.get("parent"), int) and item["parent"] >= 0:
+                    item["parent"] += offset
+                if isinstance(item.get("children"), list):
+                    item["children"] = [child + offset if isinstance(child, int)
+                                        else renumber(child) if isinstance(child, dict) else child
+                                        for child in item["children"]]
+                if page_map and isinstance(item.get("position"), list):
+                    item["position"] = [dict(pos, pageno=page_map.get(pos["pageno"], pos["pageno"]))
+                                        for pos in item["position"]]
+                return item
+
+            merged["para_nodes"].extend(renumber(node) for node in result.get("para_nodes") or [])
+            merged["catalog"].extend(renumber(title) for title in result.get("catalog") or [])
+            for i, content in enumerate(contents):
+                page_content = dict(content["page_content"])
+                page_content["layout"] = [renumber(layout) for layout in page_content["layout"]]
+                merged["file_content"].append(dict(content, page_content=page_content,
+                                                   page_num=page_map.get(i, content["page_num"])))
+            merged["pdf_data"] = merged["pdf_data"] or result.get("pdf_data") or ""
+        return merged
+
+    def _request_body(self, file: BinaryIO, name: str, param: Optional[Dict] = None) -> _Base64JSONBody:
+        """
+        构造 {"file_list": [param]} 的流式请求体，data 字段为文件的 base64 编码
+        """
+        param = dict(param if param is not None else self.config.dict(by_alias=True))
+        param["name"] = name
+        # 以占位符生成 JSON，base64 字符无需转义，可直接替换为文件内容
+        placeholder = "@appbuilder-file-data@"
+        param["data"] = placeholder
+        prefix, suffix = json.dumps({"file_list": [param]}).split('"{}"'.format(placeholder))
+        return _Base64JSONBody((prefix + '"').encode(), file, ('"' + suffix).encode())
+
+    def _request(self, file: BinaryIO, name: str, param: Optional[Dict] = None) -> Dict:
+        headers = {
+            "Authorization": self.secret_key,
+            "Content-Type": "application/json"
+        }
+        response = self.s.post(url=self.service_url(self.base_url), headers=headers,
+                               data=self._request_body(file, name, param))
+        self.check_response_header(response)
+        self.check_response_json(response.json())
+        response = response.json()
+        if response["error_code"] != 0:
+            logger.error("doc parser service log_id {} err {}".format(response["log_id"], response["error_msg"]))
+            raise AppBuilderServerException(response["error_msg"])
+        return response
+
+
+def _table_markdown(table: Dict) -> str:
+    """
+    将表格转为 markdown，每行为 |cell|cell|，行之间以换行分隔；合并单元格在一行中只输出一次，保持列的顺序
+    """
+    cells = table["children"]
+    return "\n".join("|" + "|".join([cells[index]["text"] for index in dict.fromkeys(row)]) + "|"
+                     for row in table["matrix"])
+
+
+_STARTXREF = re.compile(rb"startxref\s+(\d+)")
+_XREF = re.compile(rb"\s*xref\s+")
+_XREF_SUBSECTION = re.compile(rb"(\d+)\s+(\d+)\s+")
+_XREF_ENTRY = re.compile(rb"(\d{10})\s(\d{5})\s([nf])\s*")
+_TRAILER = re.compile(rb"trailer\s*")
+
+
+def count_pdf_pages(file_path: str) -> Optional[int]:
+    """
+    统计 PDF 文件的页数，通过 mmap 从最后一个 xref 段及其 trailer 找到根 /Pages 节点并读取 /Count，不读入整个文件；
+    增量更新的文件以最新的 xref 段为准。xref 为压缩的交叉引用流、根节点位于对象流中或不是 PDF 文件时返回 None
+    """
+    with open(file_path, "rb") as f:
+        if f.read(5) != b"%PDF-":
+            return None
+        try:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                return _count_pdf_pages(m)
+        except ValueError:
+            return None
+
+
+def _count_pdf_pages(m: mmap.mmap) -> Optional[int]:
+    matches = list(_STARTXREF.finditer(m[-1024:]))
+    if not matches:
+        return None
+    xref = int(matches[-1].group(1))
+    # object number -> offset, None for freed objects, newer sections are read first
+    offsets = {}
+    root = None
+    visited = set()
+    while xref is not None and xref not in visited:
+        visited.add(xref)
+        match = _XREF.match(m, xref)
+        if match is None:
+            return None
+        pos = match.end()
+        while True:
+            subsection = _XREF_SUBSECTION.match(m, pos)
+            if subsection is None:
+                break
+            first, count = int(subsection.group(1)), int(subsection.group(2))
+            pos = subsection.end()
+            for number in range(first, first + count):
+                entry = _XREF_ENTRY.match(m, pos)
+                if entry is None:
+                    return None
+                pos = entry.end()
+                offsets.setdefault(number, int(entry.group(1)) if entry.group(3) == b"n" else None)
+        trailer = _TRAILER.match(m, pos)
+        if trailer is None:
+            return None
+        end = m.find(b"startxref", trailer.end())
+        dictionary = m[trailer.end():end if end != -1 else trailer.end() + 4096]
+        if root is None:
+            root = _pdf_reference(dictionary, b"/Root")
+        prev = re.search(rb"/Prev\s+(\d+)", dictionary)
+        xref = int(prev.group(1)) if prev else None
+    catalog = _pdf_object(m, offsets, root)
+    pages = _pdf_object(m, offsets, _pdf_reference(catalog or b"", b"/Pages"))
+    count = re.search(rb"/Count\s+(\d+)(?!\s+\d+\s+R)", pages or b"")
+    return (int(count.group(1)) or None) if count else None
+
+
+def _pdf_reference(dictionary: bytes, key: bytes) -> Optional[int]:
+    match = re.search(re.escape(key) + rb"\s+(\d+)\s+\d+\s+R", dictionary)
+    return int(match.group(1)) if match else None
+
 
-        with open(file_path, "rb") as f:
-            param = self.config.dict(by_alias=True)
-            param["data"] = base64.b64encode(f.read()).decode()
-            param["name"] = os.path.basename(file_path)
-            payload = json.dumps({"file_list": [param]})
-            headers = {
-                "Authorization": self.secret_key,
-                "Content-Type": "application/json"
-            }
-            response = self.s.post(url=self.service_url(self.base_url), headers=headers, data=payload)
-            self.check_response_header(response)
-            self.check_response_json(response.json())
-            response = response.json()
-            if response["error_code"] != 0:
-                logger.error("doc parser service log_id {} err {}".format(response["log_id"], response["error_msg"]))
-                raise AppBuilderServerException(response["error_msg"])
-            parse_result = self.make_parse_result(response["result"]["result_list"][0])
-            if return_raw:
-                parse_result["raw"] = response
-
-        parse_result = ParseResult.parse_obj(parse_result)
-        return Message(parse_result)
+def _pdf_object(m: mmap.mmap, offsets: Dict[int, Optional[int]], number: Optional[int]) -> Optional[bytes]:
+    offset = offsets.get(number)
+    if offset is None:
+        return None
+    match = re.compile(rb"\s*%d\s+\d+\s+obj" % number).match(m, offset)
+    if match is None:
+        return None
+    end = m.find(b"endobj", match.end())
+    return m[match.end():end] if end != -1 else None
@@ -0,0 +1,133 @@
+# Copyright (c) 2023 Baidu, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+# -*- coding: utf-8 -*-
+"""
+本地按块切分文档段落，与云端 ChunkSplitter 使用相同的参数
+"""
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple
+
+from appbuilder.core.components.doc_parser.base import LazyModelList, ParseResult
+
+
+def iter_chunks(paragraphs: Iterable[Tuple[int, str]],
+                max_segment_length: int = 800,
+                overlap: int = 200,
+                separators: Sequence[str] = ("。", "！", "？", ".", "!", "?", "……", "|\n"),
+                join_symbol: str = "") -> Iterator[Dict]:
+    """
+    将段落以 join_symbol 拼接后切分为不超过 max_segment_length 的块，逐块返回
+
+    每块在长度上限内优先截断在最后一个分隔符或段落结尾之后，找不到时按长度截断；相邻块首尾重叠 overlap 个字符。
+    paragraphs 可以是生成器，输入的文本足够确定一个块时即返回该块，不需要等待全部段落。
+
+    参数:
+        paragraphs: (node_id, text) 序列
+        max_segment_length: 每块的最大长度
+        overlap: 相邻块重叠的长度，需小于 max_segment_length
+        separators: 截断使用的分隔符
+        join_symbol: 段落间的连接符
+    返回:
+        Iterator[dict]: {"text": 块文本, "node_ids": 块包含的段落 node_id 列表}
+    """
+    if max_segment_length < 1:
+        raise ValueError("max_segment_length must be greater than 0, but got {}".format(max_segment_length))
+    if not 0 <= overlap < max_segment_length:
+        raise ValueError("overlap must be in [0, max_segment_length), but got {}".format(overlap))
+    separators = [separator for separator in separators if separator]
+
+    buf = ""
+    # 缓冲区中各段落的起始位置与 node_id，以及段落结尾的位置
+    starts: List[int] = []
+    node_ids: List[int] = []
+    ends: List[int] = []
+    pos = 0
+    last_cut = 0
+    emitted = False
+
+    def chunk(begin, end):
+        first = max(bisect_right(starts, begin) - 1, 0)
+        last = bisect_left(starts, end)
+        return {"text": buf[begin:end], "node_ids": node_ids[first:last]}
+
+    def cut_point(begin):
+        window_end = begin + max_segment_length
+        cut = 0
+        for separator in separators:
+            index = buf.rfind(separator, begin, window_end)
+            if index >= 0:
+                cut = max(cut, index + len(separator))
+        index = bisect_right(ends, window_end) - 1
+        if index >= 0:
+            cut = max(cut, ends[index])
+        # 截断点太靠前时下一块无法前进，按长度截断
+        return cut if cut > begin + overlap else window_end
+
+    for node_id, text in paragraphs:
+        if not text:
+            continue
+        if starts:
+            buf += join_symbol
+        starts.append(len(buf))
+        node_ids.append(node_id)
+        buf += text
+        ends.append(len(buf))
+
+        while len(buf) - pos > max_segment_length:
+            last_cut = cut_point(pos)
+            yield chunk(pos, last_cut)
+            emitted = True
+            pos = last_cut - overlap
+        if pos > max_segment_length:
+            # 丢弃已输出的部分，缓冲区长度不超过最后一个段落加上一块的长度
+            keep = max(bisect_right(starts, pos) - 1, 0)
+            buf = buf[pos:]
+            starts = [start - pos for start in starts[keep:]]
+            node_ids = node_ids[keep:]
+            ends = [end - pos for end in ends if end > pos]
+            last_cut -= pos
+            pos = 0
+
+    if len(buf) > pos and (not emitted or len(buf) > last_cut):
+        yield chunk(pos, len(buf))
+
+
+def iter_parse_result_paragraphs(parse_result: ParseResult) -> Iterator[Tuple[int, str]]:
+    """
+    返回解析结果中用于切分的段落 (node_id, text)，跳过根节点与页眉页脚；
+    未返回 para_node_tree 时使用各页的版面元素
+    """
+    tree = parse_result.para_node_tree or []
+    if tree:
+        # 延迟校验的结果直接读取原始数据，不转换为 ParaNode
+        items = list.__iter__(tree) if isinstance(tree, LazyModelList) else iter(tree)
+        next(items, None)
+        for item in items:
+            if isinstance(item, dict):
+                para_type, node_id, text = item["para_type"], item["node_id"], item["text"]
+            else:
+                para_type, node_id, text = item.para_type, item.node_id, item.text
+            if para_type != "head_tail":
+                yield node_id, text
+        return
+    pages = parse_result.page_contents or []
+    for page in (list.__iter__(pages) if isinstance(pages, LazyModelList) else pages):
+        layouts = page["page_layouts"] if isinstance(page, dict) else page.page_layouts
+        for layout in layouts:
+            if isinstance(layout, dict):
+                yield layout["node_id"], layout["text"]
+            else:
+                yield layout.node_id, layout.text
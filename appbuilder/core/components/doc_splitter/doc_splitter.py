@@ -18,13 +18,14 @@
 对文档进行段落切分
 """
 import os
-from typing import Dict, Any
+from typing import Dict, Any, Iterator, List, Optional, Tuple
 
 from appbuilder.core._exception import AppBuilderServerException
 from appbuilder.core.components.doc_parser.base import ParseResult
 from appbuilder.core.component import Component, Message, ComponentArguments
 from appbuilder.utils.logger_util import logger
-from appbuilder.core.components.doc_parser.base import DocSegment
+from appbuilder.core.components.doc_parser.base import DocSegment, LazyModelList
+from appbuilder.core.components.doc_splitter.chunk_engine import iter_chunks, iter_parse_result_paragraphs
 
 
 class DocSplitter(Component):
@@ -35,7 +36,7 @@ class DocSplitter(Component):
 
     def __init__(self, splitter_type, max_segment_length=800, overlap=200,
                  separators=["。", "！", "？", ".", "!", "?", "……", "|\n"],
-                 join_symbol="", **kwargs):
+                 join_symbol="", engine="remote", **kwargs):
         """
         文档段落切分实例化
 
@@ -45,6 +46,7 @@ class DocSplitter(Component):
             overlap: 每个段落和其前后相邻块，首尾重叠两部分的长度，int型，默认200
             separators: 段落按照最大字符数切分时，字符数超限时，边界用分隔符截断，list型，默认["。", "！", "？", ".", "!", "?", "……"]
             join_symbol: 文本块拼接时，作为连接符的字符，str型，默认""
+            engine: split_by_chunk 的切分方式，str型，remote 为云端切分，local 为本地切分，默认remote
             **kwargs(any, 可选)： 关键字参数
         返回:
             无
@@ -55,15 +57,17 @@ class DocSplitter(Component):
         self.overlap = overlap
         self.separators = separators
         self.join_symbol = join_symbol
+        self.engine = engine
 
         super(DocSplitter, self). __init__(meta=self.meta, **kwargs)
 
-    def run(self, message: Message):
+    def run(self, message: Message, stream: bool = False):
         """
         对输入的解析文档结果，处理为多个段落结果
 
         参数:
             message (obj:`Message`): 上游docparser的文档解析结果
+            stream (bool): 本地按块切分时是否逐块返回，为 True 时 content 为段落的迭代器
 
         返回:
             obj:`Message`: 文档分隔后的段落结果
@@ -78,8 +82,9 @@ class DocSplitter(Component):
         if self.splitter_type == "split_by_chunk":
             xmind_output = parse_result.raw
             # 文档原始的解析结果，作为输入，按照块最大长度，分隔文档
-            chunk_splitter = ChunkSplitter(self.max_segment_length, self.overlap, self.separators, self.join_symbol)
-            result = chunk_splitter(message)
+            chunk_splitter = ChunkSplitter(self.max_segment_length, self.overlap, self.separators, self.join_symbol,
+                                           engine=self.engine, secret_key=self.secret_key, gateway=self.gateway)
+            result = chunk_splitter(message, stream=stream)
 
             return result
         elif self.splitter_type == "split_by_title":
@@ -114,7 +119,7 @@ class ChunkSplitter(Component):
 
     def __init__(self, max_segment_length=800, overlap=200,
                  separators=["。", "！", "？", ".", "!", "?", "……", "|\n"],
-                 join_symbol="", **kwargs):
+                 join_symbol="", engine="remote", **kwargs):
         """
         文档段落切分实例化
 
@@ -123,10 +128,14 @@ class ChunkSplitter(Component):
             overlap: 每个段落和其前后相邻块，首尾重叠两部分的长度，int型，默认200
             separators: 按照段落最大字符数切分超限时，边界用分隔符截断，list型，默认["。", "！", "？", ".", "!", "?", "……", "|\n"]
             join_symbol: 文本块拼接时，作为连接符的字符，str型，默认""
+            engine: 切分方式，str型，remote 将解析结果发送到云端切分，local 在本地切分，不需要 return_raw，默认remote
             **kwargs(any, 可选)： 关键字参数
         返回:
             无
         """
+        if engine not in ("remote", "local"):
+            raise ValueError("engine must be remote or local, but got {}".format(engine))
+        self.engine = engine
         self.base_url = kwargs.get(
             "base_url",
             "/rpc/2.0/cloud_hub/v1/ai_engine/copilot_engine/v1/api/doc_search_tools/xmind_paragraph_splitter")
@@ -139,15 +148,18 @@ class ChunkSplitter(Component):
 
         super(ChunkSplitter, self). __init__(meta=self.meta, **kwargs)
 
-    def run(self, message: Message):
+    def run(self, message: Message, stream: bool = False):
         """
         对输入的解析文档结果，按照最大段落块大小、结尾分隔符等，处理为多个段落结果
 
         参数:
             message (obj:`Message`): 上游docparser的文档解析结果
+            stream (bool): 本地切分时是否逐块返回，为 True 时 content 为段落的迭代器，仅 engine 为 local 时有效
 
         返回:
-            obj:`Message`: 文档分隔后的段落结果
+            obj:`Message`: 文档分隔后的段落结果，content["paragraphs"] 中每个段落的 "text" 为段落文本。
+                云端切分返回服务端的 result，段落的其它字段由服务端决定；本地切分的段落只包含 "text" 与
+                "node_ids"(段落包含的解析节点 node_id 列表)，与云端结果只保证 "text" 字段一致
 
         Examples:
 
@@ -174,6 +186,13 @@ class ChunkSplitter(Component):
         if not isinstance(paser_res, ParseResult):
             raise ValueError("message.content type must be a ParseResult")
 
+        if self.engine == "local":
+            chunks = iter_chunks(iter_parse_result_paragraphs(paser_res), self.max_segment_length, self.overlap,
+                                 self.separators, self.join_symbol)
+            if stream:
+                return Message(chunks)
+            return Message({"paragraphs": list(chunks)})
+
         headers = {
             "Authorization": self.secret_key if self.secret_key else os.getenv("APPBUILDER_TOKEN"),
             "Content-Type": "application/json"
@@ -191,6 +210,45 @@ class ChunkSplitter(Component):
         return Message(doc_chunk_splitter_res["result"])
 
 
+class _TitlePaths(object):
+    """
+    节点的标题路径，从最上层标题到该节点，沿 parent 迭代查找，不受递归深度限制
+
+    每个节点缓存 (标题, 父节点的缓存) 组成的链，路径只为查询的节点生成一次，深层节点树不会产生平方级的复制。
+    """
+
+    def __init__(self, texts: List[str], parents: List[Optional[int]]):
+        self.texts = texts
+        self.parents = parents
+        self.links: Dict[int, Tuple] = {}
+        self.paths: Dict[Optional[int], Tuple[str, ...]] = {}
+
+    def _link(self, node_id: Optional[int]) -> Optional[Tuple]:
+        chain = []
+        seen = set()
+        # node_id 为 0 (根节点) 或 None 时路径为空
+        while node_id and node_id not in self.links and node_id not in seen:
+            seen.add(node_id)
+            chain.append(node_id)
+            node_id = self.parents[node_id]
+        link = self.links.get(node_id) if node_id else None
+        for chain_id in reversed(chain):
+            link = (self.texts[chain_id], link)
+            self.links[chain_id] = link
+        return link
+
+    def get(self, node_id: Optional[int]) -> Tuple[str, ...]:
+        path = self.paths.get(node_id)
+        if path is None:
+            titles = []
+            link = self._link(node_id)
+            while link is not None:
+                titles.append(link[0])
+                link = link[1]
+            path = self.paths[node_id] = tuple(reversed(titles))
+        return path
+
+
 class TitleSplitter(Component):
     """ 文档按照标题层级切分段落
         Examples:
@@ -238,12 +296,9 @@ class TitleSplitter(Component):
         返回:
             titles: 当前节点的标题
         """
-        def inner_get_titles(nodes, parent_id, titles):
-            if parent_id:
-                titles.append(nodes[parent_id].text)
-                inner_get_titles(nodes, nodes[parent_id].parent, titles)
-        inner_get_titles(nodes, parent_id, titles)
-        return titles[::-1]
+        texts = [node.text for node in nodes]
+        parents = [node.parent for node in nodes]
+        return list(_TitlePaths(texts, parents).get(parent_id)) + titles[::-1]
 
     #  按照标题层级进行切分
     def run(self, input_message: Message) -> Message:
@@ -277,35 +332,72 @@ class TitleSplitter(Component):
             print(res_paras.content)
         """
 
+        doc_segments = []
+        paragraphs = []
+        for segment, paragraph in self.iter_segments(input_message):
+            doc_segments.append(segment)
+            paragraphs.append(paragraph)
+
+        return Message({"doc_segments": doc_segments, "paragraphs": paragraphs})
+
+    def iter_segments(self, input_message: Message) -> Iterator[Tuple[DocSegment, Dict]]:
+        """
+        逐个返回按标题层级切分的段落，结果与 run 相同
+
+        节点树只遍历一次，各节点的标题路径按节点缓存，段落内容在结束时一次拼接，耗时与节点数成线性关系。
+
+        参数:
+            input_message (obj:`Message`): 上游docparser的文档解析结果
+
+        返回:
+            Iterator[Tuple[DocSegment, dict]]: 段落及其 {"text": 段落文本, "node_id": 段落最后一个节点的序号}
+        """
         parse_result = input_message.content
         if not isinstance(parse_result, ParseResult):
             raise ValueError("message.content type must be a ParseResult")
 
-        para_node_tree = parse_result.para_node_tree
-        doc_segments = []
-        paragraphs = []
-        segment = DocSegment()
-        for i in range(1, len(para_node_tree)):
-            node = para_node_tree[i]
+        para_node_tree = parse_result.para_node_tree or []
+        # 延迟校验的结果直接读取原始数据，不转换为 ParaNode
+        items = list.__iter__(para_node_tree) if isinstance(para_node_tree, LazyModelList) else para_node_tree
+        para_types, texts, parents = [], [], []
+        for item in items:
+            if isinstance(item, dict):
+                para_types.append(item["para_type"])
+                texts.append(item["text"])
+                parents.append(item["parent"])
+            else:
+                para_types.append(item.para_type)
+                texts.append(item.text)
+                parents.append(item.parent)
+        title_paths = _TitlePaths(texts, parents)
+
+        # parent -> 标题路径拼接的文本
+        title_texts = {}
+
+        def make_segment(contents, parent, node_id):
+            title = title_paths.get(parent)
+            title_text = title_texts.get(parent)
+            if title_text is None:
+                title_text = title_texts[parent] = " ".join(title) + " "
+            content = " " + " ".join(contents)
+            # 内容均为 str，跳过 pydantic 校验
+            return DocSegment.construct(content=content, title=list(title)), {"text": title_text + content,
+                                                                              "node_id": node_id}
+
+        contents = []
+        last = len(para_types) - 1
+        for i in range(1, last + 1):
+            para_type = para_types[i]
             #  去掉页眉页脚
-            if node.para_type == "head_tail":
+            if para_type == "head_tail":
                 continue
-
-            if node.para_type[:5] != "title":
-                segment.content += " " + node.text
+            if para_type[:5] != "title":
+                contents.append(texts[i])
                 # 下一个node是title或当前node是最后一个node，代表当前的标题层级segment结束
-                if i < len(para_node_tree) - 1 and para_node_tree[i + 1].para_type[:5] == "title" or i == len(
-                        para_node_tree) - 1:
-                    segment.title = self._get_title(para_node_tree, node.parent, [])
-                    doc_segments.append(segment)
-                    paragraphs_text = " ".join(segment.title) + " " + segment.content
-                    paragraphs.append({"text": paragraphs_text, "node_id": i})
-                    segment = DocSegment()
-
-        if segment.content:
-            segment.title = self._get_title(para_node_tree, node.parent, [])
-            doc_segments.append(segment)
-            paragraphs_text = " ".join(segment.title) + " " + segment.content
-            paragraphs.append({"text": paragraphs_text, "node_id": i})
+                if i == last or para_types[i + 1][:5] == "title":
+                    yield make_segment(contents, parents[i], i)
+                    contents = []
 
-        return Message({"doc_segments": doc_segments, "paragraphs": paragraphs})
+        if contents:
+            # 最后的正文之后只有页眉页脚，标题取最后一个节点的父节点
+            yield make_segment(contents, parents[last], last)
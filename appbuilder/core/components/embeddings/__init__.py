@@ -4,3 +4,4 @@ init
 
 from .component import Embedding
 from .base import EmbeddingBaseComponent
+from .cache import EmbeddingCache, EmbeddingCacheStats
@@ -17,6 +17,7 @@ base
 # limitations under the License.
 
 
+import asyncio
 from abc import abstractmethod
 from typing import List, Union
 
@@ -52,8 +53,8 @@ class EmbeddingBaseComponent(Component):
             embeddings: List[float]
         """
 
-        # embedding don't need be async, just return it
-        return self.run(text)
+        # subclass without native async request runs in thread pool
+        return await super().arun(text)
 
     @abstractmethod
     def batch(self, texts: Union[Message[List[str]], List[str]]) -> Message[List[List[float]]]:
@@ -64,7 +65,7 @@ class EmbeddingBaseComponent(Component):
             embeddings: List[List[float]]
         """
 
-    def abatch(self, texts: Union[Message[List[str]], List[str]]) -> Message[List[List[float]]]:
+    async def abatch(self, texts: Union[Message[List[str]], List[str]]) -> Message[List[List[float]]]:
         """
         Args:
             message: List[str]
@@ -72,5 +73,6 @@ class EmbeddingBaseComponent(Component):
             embeddings: List[List[float]]
         """
 
-        # embedding don't need be async, just return it
-        return self.batch(texts)
+        # subclass without native async request runs in thread pool
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.batch, texts)
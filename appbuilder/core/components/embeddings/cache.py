@@ -0,0 +1,293 @@
+# Copyright (c) 2023 Baidu, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+embedding cache
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from pydantic import BaseModel
+
+
+class EmbeddingCacheStats(BaseModel):
+    """EmbeddingCache 命中统计"""
+
+    hits: int = 0
+    memory_hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    hit_rate: float = 0.0
+    evictions: int = 0
+    expirations: int = 0
+    memory_items: int = 0
+    disk_items: int = 0
+
+
+class EmbeddingCache(object):
+    """
+    EmbeddingCache
+
+    以 (模型类型, 文本sha256) 为键缓存文本的embedding，包含内存LRU与sqlite磁盘两级缓存。
+    内存未命中时查询磁盘，磁盘命中的结果回填内存；内存中向量以tuple存储，每次命中返回新的列表，
+    磁盘中向量以float32存储。磁盘读写使用单独的锁，不阻塞其他线程的内存查询。
+
+    Examples:
+
+        .. code-block:: python
+
+            import appbuilder
+
+            cache = appbuilder.EmbeddingCache(path="./embedding_cache.db", ttl=7 * 24 * 3600)
+            cache.prewarm("./faq_embeddings.jsonl", model="embedding-v1")
+            embedding = appbuilder.Embedding(cache=cache)
+
+            embedding.batch(["你好", "世界"])  # 仅未命中的文本会请求服务
+            print(cache.stats())
+    """
+
+    def __init__(self,
+                 path: Optional[str] = None,
+                 max_memory_items: int = 10000,
+                 max_disk_items: Optional[int] = None,
+                 ttl: Optional[float] = None):
+        """
+        Args:
+            path: sqlite文件路径，为None时仅使用内存缓存
+            max_memory_items: 内存LRU的最大条目数，为0时不使用内存缓存
+            max_disk_items: 磁盘缓存的最大条目数，超出时淘汰最久未访问的条目，默认不限制
+            ttl: 缓存有效期(秒)，默认永不过期
+        """
+
+        if max_memory_items < 0:
+            raise ValueError(f"max_memory_items must not be negative, but got {max_memory_items}")
+        if max_disk_items is not None and max_disk_items < 1:
+            raise ValueError(f"max_disk_items must be greater than 0, but got {max_disk_items}")
+        if ttl is not None and ttl <= 0:
+            raise ValueError(f"ttl must be greater than 0, but got {ttl}")
+
+        self.path = path
+        self.max_memory_items = max_memory_items
+        self.max_disk_items = max_disk_items
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        # serializes the sqlite connection, never acquired while holding self._lock
+        self._db_lock = threading.Lock()
+        # (model, key) -> (created, vector tuple)
+        self._memory: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._stats = EmbeddingCacheStats()
+
+        self._db = None
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embedding_cache ("
+                "model TEXT NOT NULL, key TEXT NOT NULL, vector BLOB NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL, PRIMARY KEY (model, key))")
+            self._db.execute("CREATE INDEX IF NOT EXISTS embedding_cache_accessed ON embedding_cache (accessed)")
+            self._db.commit()
+
+    @staticmethod
+    def key(text: str) -> str:
+        """
+        文本的缓存键
+        """
+
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _expired(self, created: float, now: float) -> bool:
+        return self.ttl is not None and now - created > self.ttl
+
+    def _memory_put(self, model: str, key: str, created: float, vector: tuple):
+        if self.max_memory_items == 0:
+            return
+        self._memory[(model, key)] = (created, vector)
+        self._memory.move_to_end((model, key))
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+            self._stats.evictions += 1
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """
+        批量查询缓存，按输入顺序返回embedding，未命中的位置为None
+        """
+
+        now = time.time()
+        keys = [self.key(text) for text in texts]
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        with self._lock:
+            disk_keys: Dict[str, List[int]] = {}
+            for i, key in enumerate(keys):
+                item = self._memory.get((model, key))
+                if item is not None and self._expired(item[0], now):
+                    del self._memory[(model, key)]
+                    self._stats.expirations += 1
+                    item = None
+                if item is not None:
+                    self._memory.move_to_end((model, key))
+                    results[i] = list(item[1])
+                    self._stats.memory_hits += 1
+                else:
+                    disk_keys.setdefault(key, []).append(i)
+
+        found, expirations = {}, 0
+        if disk_keys and self.path is not None:
+            with self._db_lock:
+                if self._db is not None:
+                    found, expirations = self._disk_get(model, list(disk_keys), now)
+
+        with self._lock:
+            self._stats.expirations += expirations
+            for key, (created, vector) in found.items():
+                self._memory_put(model, key, created, vector)
+                for i in disk_keys[key]:
+                    results[i] = list(vector)
+                    self._stats.disk_hits += 1
+
+            misses = sum(1 for result in results if result is None)
+            self._stats.misses += misses
+            self._stats.hits += len(texts) - misses
+        return results
+
+    def _disk_get(self, model: str, keys: List[str], now: float) -> Tuple[Dict[str, tuple], int]:
+        found = {}
+        expired = []
+        # sqlite limits the number of bound parameters, query in chunks
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = self._db.execute(
+                "SELECT key, vector, created FROM embedding_cache WHERE model = ? AND key IN ({})".format(
+                    ",".join("?" * len(chunk))), [model] + chunk).fetchall()
+            for key, vector, created in rows:
+                if self._expired(created, now):
+                    expired.append(key)
+                else:
+                    found[key] = (created, tuple(np.frombuffer(vector, dtype=np.float32).tolist()))
+        if expired:
+            self._db.executemany("DELETE FROM embedding_cache WHERE model = ? AND key = ?",
+                                 [(model, key) for key in expired])
+        if found:
+            self._db.executemany("UPDATE embedding_cache SET accessed = ? WHERE model = ? AND key = ?",
+                                 [(now, model, key) for key in found])
+        if expired or found:
+            self._db.commit()
+        return found, len(expired)
+
+    def put_many(self, model: str, texts: Sequence[str], vectors: Sequence[List[float]]):
+        """
+        批量写入缓存
+        """
+
+        if len(texts) != len(vectors):
+            raise ValueError(f"texts and vectors must have the same length, but got {len(texts)} and {len(vectors)}")
+        now = time.time()
+        keys = [self.key(text) for text in texts]
+        with self._lock:
+            for key, vector in zip(keys, vectors):
+                self._memory_put(model, key, now, tuple(vector))
+        if self.path is None:
+            return
+        rows = [(model, key, np.asarray(vector, dtype=np.float32).tobytes(), now, now)
+                for key, vector in zip(keys, vectors)]
+        with self._db_lock:
+            if self._db is None:
+                return
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embedding_cache (model, key, vector, created, accessed) "
+                "VALUES (?, ?, ?, ?, ?)", rows)
+            evictions = self._evict_disk()
+            self._db.commit()
+        if evictions:
+            with self._lock:
+                self._stats.evictions += evictions
+
+    def _evict_disk(self) -> int:
+        if self.max_disk_items is None:
+            return 0
+        count = self._db.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0]
+        if count <= self.max_disk_items:
+            return 0
+        self._db.execute(
+            "DELETE FROM embedding_cache WHERE rowid IN "
+            "(SELECT rowid FROM embedding_cache ORDER BY accessed LIMIT ?)", (count - self.max_disk_items,))
+        return count - self.max_disk_items
+
+    def prewarm(self, path: str, model: str = "embedding-v1") -> int:
+        """
+        从jsonl文件预热缓存，每行格式为 {"text": "...", "embedding": [...]}，可选字段 "model" 覆盖model参数
+
+        Returns:
+            写入的条目数
+        """
+
+        count = 0
+        grouped: Dict[str, tuple] = {}
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                item = json.loads(line)
+                texts, vectors = grouped.setdefault(item.get("model", model), ([], []))
+                texts.append(item["text"])
+                vectors.append(item["embedding"])
+                count += 1
+        for item_model, (texts, vectors) in grouped.items():
+            self.put_many(item_model, texts, vectors)
+        return count
+
+    def clear(self):
+        """
+        清空内存与磁盘缓存
+        """
+
+        with self._lock:
+            self._memory.clear()
+        with self._db_lock:
+            if self._db is not None:
+                self._db.execute("DELETE FROM embedding_cache")
+                self._db.commit()
+
+    def stats(self) -> EmbeddingCacheStats:
+        """
+        返回命中率等统计信息
+        """
+
+        with self._lock:
+            stats = self._stats.copy()
+            stats.memory_items = len(self._memory)
+        with self._db_lock:
+            if self._db is not None:
+                stats.disk_items = self._db.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0]
+        total = stats.hits + stats.misses
+        stats.hit_rate = stats.hits / total if total else 0.0
+        return stats
+
+    def close(self):
+        """
+        关闭磁盘缓存
+        """
+
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -16,13 +16,20 @@
 ernie bot embedding
 """
 
-from typing import Union, List
+import asyncio
+import itertools
+import random
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Union, List, Iterator, Optional
 
 from appbuilder.core.message import Message
 from appbuilder.core.components.embeddings.base import EmbeddingBaseComponent
+from appbuilder.core.components.embeddings.cache import EmbeddingCache
 from appbuilder.core.component import ComponentArguments
 
-from appbuilder.core._exception import AppBuilderServerException
+from appbuilder.core._exception import AppBuilderServerException, TooManyRequestsException
 
 
 class EmbeddingArgs(ComponentArguments):
@@ -51,6 +58,10 @@ class Embedding(EmbeddingBaseComponent):
             embedding_single = embedding(Message("hello world!"))
 
             embedding_batch = embedding.batch(Message(["hello", "world"]))
+
+            # 同时发送最多8个请求，按输入顺序流式返回每16条文本的结果
+            for vectors in embedding.batch(texts, max_concurrency=8, stream=True).content:
+                ...
     """
 
     name: str = "embedding"
@@ -60,9 +71,23 @@ class Embedding(EmbeddingBaseComponent):
 
     base_url: str = "/v1/bce/wenxinworkshop/ai_custom/v1/embeddings/"
 
-    def __init__(self, type='embedding-v1'):
-        """Embedding"""
+    # 网关限流时的重试次数与初始退避时间(秒)，每次重试退避时间翻倍
+    throttle_retries: int = 5
+    throttle_backoff: float = 0.5
+    # 限流错误码: 4 请求量超限，18 QPS超限，336501 RPM超限，336502 TPM超限
+    throttle_error_codes = (4, 18, 336501, 336502)
+
+    def __init__(self, type='embedding-v1', cache: Optional[EmbeddingCache] = None):
+        """
+        Embedding
+
+        Args:
+            type: embedding模型类型
+            cache: 可选的EmbeddingCache，命中缓存的文本不再请求服务
+        """
         self.base_url = self.base_url + type
+        self.model_type = type
+        self.cache = cache
 
         super().__init__(self.meta)
 
@@ -72,6 +97,9 @@ class Embedding(EmbeddingBaseComponent):
         """
 
         self.check_response_json(data)
+        if data.get("error_code") in self.throttle_error_codes:
+            raise TooManyRequestsException(
+                "service_err_code={}, service_err_message={}".format(data["error_code"], data.get("error_msg")))
         if "error_code" in data and "error_msg" in data:
             raise AppBuilderServerException(
                 service_err_code=data['error_code'],
@@ -85,10 +113,7 @@ class Embedding(EmbeddingBaseComponent):
 
         resp = self.s.post(
             url=self.service_url(self.base_url),
-            headers={
-                "X-Appbuilder-Authorization": f"{self.secret_key}",
-                "Content-Type": "application/json",
-            },
+            headers=self._request_headers(),
             json=payload,
         )
         self.check_response_header(resp)
@@ -96,6 +121,91 @@ class Embedding(EmbeddingBaseComponent):
 
         return resp.json()
 
+    async def _arequest(self, payload: dict) -> dict:
+        """
+        async request to gateway
+        """
+
+        resp = await self._apost(
+            url=self.service_url(self.base_url),
+            headers=self._request_headers(),
+            json=payload,
+        )
+        self.check_response_header(resp)
+        self._check_response_json(resp.json())
+
+        return resp.json()
+
+    def _throttle_delay(self, attempt: int) -> float:
+        """
+        exponential backoff with jitter
+        """
+
+        return self.throttle_backoff * (2 ** attempt) * (0.5 + random.random() / 2)
+
+    def _request_with_backoff(self, payload: dict) -> dict:
+        """
+        request to gateway, retry with backoff when throttled
+        """
+
+        for attempt in itertools.count():
+            try:
+                return self._request(payload)
+            except TooManyRequestsException:
+                if attempt >= self.throttle_retries:
+                    raise
+                time.sleep(self._throttle_delay(attempt))
+
+    async def _arequest_with_backoff(self, payload: dict) -> dict:
+        """
+        async request to gateway, retry with backoff when throttled
+        """
+
+        for attempt in itertools.count():
+            try:
+                return await self._arequest(payload)
+            except TooManyRequestsException:
+                if attempt >= self.throttle_retries:
+                    raise
+                await asyncio.sleep(self._throttle_delay(attempt))
+
+    def _embed(self, batch: List[str]) -> List[List[float]]:
+        """
+        request embeddings of one batch
+        """
+
+        return self._check_embeddings(batch, self._request_with_backoff({"input": batch}))
+
+    async def _aembed(self, batch: List[str]) -> List[List[float]]:
+        """
+        async request embeddings of one batch
+        """
+
+        return self._check_embeddings(batch, await self._arequest_with_backoff({"input": batch}))
+
+    @staticmethod
+    def _check_embeddings(batch: List[str], response: dict) -> List[List[float]]:
+        """
+        embeddings of the response, the service must return one embedding per input text
+        """
+
+        data = response.get('data') or []
+        if len(data) != len(batch):
+            raise AppBuilderServerException(
+                request_id=response.get('id', ""),
+                service_err_message=f"expected {len(batch)} embeddings, but got {len(data)}")
+        return [result['embedding'] for result in data]
+
+    def _request_headers(self) -> dict:
+        """
+        request headers
+        """
+
+        return {
+            "X-Appbuilder-Authorization": f"{self.secret_key}",
+            "Content-Type": "application/json",
+        }
+
     def _batchify(self, texts: List[str], batch_size: int = 16) -> List[List[str]]:
         """
         batchify input text list
@@ -108,19 +218,103 @@ class Embedding(EmbeddingBaseComponent):
             texts[i : i + batch_size] for i in range(0, len(texts), batch_size)
         ]
 
-    def _batch(self, texts: List[str]) -> Message[List[List[float]]]:
+    def _iter_requests(self, texts: List[str], max_concurrency: int = 1) -> Iterator[List[List[float]]]:
+        """
+        yield embeddings of every request in input order, keep at most max_concurrency requests in flight
+        """
+
+        if max_concurrency < 1:
+            raise ValueError(f"max_concurrency must be greater than 0, but got {max_concurrency}")
+
+        batches = iter(self._batchify(texts))
+        if max_concurrency == 1:
+            for batch in batches:
+                yield self._embed(batch)
+            return
+
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            # submit one window ahead, so that workers are busy while the caller consumes results
+            pending = deque(executor.submit(self._embed, batch)
+                            for batch in itertools.islice(batches, max_concurrency * 2))
+            try:
+                while pending:
+                    embeddings = pending.popleft().result()
+                    for batch in itertools.islice(batches, 1):
+                        pending.append(executor.submit(self._embed, batch))
+                    yield embeddings
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def _iter_batches(self, texts: List[str], max_concurrency: int = 1) -> Iterator[List[List[float]]]:
+        """
+        yield embeddings of every 16 input texts in input order, only cache misses are sent to the service
+        """
+
+        if self.cache is None:
+            yield from self._iter_requests(texts, max_concurrency)
+            return
+
+        results = self.cache.get_many(self.model_type, texts)
+        # repeated texts are requested once
+        misses = list(dict.fromkeys(text for text, result in zip(texts, results) if result is None))
+        fetched = {}
+        responses = self._iter_requests(misses, max_concurrency)
+        for start in range(0, len(texts), 16):
+            end = min(start + 16, len(texts))
+            for i in range(start, end):
+                if results[i] is not None:
+                    continue
+                while texts[i] not in fetched:
+                    embeddings = next(responses)
+                    requested = misses[len(fetched):len(fetched) + len(embeddings)]
+                    fetched.update(zip(requested, embeddings))
+                    self.cache.put_many(self.model_type, requested, embeddings)
+                results[i] = fetched[texts[i]]
+            yield results[start:end]
+
+    def _batch(self, texts: List[str], max_concurrency: int = 1) -> Message[List[List[float]]]:
         """
         batch run implement
         """
 
-        batches = self._batchify(texts)
         results = []
-        for batch in batches:
-            result = self._request({"input": batch})
-            results.extend(result['data'])
-        results = Message([result['embedding'] for result in results])
+        for embeddings in self._iter_batches(texts, max_concurrency):
+            results.extend(embeddings)
 
-        return results
+        return Message(results)
+
+    async def _abatch(self, texts: List[str], max_concurrency: int = None) -> Message[List[List[float]]]:
+        """
+        async batch run implement, batches are sent concurrently
+        """
+
+        if max_concurrency is not None and max_concurrency < 1:
+            raise ValueError(f"max_concurrency must be greater than 0, but got {max_concurrency}")
+        semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+
+        async def _request(batch):
+            if semaphore is None:
+                return await self._aembed(batch)
+            async with semaphore:
+                return await self._aembed(batch)
+
+        if self.cache is None:
+            batches = self._batchify(texts)
+            responses = await asyncio.gather(*[_request(batch) for batch in batches])
+            return Message([embedding for embeddings in responses for embedding in embeddings])
+
+        # the disk cache is sqlite, keep its I/O off the event loop
+        loop = asyncio.get_running_loop()
+        results = await loop.run_in_executor(None, self.cache.get_many, self.model_type, texts)
+        misses = list(dict.fromkeys(text for text, result in zip(texts, results) if result is None))
+        batches = self._batchify(misses)
+        responses = await asyncio.gather(*[_request(batch) for batch in batches])
+        embeddings = [embedding for batch_embeddings in responses for embedding in batch_embeddings]
+        await loop.run_in_executor(None, self.cache.put_many, self.model_type, misses, embeddings)
+        fetched = dict(zip(misses, embeddings))
+
+        return Message([result if result is not None else fetched[text] for text, result in zip(texts, results)])
 
     def run(self, text: Union[Message[str], str]) -> Message[List[float]]:
         """
@@ -131,11 +325,38 @@ class Embedding(EmbeddingBaseComponent):
 
         return Message(self._batch([_text]).content[0])
 
-    def batch(self, texts: Union[Message[List[str]], List[str]]) -> Message[List[List[float]]]:
+    def batch(self, texts: Union[Message[List[str]], List[str]], max_concurrency: int = 4,
+              stream: bool = False) -> Message[List[List[float]]]:
         """
         batch run
+
+        Args:
+            texts: 输入文本列表，每16条文本发送一次请求
+            max_concurrency: 同时发送的最大请求数，网关限流时自动退避重试
+            stream: 为True时返回的content为迭代器，按输入顺序依次产出每个请求(16条文本)的embedding列表
+        """
+
+        _texts = texts if isinstance(texts, list) else texts.content
+
+        if stream:
+            return Message(self._iter_batches(_texts, max_concurrency))
+        return self._batch(_texts, max_concurrency)
+
+    async def arun(self, text: Union[Message[str], str]) -> Message[List[float]]:
+        """
+        async run
+        """
+
+        _text = text if isinstance(text, str) else text.content
+
+        return Message((await self._abatch([_text])).content[0])
+
+    async def abatch(self, texts: Union[Message[List[str]], List[str]],
+                     max_concurrency: int = None) -> Message[List[List[float]]]:
+        """
+        async batch run
         """
 
         _texts = texts if isinstance(texts, list) else texts.content
 
-        return self._batch(_texts)
+        return await self._abatch(_texts, max_concurrency)
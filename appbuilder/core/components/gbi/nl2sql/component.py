@@ -105,6 +105,25 @@ class GBINL2Sql(Component):
                                      sql=rsp_data["sql"])
         return Message(content=nl2sql_result)
 
+    async def arun(self,
+                   message: Message,
+                   session: List[GBISessionRecord],
+                   column_constraint: List[ColumnItem] = None) -> Message[NL2SqlResult]:
+        """
+        run 的异步版本，参数与返回值同 run
+        """
+        response = await self._arun_nl2sql(query=message.content, session=session, table_schemas=self.table_schemas,
+                                           column_constraint=column_constraint or list(), knowledge=self.knowledge,
+                                           prompt_template=self.prompt_template,
+                                           model_name=self.model_name,
+                                           timeout=60,
+                                           retry=2)
+
+        rsp_data = response.json()
+        nl2sql_result = NL2SqlResult(llm_result=rsp_data["llm_result"],
+                                     sql=rsp_data["sql"])
+        return Message(content=nl2sql_result)
+
     def _run_nl2sql(self, query: str, session: List[GBISessionRecord], table_schemas: List[str], knowledge: Dict[str, str],
                     prompt_template: str,
                     column_constraint: List[ColumnItem],
@@ -133,17 +152,53 @@ class GBINL2Sql(Component):
         if retry != self.retry.total:
             self.retry.total = retry
 
-        payload = {"query": query,
-                   "table_schemas": table_schemas,
-                   "session": [session_record.to_json() for session_record in session],
-                   "column_constraint": [column_item.to_json() for column_item in column_constraint],
-                   "model_name": model_name,
-                   "knowledge": knowledge,
-                   "prompt_template": prompt_template}
+        payload = self._nl2sql_payload(query, session, table_schemas, knowledge, prompt_template,
+                                       column_constraint, model_name)
 
         server_url = self.service_url(prefix="", sub_path=self.server_sub_path)
         response = self.s.post(url=server_url, headers=headers,
                                json=payload, timeout=timeout)
+        return self._check_response(response)
+
+    async def _arun_nl2sql(self, query: str, session: List[GBISessionRecord], table_schemas: List[str],
+                           knowledge: Dict[str, str],
+                           prompt_template: str,
+                           column_constraint: List[ColumnItem],
+                           model_name: str,
+                           timeout: float = None, retry: int = 0):
+        """
+        _run_nl2sql 的异步版本
+        """
+        headers = self.auth_header()
+        headers["Content-Type"] = "application/json"
+
+        payload = self._nl2sql_payload(query, session, table_schemas, knowledge, prompt_template,
+                                       column_constraint, model_name)
+
+        server_url = self.service_url(prefix="", sub_path=self.server_sub_path)
+        response = await self._apost(url=server_url, headers=headers,
+                                     json=payload, timeout=timeout, retry=retry)
+        return self._check_response(response)
+
+    @staticmethod
+    def _nl2sql_payload(query: str, session: List[GBISessionRecord], table_schemas: List[str],
+                        knowledge: Dict[str, str], prompt_template: str,
+                        column_constraint: List[ColumnItem], model_name: str) -> Dict:
+        """
+        生成请求 body
+        """
+        return {"query": query,
+                "table_schemas": table_schemas,
+                "session": [session_record.to_json() for session_record in session],
+                "column_constraint": [column_item.to_json() for column_item in column_constraint],
+                "model_name": model_name,
+                "knowledge": knowledge,
+                "prompt_template": prompt_template}
+
+    def _check_response(self, response):
+        """
+        检查服务返回
+        """
         super().check_response_header(response)
         data = response.json()
         super().check_response_json(data)
@@ -98,6 +98,23 @@ class GBISelectTable(Component):
 
         return Message(content=rsp_data)
 
+    async def arun(self,
+                   message: Message,
+                   session: List[GBISessionRecord]) -> Message[List[str]]:
+        """
+        run 的异步版本，参数与返回值同 run
+        """
+        response = await self._arun_select_table(query=message.content, session=session,
+                                                 prompt_template=self.prompt_template,
+                                                 table_descriptions=self.table_descriptions,
+                                                 model_name=self.model_name,
+                                                 timeout=60,
+                                                 retry=2)
+
+        rsp_data = response.json()
+
+        return Message(content=rsp_data)
+
     def _run_select_table(self, query: str, session: List[GBISessionRecord],
                           prompt_template,
                           table_descriptions: Dict[str, str],
@@ -121,15 +138,47 @@ class GBISelectTable(Component):
         if retry != self.retry.total:
             self.retry.total = retry
 
-        payload = {"query": query,
-                   "table_descriptions": table_descriptions,
-                   "session": [session_record.to_json() for session_record in session],
-                   "model_name": model_name,
-                   "prompt_template": prompt_template}
+        payload = self._select_table_payload(query, session, prompt_template, table_descriptions, model_name)
 
         server_url = self.service_url(sub_path=self.server_sub_path)
         response = self.s.post(url=server_url, headers=headers,
                                json=payload, timeout=timeout)
+        return self._check_response(response)
+
+    async def _arun_select_table(self, query: str, session: List[GBISessionRecord],
+                                 prompt_template,
+                                 table_descriptions: Dict[str, str],
+                                 model_name: str,
+                                 timeout: float = None, retry: int = 0):
+        """
+        _run_select_table 的异步版本
+        """
+        headers = self.auth_header()
+        headers["Content_Type"] = "application/json"
+
+        payload = self._select_table_payload(query, session, prompt_template, table_descriptions, model_name)
+
+        server_url = self.service_url(sub_path=self.server_sub_path)
+        response = await self._apost(url=server_url, headers=headers,
+                                     json=payload, timeout=timeout, retry=retry)
+        return self._check_response(response)
+
+    @staticmethod
+    def _select_table_payload(query: str, session: List[GBISessionRecord], prompt_template,
+                              table_descriptions: Dict[str, str], model_name: str) -> Dict:
+        """
+        生成请求 body
+        """
+        return {"query": query,
+                "table_descriptions": table_descriptions,
+                "session": [session_record.to_json() for session_record in session],
+                "model_name": model_name,
+                "prompt_template": prompt_template}
+
+    def _check_response(self, response):
+        """
+        检查服务返回
+        """
         super().check_response_header(response)
         data = response.json()
         super().check_response_json(data)
@@ -54,16 +54,31 @@ class GeneralOCR(Component):
                      返回: message (obj: `Message`): 模型识别结果. 举例: Message(content={"words_result":[{"words":"100"},
                      {"words":"G8"}]})
         """
+        request = self._gene_request(message)
+        result = self._recognize(request, timeout, retry)
+        result_dict = proto.Message.to_dict(result)
+        out = GeneralOCROutMsg(**result_dict)
+        return Message(content=out.dict())
+
+    async def arun(self, message: Message, timeout: float = None, retry: int = 0) -> Message:
+        r""" run 的异步版本，参数与返回值同 run
+        """
+        request = self._gene_request(message)
+        result = await self._arecognize(request, timeout, retry)
+        result_dict = proto.Message.to_dict(result)
+        out = GeneralOCROutMsg(**result_dict)
+        return Message(content=out.dict())
+
+    @staticmethod
+    def _gene_request(message: Message) -> GeneralOCRRequest:
+        r"""根据输入消息生成通用文字识别请求"""
         inp = GeneralOCRInMsg(**message.content)
         request = GeneralOCRRequest()
         if inp.raw_image:
             request.image = base64.b64encode(inp.raw_image)
         if inp.url:
             request.url = inp.url
-        result = self._recognize(request, timeout, retry)
-        result_dict = proto.Message.to_dict(result)
-        out = GeneralOCROutMsg(**result_dict)
-        return Message(content=out.dict())
+        return request
 
     def _recognize(self, request: GeneralOCRRequest, timeout: float = None,
                   retry: int = 0) -> GeneralOCRResponse:
@@ -74,15 +89,31 @@ class GeneralOCR(Component):
                    返回：
                        response (obj: `GeneralOCRResponse`): 通用文字识别返回结果
                """
+        url, headers, data = self._recognize_params(request)
+        if self.retry.total != retry:
+            self.retry.total = retry
+        response = self.s.post(url, headers=headers, data=data, timeout=timeout)
+        return self._parse_response(response)
+
+    async def _arecognize(self, request: GeneralOCRRequest, timeout: float = None,
+                          retry: int = 0) -> GeneralOCRResponse:
+        r"""_recognize 的异步版本"""
+        url, headers, data = self._recognize_params(request)
+        response = await self._apost(url, headers=headers, data=data, timeout=timeout, retry=retry)
+        return self._parse_response(response)
+
+    def _recognize_params(self, request: GeneralOCRRequest):
+        r"""校验请求，返回请求的url、header和body"""
         if not request.image and not request.url and not request.pdf_file and not request.ofd_file:
             raise ValueError("one of image or url or must pdf_file or ofd_file be set")
         data = GeneralOCRRequest.to_dict(request)
-        if self.retry.total != retry:
-            self.retry.total = retry
         headers = self.auth_header()
         headers['content-type'] = 'application/x-www-form-urlencoded'
         url = self.service_url("/v1/bce/aip/ocr/v1/accurate_basic")
-        response = self.s.post(url, headers=headers, data=data, timeout=timeout)
+        return url, headers, data
+
+    def _parse_response(self, response) -> GeneralOCRResponse:
+        r"""检查并解析接口返回"""
         super().check_response_header(response)
         data = response.json()
         super().check_response_json(data)
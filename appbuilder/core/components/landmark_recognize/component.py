@@ -52,15 +52,29 @@ class LandmarkRecognition(Component):
               返回:
                  message (obj: `Message`): 模型识别结果. 举例: Message(content={"landmark": b"狮身人面相"})
         """
+        request = self.__gene_request(message)
+        response = self.__recognize(request, timeout, retry)
+        out = LandmarkRecognitionOutMsg(landmark=response.result.get("landmark", ""))
+        return Message(content=dict(out))
+
+    async def arun(self, message: Message, timeout: float = None, retry: int = 0) -> Message:
+        r""" run 的异步版本，参数与返回值同 run
+        """
+        request = self.__gene_request(message)
+        response = await self.__arecognize(request, timeout, retry)
+        out = LandmarkRecognitionOutMsg(landmark=response.result.get("landmark", ""))
+        return Message(content=dict(out))
+
+    @staticmethod
+    def __gene_request(message: Message) -> LandmarkRecognitionRequest:
+        r"""根据输入消息生成地标识别请求"""
         inp = LandmarkRecognitionInMsg(**message.content)
         request = LandmarkRecognitionRequest()
         if inp.raw_image:
             request.image = base64.b64encode(inp.raw_image)
         if inp.url:
             request.url = inp.url
-        response = self.__recognize(request, timeout, retry)
-        out = LandmarkRecognitionOutMsg(landmark=response.result.get("landmark", ""))
-        return Message(content=dict(out))
+        return request
 
     def __recognize(self, request: LandmarkRecognitionRequest, timeout: float = None,
                     retry: int = 0) -> LandmarkRecognitionResponse:
@@ -73,15 +87,31 @@ class LandmarkRecognition(Component):
                 response (obj: `LandmarkRecognitionResponse`): 地标识别返回结果
         """
 
+        url, headers, data = self.__recognize_params(request)
+        if retry != self.retry.total:
+            self.retry.total = retry
+        response = self.s.post(url, data=data, timeout=timeout, headers=headers)
+        return self.__parse_response(response)
+
+    async def __arecognize(self, request: LandmarkRecognitionRequest, timeout: float = None,
+                           retry: int = 0) -> LandmarkRecognitionResponse:
+        r"""__recognize 的异步版本"""
+        url, headers, data = self.__recognize_params(request)
+        response = await self._apost(url, data=data, timeout=timeout, headers=headers, retry=retry)
+        return self.__parse_response(response)
+
+    def __recognize_params(self, request: LandmarkRecognitionRequest):
+        r"""校验请求，返回请求的url、header和body"""
         if not request.image and not request.url:
             raise ValueError("one of image or url must be set")
         data = LandmarkRecognitionRequest.to_dict(request)
-        if retry != self.retry.total:
-            self.retry.total = retry
         headers = self.auth_header()
         headers['content-type'] = 'application/x-www-form-urlencoded'
         url = self.service_url("/v1/bce/aip/image-classify/v1/landmark")
-        response = self.s.post(url, data=data, timeout=timeout, headers=headers)
+        return url, headers, data
+
+    def __parse_response(self, response) -> LandmarkRecognitionResponse:
+        r"""检查并解析接口返回"""
         super().check_response_header(response)
         data = response.json()
         super().check_response_json(data)
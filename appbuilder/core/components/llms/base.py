@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import json
+import time
 import uuid
 from enum import Enum
 
@@ -27,6 +28,8 @@ from typing import Dict, List, Optional, Any
 
 from appbuilder.core.component import ComponentArguments
 from appbuilder.core._exception import AppBuilderServerException
+from appbuilder.core.sse import SSEDecoder
+from appbuilder.core.components.llms.cache import CompletionCache
 
 
 class CompletionRequest(object):
@@ -86,22 +89,26 @@ class CompletionResponse(object):
     error_msg = ""
     result = None
     log_id = ""
+    time_to_first_token = None
 
-    def __init__(self, response, stream: bool = False):
-        """初始化客户端状态。"""
+    def __init__(self, response, stream: bool = False, start_time: Optional[float] = None):
+        """初始化客户端状态。
+
+        Args:
+            response: HTTP响应
+            stream: 是否为流式响应
+            start_time: 请求发出时的time.monotonic()，用于统计首token耗时，默认为响应创建时刻
+        """
         self.error_no = 0
         self.error_msg = ""
         self.log_id = response.headers.get("X-Appbuilder-Request-Id", None)
+        self.start_time = start_time if start_time is not None else time.monotonic()
+        # 流式响应收到第一个非空answer的耗时(秒)
+        self.time_to_first_token = None
 
         if stream:
             # 流式数据处理
-            def stream_data():
-                for chunk in response.iter_content(chunk_size=None):
-                    answer = self.parse_stream_data(chunk)
-                    if answer is not None:
-                        yield answer
-
-            self.result = stream_data()
+            self.result = self.stream_data(response)
         else:
             # 非流式数据的处理
             if response.status_code != 200:
@@ -122,32 +129,42 @@ class CompletionResponse(object):
 
                 self.result = data.get("answer", None)
 
-    def parse_stream_data(self, data_chunk):
-        """解析流式数据块并提取answer字段"""
+    def stream_data(self, response):
+        """迭代流式响应，按SSE事件逐个返回answer，事件可以跨网络包或在同一个网络包中"""
+        decoder = SSEDecoder()
+        for event in decoder.iter_events(response.iter_content(chunk_size=None)):
+            yield self._on_answer(self.parse_stream_data(event.data))
 
-        data_str = data_chunk.decode('utf-8')
+    def _on_answer(self, answer):
+        """记录首token耗时"""
+        if answer and self.time_to_first_token is None:
+            self.time_to_first_token = time.monotonic() - self.start_time
+            logger.debug("request_id={}, time to first token: {:.3f}s".format(self.log_id, self.time_to_first_token))
+        return answer
 
-        if data_str.startswith("data: "):
-            parsed_str = data_str[6:]
-        else:
-            parsed_str = data_str
+    def parse_stream_data(self, data):
+        """解析一个SSE事件的data并提取answer字段"""
 
-        print("xxx: " + parsed_str)
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        if data.startswith("data: "):
+            data = data[6:]
 
         try:
-            data = json.loads(parsed_str)
+            parsed = json.loads(data)
+        except json.JSONDecodeError:
+            if "\n" not in data:
+                raise AppBuilderServerException(self.log_id, "unknown", data)
+            # 兼容事件之间缺少空行的服务端，此时多个事件的data被合并为多行
+            return "".join(self.parse_stream_data(line) for line in data.split("\n") if line)
 
-            if "code" in data and "message" in data and "requestId" in data:
-                raise AppBuilderServerException(self.log_id, data["code"], data["message"])
+        if "code" in parsed and "message" in parsed and "requestId" in parsed:
+            raise AppBuilderServerException(self.log_id, parsed["code"], parsed["message"])
 
-            if "code" in data and "message" in data and "status" in data:
-                raise AppBuilderServerException(self.log_id, data["code"], data["message"])
+        if "code" in parsed and "message" in parsed and "status" in parsed:
+            raise AppBuilderServerException(self.log_id, parsed["code"], parsed["message"])
 
-            return data.get("answer", "")
-        except json.JSONDecodeError:
-            # 处理可能的解析错误
-            print("error: " + parsed_str)
-            raise AppBuilderServerException("unknown", "unknown", parsed_str)
+        return parsed.get("answer", "")
 
     def get_stream_data(self):
         """获取处理过的流式数据的迭代器"""
@@ -166,12 +183,61 @@ class CompletionResponse(object):
         return message
 
 
+class AsyncCompletionResponse(CompletionResponse):
+    r"""异步请求的CompletionResponse，流式结果为异步迭代器。"""
+
+    async def stream_data(self, response):
+        """异步迭代流式响应，按SSE事件逐个返回answer，迭代结束后释放连接"""
+        decoder = SSEDecoder()
+        try:
+            async for chunk in response.content.iter_any():
+                for event in decoder.feed(chunk):
+                    yield self._on_answer(self.parse_stream_data(event.data))
+            for event in decoder.flush():
+                yield self._on_answer(self.parse_stream_data(event.data))
+        finally:
+            response.release()
+
+
+class CachedCompletionResponse(CompletionResponse):
+    r"""命中CompletionCache时返回的CompletionResponse，流式请求按缓存的分片回放。"""
+
+    def __init__(self, chunks: List[str], stream: bool = False, asynchronous: bool = False):
+        """
+        Args:
+            chunks: 缓存的answer分片
+            stream: 是否以流式返回
+            asynchronous: 流式返回时result是否为异步迭代器
+        """
+        self.error_no = 0
+        self.error_msg = ""
+        self.log_id = None
+        self.start_time = time.monotonic()
+        self.time_to_first_token = 0.0 if stream else None
+        if not stream:
+            self.result = "".join(chunks)
+        elif asynchronous:
+            self.result = self._areplay(chunks)
+        else:
+            self.result = self._replay(chunks)
+
+    @staticmethod
+    def _replay(chunks):
+        yield from chunks
+
+    @staticmethod
+    async def _areplay(chunks):
+        for chunk in chunks:
+            yield chunk
+
+
 class CompletionBaseComponent(Component):
     name: str
     version: str
     base_url: str = "/rpc/2.0/cloud_hub/v1/ai_engine/copilot_engine"
     model_name: str = ""
     model_url: str = ""
+    completion_cache: Optional[CompletionCache] = None
 
     model_config: Dict[str, Any] = {
         "model": {
@@ -208,6 +274,15 @@ class CompletionBaseComponent(Component):
 
         self.version = self.version
 
+    def set_completion_cache(self, cache: Optional[CompletionCache]):
+        """
+        设置结果缓存，相同的确定性请求直接返回缓存结果，为None时关闭缓存
+
+        Args:
+            cache (CompletionCache): 结果缓存，可在多个组件间共享
+        """
+        self.completion_cache = cache
+
     def gene_request(self, query, inputs, response_mode, message_id, model_config):
         """"send request"""
 
@@ -222,9 +297,9 @@ class CompletionBaseComponent(Component):
         request = CompletionRequest(data, response_mode)
         return request
 
-    def gene_response(self, response, stream: bool = False):
+    def gene_response(self, response, stream: bool = False, start_time: Optional[float] = None):
         """generate response"""
-        response = CompletionResponse(response, stream)
+        response = CompletionResponse(response, stream, start_time)
         return response
 
     def run(self, *args, **kwargs):
@@ -238,6 +313,35 @@ class CompletionBaseComponent(Component):
             obj:`Message`: Output message after running model.
         """
 
+        request = self.gene_run_request(**kwargs)
+        response = self.completion(self.version, self.base_url, request)
+
+        if response.error_no != 0:
+            raise AppBuilderServerException(service_err_code=response.error_no, service_err_message=response.error_msg)
+
+        return response.to_message()
+
+    async def arun(self, *args, **kwargs):
+        """
+        Async version of run, the request does not block the event loop.
+
+        Args:
+            **kwargs: Same as run.
+
+        Returns:
+            obj:`Message`: Output message after running model, content is an async iterator when stream is True.
+        """
+
+        request = self.gene_run_request(**kwargs)
+        response = await self.acompletion(self.version, self.base_url, request)
+
+        if response.error_no != 0:
+            raise AppBuilderServerException(service_err_code=response.error_no, service_err_message=response.error_msg)
+
+        return response.to_message()
+
+    def gene_run_request(self, **kwargs) -> CompletionRequest:
+        """根据run的参数生成请求"""
         specific_params = {k: v for k, v in kwargs.items() if k in self.meta.__fields__}
         model_config_params = {k: v for k, v in kwargs.items() if k in ModelArgsConfig.__fields__}
 
@@ -249,13 +353,7 @@ class CompletionBaseComponent(Component):
 
         query, inputs, response_mode, user_id = self.get_compeliton_params(specific_inputs, model_config_inputs)
         model_config = self.get_model_config(model_config_inputs)
-        request = self.gene_request(query, inputs, response_mode, user_id, model_config)
-        response = self.completion(self.version, self.base_url, request)
-
-        if response.error_no != 0:
-            raise AppBuilderServerException(service_err_code=response.error_no, service_err_message=response.error_msg)
-
-        return response.to_message()
+        return self.gene_request(query, inputs, response_mode, user_id, model_config)
 
     def get_compeliton_params(self, specific_inputs, model_config_inputs):
         """获取模型请求参数"""
@@ -286,13 +384,14 @@ class CompletionBaseComponent(Component):
                    retry: int = 0, ) -> CompletionResponse:
         r"""Send a byte array of an audio file to obtain the result of speech recognition."""
 
-        headers = self.auth_header()
-        headers["Content-Type"] = "application/json"
-
-        completion_url = "/" + self.version + "/api/llm/" + self.name
-
+        url, headers = self._completion_url_and_headers()
         stream = True if request.response_mode == "streaming" else False
-        url = self.service_url(completion_url, self.base_url)
+
+        cache_key = self._completion_cache_key(request)
+        if cache_key is not None:
+            chunks = self.completion_cache.get(cache_key)
+            if chunks is not None:
+                return CachedCompletionResponse(chunks, stream)
 
         logger.debug(
             "request url: {}, method: {}, json: {}, headers: {}".format(url,
@@ -300,6 +399,7 @@ class CompletionBaseComponent(Component):
                                                                         request.params,
                                                                         headers))
 
+        start_time = time.monotonic()
         response = self.s.post(url, json=request.params, headers=headers, timeout=timeout, stream=stream)
 
         logger.debug(
@@ -307,7 +407,72 @@ class CompletionBaseComponent(Component):
                                                                                       request.params,
                                                                                       headers,
                                                                                       response))
-        return self.gene_response(response, stream)
+        response = self.gene_response(response, stream, start_time)
+        if cache_key is not None:
+            self._cache_completion(cache_key, response, stream)
+        return response
+
+    async def acompletion(self, version, base_url, request: CompletionRequest, timeout: float = None,
+                          retry: int = 0) -> AsyncCompletionResponse:
+        r"""completion的异步版本，流式请求时返回结果为异步迭代器。"""
+
+        url, headers = self._completion_url_and_headers()
+        stream = True if request.response_mode == "streaming" else False
+
+        cache_key = self._completion_cache_key(request)
+        if cache_key is not None:
+            chunks = self.completion_cache.get(cache_key)
+            if chunks is not None:
+                return CachedCompletionResponse(chunks, stream, asynchronous=True)
+
+        logger.debug(
+            "async request url: {}, method: {}, json: {}, headers: {}".format(url, "POST", request.params, headers))
+
+        start_time = time.monotonic()
+        response = await self._apost(url, json=request.params, headers=headers, timeout=timeout, retry=retry,
+                                     stream=stream)
+        response = AsyncCompletionResponse(response, stream, start_time)
+        if cache_key is not None:
+            self._cache_completion(cache_key, response, stream)
+        return response
+
+    def _completion_cache_key(self, request: CompletionRequest) -> Optional[str]:
+        """开启缓存且请求结果确定时返回缓存键，否则返回None"""
+        if self.completion_cache is None or not self.completion_cache.cacheable(request.params):
+            return None
+        return self.completion_cache.key(self.name, self.version, request.params)
+
+    def _cache_completion(self, cache_key: str, response: CompletionResponse, stream: bool):
+        """写入缓存，流式结果在被完整消费后写入"""
+        if not stream:
+            if isinstance(response.result, str):
+                self.completion_cache.put(cache_key, [response.result])
+        elif hasattr(response.result, "__aiter__"):
+            response.result = self._arecord_stream(cache_key, response.result)
+        else:
+            response.result = self._record_stream(cache_key, response.result)
+
+    def _record_stream(self, cache_key, answers):
+        chunks = []
+        for answer in answers:
+            chunks.append(answer)
+            yield answer
+        self.completion_cache.put(cache_key, chunks)
+
+    async def _arecord_stream(self, cache_key, answers):
+        chunks = []
+        async for answer in answers:
+            chunks.append(answer)
+            yield answer
+        self.completion_cache.put(cache_key, chunks)
+
+    def _completion_url_and_headers(self):
+        """获取completion请求的url和header"""
+        headers = self.auth_header()
+        headers["Content-Type"] = "application/json"
+
+        completion_url = "/" + self.version + "/api/llm/" + self.name
+        return self.service_url(completion_url, self.base_url), headers
 
     @staticmethod
     def check_service_error(data: dict):
@@ -0,0 +1,300 @@
+# Copyright (c) 2023 Baidu, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+completion cache
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel
+
+
+class CompletionCacheBackend(ABC):
+    """
+    缓存存储后端，键为字符串，值为answer分片列表
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[List[str]]:
+        """读取缓存，不存在时返回None"""
+
+    @abstractmethod
+    def set(self, key: str, chunks: List[str]):
+        """写入缓存"""
+
+    @abstractmethod
+    def clear(self, prefix: str = "") -> int:
+        """删除以prefix开头的缓存，返回删除的条目数"""
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """缓存条目数"""
+
+
+class MemoryCacheBackend(CompletionCacheBackend):
+    """
+    内存LRU缓存
+    """
+
+    def __init__(self, max_items: int = 1024):
+        if max_items < 1:
+            raise ValueError(f"max_items must be greater than 0, but got {max_items}")
+        self.max_items = max_items
+        self._items: "OrderedDict[str, List[str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[List[str]]:
+        with self._lock:
+            chunks = self._items.get(key)
+            if chunks is not None:
+                self._items.move_to_end(key)
+            return chunks
+
+    def set(self, key: str, chunks: List[str]):
+        with self._lock:
+            self._items[key] = list(chunks)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def clear(self, prefix: str = "") -> int:
+        with self._lock:
+            keys = [key for key in self._items if key.startswith(prefix)]
+            for key in keys:
+                del self._items[key]
+            return len(keys)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class SqliteCacheBackend(CompletionCacheBackend):
+    """
+    sqlite缓存，可在进程间及重启后复用
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS completion_cache (key TEXT PRIMARY KEY, chunks TEXT NOT NULL)")
+        self._db.commit()
+
+    def get(self, key: str) -> Optional[List[str]]:
+        with self._lock:
+            row = self._db.execute("SELECT chunks FROM completion_cache WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def set(self, key: str, chunks: List[str]):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO completion_cache (key, chunks) VALUES (?, ?)",
+                             (key, json.dumps(chunks, ensure_ascii=False)))
+            self._db.commit()
+
+    def clear(self, prefix: str = "") -> int:
+        with self._lock:
+            # substr comparison instead of LIKE, component names may contain "_" or "%"
+            cursor = self._db.execute("DELETE FROM completion_cache WHERE substr(key, 1, ?) = ?",
+                                      (len(prefix), prefix))
+            self._db.commit()
+            return cursor.rowcount
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM completion_cache").fetchone()[0]
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._db.close()
+
+
+class FileCacheBackend(CompletionCacheBackend):
+    """
+    本地文件缓存，每条缓存一个json文件，便于查看与同步
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        # key is "<component>/<version>/<sha256>", keep the layout on disk
+        return os.path.join(self.directory, *key.split("/")) + ".json"
+
+    def get(self, key: str) -> Optional[List[str]]:
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def set(self, key: str, chunks: List[str]):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = "{}.{}.tmp".format(path, threading.get_ident())
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(chunks, f, ensure_ascii=False)
+        # atomic on POSIX and Windows, readers never see a partial file
+        os.replace(tmp_path, path)
+
+    def _files(self, prefix: str = ""):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                key = os.path.relpath(path, self.directory)[:-len(".json")].replace(os.sep, "/")
+                if key.startswith(prefix):
+                    yield path
+
+    def clear(self, prefix: str = "") -> int:
+        count = 0
+        for path in list(self._files(prefix)):
+            os.remove(path)
+            count += 1
+        return count
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self._files())
+
+
+class CompletionCacheStats(BaseModel):
+    """CompletionCache 统计信息"""
+
+    hits: int = 0
+    misses: int = 0
+    bypasses: int = 0
+    writes: int = 0
+    invalidations: int = 0
+    hit_rate: float = 0.0
+
+
+class CompletionCache(object):
+    """
+    CompletionCache
+
+    缓存确定性的大模型请求结果，键为组件名、版本与规范化后的请求(query, inputs, model_config)，
+    不包含每次随机生成的user与response_mode，因此流式与非流式请求共享缓存，流式请求命中时按原分片回放。
+
+    Examples:
+
+        .. code-block:: python
+
+            import appbuilder
+
+            cache = appbuilder.CompletionCache(appbuilder.SqliteCacheBackend("./completion_cache.db"))
+            style_writing = appbuilder.StyleWriting(model="eb-turbo-appbuilder")
+            style_writing.set_completion_cache(cache)
+
+            style_writing(appbuilder.Message("帮我写一篇关于足球的文案"))
+            print(cache.stats())
+            cache.invalidate("style_writing")
+    """
+
+    def __init__(self, backend: Optional[CompletionCacheBackend] = None, max_temperature: float = 0.01):
+        """
+        Args:
+            backend: 存储后端，默认为MemoryCacheBackend
+            max_temperature: 只缓存temperature不超过该值的请求，更高温度的请求结果不确定，直接请求服务
+        """
+
+        self.backend = backend if backend is not None else MemoryCacheBackend()
+        self.max_temperature = max_temperature
+        self._lock = threading.Lock()
+        self._stats = CompletionCacheStats()
+
+    @staticmethod
+    def key(component: str, version: str, payload: Dict[str, Any]) -> str:
+        """
+        生成缓存键，payload为gene_request生成的请求参数
+        """
+
+        canonical = {k: v for k, v in payload.items() if k not in ("user", "response_mode")}
+        digest = hashlib.sha256(
+            json.dumps(canonical, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+            .encode("utf-8")).hexdigest()
+        return "{}/{}/{}".format(component, version, digest)
+
+    def cacheable(self, payload: Dict[str, Any]) -> bool:
+        """
+        请求的temperature是否足够低，结果可以缓存
+        """
+
+        try:
+            temperature = payload["model_config"]["model"]["completion_params"]["temperature"]
+        except (KeyError, TypeError):
+            return False
+        cacheable = temperature <= self.max_temperature
+        if not cacheable:
+            with self._lock:
+                self._stats.bypasses += 1
+        return cacheable
+
+    def get(self, key: str) -> Optional[List[str]]:
+        """
+        读取缓存的answer分片
+        """
+
+        chunks = self.backend.get(key)
+        with self._lock:
+            if chunks is None:
+                self._stats.misses += 1
+            else:
+                self._stats.hits += 1
+        return chunks
+
+    def put(self, key: str, chunks: List[str]):
+        """
+        写入answer分片
+        """
+
+        self.backend.set(key, chunks)
+        with self._lock:
+            self._stats.writes += 1
+
+    def invalidate(self, component: Optional[str] = None, version: Optional[str] = None) -> int:
+        """
+        删除缓存，不指定component时清空全部缓存，返回删除的条目数
+        """
+
+        if component is None:
+            prefix = ""
+        elif version is None:
+            prefix = component + "/"
+        else:
+            prefix = "{}/{}/".format(component, version)
+        count = self.backend.clear(prefix)
+        with self._lock:
+            self._stats.invalidations += count
+        return count
+
+    def stats(self) -> CompletionCacheStats:
+        """
+        返回命中率等统计信息
+        """
+
+        with self._lock:
+            stats = self._stats.copy()
+        total = stats.hits + stats.misses
+        stats.hit_rate = stats.hits / total if total else 0.0
+        return stats
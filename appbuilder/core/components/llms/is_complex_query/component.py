@@ -77,3 +77,9 @@ class IsComplexQuery(CompletionBaseComponent):
             obj:`Message`: 模型运行后的输出消息。
         """
         return super().run(message=message, stream=stream, temperature=temperature)
+
+    async def arun(self, message, stream=False, temperature=1e-10):
+        """
+        run 的异步版本，参数与返回值同 run，stream 为 True 时返回的 content 为异步迭代器。
+        """
+        return await super().arun(message=message, stream=stream, temperature=temperature)
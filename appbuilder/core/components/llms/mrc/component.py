@@ -130,6 +130,32 @@ class MRC(CompletionBaseComponent):
         返回:
             obj:`Message`: 模型运行后的输出消息。
         """
+        request = self._gene_mrc_request(message, context_list, reject, clarify, highlight, friendly, cite,
+                                         stream, temperature)
+        response = self.completion(self.version, self.base_url, request)
+
+        if response.error_no != 0:
+            raise AppBuilderServerException(service_err_code=response.error_no, service_err_message=response.error_msg)
+
+        return response.to_message()
+
+    async def arun(self, message, context_list, reject=False, clarify=False,
+                   highlight=False, friendly=False, cite=False, stream=False, temperature=1e-10):
+        """
+        run 的异步版本，参数与返回值同 run，stream 为 True 时返回的 content 为异步迭代器。
+        """
+        request = self._gene_mrc_request(message, context_list, reject, clarify, highlight, friendly, cite,
+                                         stream, temperature)
+        response = await self.acompletion(self.version, self.base_url, request)
+
+        if response.error_no != 0:
+            raise AppBuilderServerException(service_err_code=response.error_no, service_err_message=response.error_msg)
+
+        return response.to_message()
+
+    def _gene_mrc_request(self, message, context_list, reject, clarify, highlight, friendly, cite,
+                          stream, temperature):
+        """根据问题、段落列表和能力开关生成请求"""
         instruction_set = self.__get_instruction_set()
         context_list = context_list.content
         inputs = {
@@ -147,11 +173,5 @@ class MRC(CompletionBaseComponent):
         response_mode = "streaming" if stream else "blocking"
         user_id = message.id
 
-        request = self.gene_request(query, inputs, response_mode, user_id, model_config)
-        response = self.completion(self.version, self.base_url, request)
-
-        if response.error_no != 0:
-            raise AppBuilderServerException(service_err_code=response.error_no, service_err_message=response.error_msg)
-
-        return response.to_message()
+        return self.gene_request(query, inputs, response_mode, user_id, model_config)
 
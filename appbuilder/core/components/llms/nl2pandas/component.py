@@ -87,3 +87,9 @@ class Nl2pandasComponent(CompletionBaseComponent):
             obj:`Message`: 模型运行后的输出消息。
         """
         return super().run(message=message, table_info=table_info, stream=stream, temperature=temperature)
+
+    async def arun(self, message, table_info=None, stream=False, temperature=1e-10):
+        """
+        run 的异步版本，参数与返回值同 run，stream 为 True 时返回的 content 为异步迭代器。
+        """
+        return await super().arun(message=message, table_info=table_info, stream=stream, temperature=temperature)
@@ -81,7 +81,18 @@ class Playground(CompletionBaseComponent):
         返回:
             obj:`Message`: 模型运行后的输出消息。
         """
+        query_message = self._format_prompt(message)
+        return super().run(message=query_message, stream=stream, temperature=temperature)
 
+    async def arun(self, message, stream=False, temperature=1e-10):
+        """
+        run 的异步版本，参数与返回值同 run，stream 为 True 时返回的 content 为异步迭代器。
+        """
+        query_message = self._format_prompt(message)
+        return await super().arun(message=query_message, stream=stream, temperature=temperature)
+
+    def _format_prompt(self, message):
+        """使用输入消息填充prompt模板"""
         inputs = {}
 
         if isinstance(message.content, str):
@@ -96,8 +107,7 @@ class Playground(CompletionBaseComponent):
                 raise ValueError(f"Missing input variable {key} in message {message.content}")
 
         prompt = self.prompt_template.format(**inputs)
-        query_message = Message(prompt)
-        return super().run(message=query_message, stream=stream, temperature=temperature)
+        return Message(prompt)
 
     def __parse__(self, prompt_template):
         last_end = 0
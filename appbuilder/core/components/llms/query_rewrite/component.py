@@ -110,8 +110,18 @@ class QueryRewrite(CompletionBaseComponent):
             obj:`Message`: 模型运行后的输出消息。
         
         """
+        self._convert_input(message, rewrite_type)
+        return super().run(message=message, rewrite_type=rewrite_type, stream=stream, temperature=temperature)
 
+    async def arun(self, message, rewrite_type="带机器人回复", stream=False, temperature=1e-10):
+        """
+        run 的异步版本，参数与返回值同 run，stream 为 True 时返回的 content 为异步迭代器。
+        """
+        self._convert_input(message, rewrite_type)
+        return await super().arun(message=message, rewrite_type=rewrite_type, stream=stream, temperature=temperature)
 
+    def _convert_input(self, message, rewrite_type):
+        """校验多轮对话输入，并拼接为模型输入"""
         if message is None:
             raise ValueError("输入消息不能为空")
 
@@ -126,5 +136,3 @@ class QueryRewrite(CompletionBaseComponent):
         else:
             converted_input = ''.join([f"User1: {message.content[i]}\n" for i in range(0, len(message.content), 2)])
         message.content = converted_input
-
-        return super().run(message=message, rewrite_type=rewrite_type, stream=stream, temperature=temperature)
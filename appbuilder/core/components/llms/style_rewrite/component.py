@@ -110,3 +110,9 @@ class StyleRewrite(CompletionBaseComponent):
         
         """
         return super().run(message=message, style=style, stream=stream, temperature=temperature)
+
+    async def arun(self, message, style="营销话术", stream=False, temperature=1e-10):
+        """
+        run 的异步版本，参数与返回值同 run，stream 为 True 时返回的 content 为异步迭代器。
+        """
+        return await super().arun(message=message, style=style, stream=stream, temperature=temperature)
@@ -132,3 +132,9 @@ class StyleWriting(CompletionBaseComponent):
             obj:`Message`: 模型运行后的输出消息。
         """
         return super().run(message=message, style_query=style_query, length=length, stream=stream, temperature=temperature)
+
+    async def arun(self, message, style_query="通用", length=100, stream=False, temperature=1e-10):
+        """
+        run 的异步版本，参数与返回值同 run，stream 为 True 时返回的 content 为异步迭代器。
+        """
+        return await super().arun(message=message, style_query=style_query, length=length, stream=stream, temperature=temperature)
@@ -18,3 +18,4 @@ init
 """
 
 from .component import Matching
+from .index import MatchingIndex
@@ -17,7 +17,7 @@ Matching
 # limitations under the License.
 
 
-from typing import List, Union
+from typing import Iterable, List, Optional, Union
 
 import numpy as np
 
@@ -25,6 +25,7 @@ from appbuilder.core.message import Message
 from appbuilder.core.components.embeddings import EmbeddingBaseComponent
 
 from .base import MatchingBaseComponent, MatchingArgs
+from .index import MatchingIndex
 
 
 class Matching(MatchingBaseComponent):
@@ -72,24 +73,35 @@ class Matching(MatchingBaseComponent):
     def run(
         self,
         query: Union[Message[str], str],
-        contexts: Union[Message[List[str]], List[str]]
+        contexts: Union[Message[List[str]], List[str], MatchingIndex]
     ) -> Message[List[str]]:
         """
         Args:
             query: Union[Message[str], str]
-            contexts: Union[Message[List[str]], List[str]]
+            contexts: Union[Message[List[str]], List[str], MatchingIndex]，
+                传入MatchingIndex时复用其中已计算的embedding
         Returns:
-            Message[List[str]]: contexts which has been matched
+            Message[List[str]]: contexts which has been matched，相似度相同时保持原有顺序
         """
 
+        index = contexts if isinstance(contexts, MatchingIndex) else self.build_index(contexts)
         query_embedding = self.embedding_component(query)
-        contexts_embedding = self.embedding_component.batch(contexts)
 
-        sematic = self.semantics(query_embedding, contexts_embedding)
+        _, indices = index.search_embeddings([query_embedding.content])
+        _contexts = index.contexts
+        return Message([_contexts[i] for i in indices[0].tolist()])
+
+    def build_index(self, contexts: Union[Message[List[str]], List[str]]) -> MatchingIndex:
+        """
+        计算文本列表的embedding并构建MatchingIndex，可以在多次run中复用
+
+        Args:
+            contexts: Union[Message[List[str]], List[str]]
+        Returns:
+            MatchingIndex
+        """
 
-        combined = list(zip(sematic.content, contexts.content))
-        sorted_combined = sorted(combined, reverse=True)
-        return Message([item[1] for item in sorted_combined])
+        return MatchingIndex(self.embedding_component, contexts)
 
     def _cosine_similarity(self, X, Y):
         """
@@ -108,26 +120,58 @@ class Matching(MatchingBaseComponent):
 
     def semantics(
         self,
-        query_embedding: Union[Message[List[float]], List[float]],
-        context_embeddings: Union[Message[List[List[float]]], List[List[float]]],
-    ) -> Message[List[float]]:
+        query_embedding: Union[Message[List[float]], List[float], List[List[float]], np.ndarray],
+        context_embeddings: Union[Message[List[List[float]]], List[List[float]], np.ndarray, Iterable[np.ndarray]],
+        chunk_size: Optional[int] = None,
+        dtype=np.float32,
+    ) -> Union[Message[List[float]], Message[np.ndarray]]:
         """
         输入query和context的embedding，输出他们的相似度
         其中：
-            query_embedding是一个长度为 n 的数组，表示仅有一个query
-            context_embeddings是一个长度为 m x n 的矩阵，m表示有m个候选context
+            query_embedding是一个长度为 n 的数组，表示仅有一个query；也可以是 k x n 的矩阵，表示有k个query
+            context_embeddings是一个长度为 m x n 的矩阵，m表示有m个候选context，可以是np.memmap，
+            也可以是按块产出 m_i x n 矩阵的迭代器
 
         Args:
-            query_embedding: Union[Message[List[float]], List[float]]
-            context_embeddings: Union[Message[List[List[float]]], List[List[float]]]
+            query_embedding: Union[Message[List[float]], List[float], List[List[float]], np.ndarray]
+            context_embeddings: Union[Message[List[List[float]]], List[List[float]], np.ndarray, Iterable[np.ndarray]]
+            chunk_size: 每次计算的context数，默认一次计算全部，context较多时分块计算以限制内存占用
+            dtype: 相似度的数据类型，np.float32或np.float16，float16时结果占用的内存减半
         Returns:
-            Message[float] 
+            Message[List[float]]: 单个query时，与每个context的相似度
+            Message[np.ndarray]: 多个query时，形状为 k x m 的相似度矩阵
         """
 
         _query_embedding = query_embedding.content if isinstance(query_embedding, Message) else query_embedding
         _context_embeddings = context_embeddings.content if isinstance(context_embeddings, Message) else context_embeddings
+        if chunk_size is not None and chunk_size < 1:
+            raise ValueError("chunk_size must be greater than 0, but got {}".format(chunk_size))
+        if np.dtype(dtype) not in (np.dtype(np.float16), np.dtype(np.float32)):
+            raise ValueError("dtype must be float16 or float32, but got {}".format(np.dtype(dtype)))
+
+        queries = np.asarray(_query_embedding, dtype=np.float32)
+        single = queries.ndim == 1
+        similarity_matrix = self._similarity_matrix(MatchingIndex.normalize(queries), _context_embeddings,
+                                                    chunk_size, np.dtype(dtype))
+        if single:
+            return Message(similarity_matrix[0].tolist())
+        return Message(similarity_matrix)
 
-        similarity_matrix = self._cosine_similarity([_query_embedding], _context_embeddings)
-        similarity_matrix = similarity_matrix.flatten().tolist()
+    @staticmethod
+    def _similarity_matrix(queries: np.ndarray, contexts, chunk_size: Optional[int], dtype: np.dtype) -> np.ndarray:
+        """
+        分块计算归一化后的query矩阵与context的余弦相似度，每块在float32下计算后写入dtype类型的结果矩阵
+        """
 
-        return Message(similarity_matrix)
+        if not isinstance(contexts, (list, tuple, np.ndarray)):
+            # 按块产出的context，块数未知，逐块计算后拼接
+            blocks = [(queries @ MatchingIndex.normalize(block).T).astype(dtype) for block in contexts]
+            return np.hstack(blocks) if blocks else np.empty((len(queries), 0), dtype=dtype)
+
+        total = len(contexts)
+        chunk_size = chunk_size or max(total, 1)
+        similarity_matrix = np.empty((len(queries), total), dtype=dtype)
+        for start in range(0, total, chunk_size):
+            block = MatchingIndex.normalize(contexts[start:start + chunk_size])
+            similarity_matrix[:, start:start + len(block)] = queries @ block.T
+        return similarity_matrix
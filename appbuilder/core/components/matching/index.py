@@ -0,0 +1,214 @@
+# Copyright (c) 2023 Baidu, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from typing import List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from appbuilder.core.message import Message
+from appbuilder.core.components.embeddings import EmbeddingBaseComponent
+
+
+class MatchingIndex(object):
+    """
+    MatchingIndex
+
+    一次计算并归一化文本列表的embedding，以连续的float32矩阵保存，多个query通过一次矩阵乘法与argpartition取top_k。
+    支持增量添加与删除文本，得分相同时按文本在索引中的位置排序。
+
+    Examples:
+
+        .. code-block:: python
+
+            import appbuilder
+            os.environ["APPBUILDER_TOKEN"] = '...'
+
+            embedding = appbuilder.Embedding()
+            index = appbuilder.MatchingIndex(embedding, ["世界", "你好"])
+
+            scores, indices = index.search(["你好", "世界"], top_k=1)
+            print(indices)
+            # [[1], [0]]
+    """
+
+    def __init__(
+        self,
+        embedding_component: EmbeddingBaseComponent,
+        contexts: Optional[Union[Message[List[str]], List[str]]] = None,
+        embeddings: Optional[Union[Message[List[List[float]]], List[List[float]], np.ndarray]] = None,
+    ):
+        """
+        Args:
+            embedding_component: 用于计算文本的embedding
+            contexts: 初始的文本列表
+            embeddings: contexts对应的embedding，为None时通过embedding_component计算
+        """
+
+        self.embedding_component = embedding_component
+        self._contexts: List[str] = []
+        self._matrix: Optional[np.ndarray] = None
+        self._count = 0
+        if contexts is not None:
+            self.add(contexts, embeddings)
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def contexts(self) -> List[str]:
+        """
+        索引中的文本，search返回的位置对应该列表
+        """
+        return list(self._contexts)
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """
+        归一化后的embedding矩阵，每行对应一个文本
+        """
+        if self._matrix is None:
+            return np.empty((0, 0), dtype=np.float32)
+        return self._matrix[:self._count]
+
+    @staticmethod
+    def normalize(embeddings) -> np.ndarray:
+        """
+        将embedding转为float32矩阵并按行L2归一化
+        """
+        matrix = np.array(embeddings, dtype=np.float32, ndmin=2)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        matrix /= norms
+        return matrix
+
+    def add(
+        self,
+        contexts: Union[Message[List[str]], List[str]],
+        embeddings: Optional[Union[Message[List[List[float]]], List[List[float]], np.ndarray]] = None,
+    ) -> List[int]:
+        """
+        添加文本，只计算新增文本的embedding
+
+        Args:
+            contexts: 新增的文本列表
+            embeddings: contexts对应的embedding，为None时通过embedding_component计算
+        Returns:
+            List[int]: 新增文本在索引中的位置
+        """
+
+        _contexts = list(contexts.content if isinstance(contexts, Message) else contexts)
+        if not _contexts:
+            return []
+        if embeddings is None:
+            embeddings = self.embedding_component.batch(Message(_contexts))
+        _embeddings = embeddings.content if isinstance(embeddings, Message) else embeddings
+        vectors = self.normalize(_embeddings)
+        if len(vectors) != len(_contexts):
+            raise ValueError("got {} embeddings for {} contexts".format(len(vectors), len(_contexts)))
+
+        if self._matrix is None:
+            self._matrix = np.empty((0, vectors.shape[1]), dtype=np.float32)
+        elif vectors.shape[1] != self._matrix.shape[1]:
+            raise ValueError("embedding dims {} mismatch index dims {}".format(vectors.shape[1],
+                                                                             self._matrix.shape[1]))
+        start, end = self._count, self._count + len(vectors)
+        if end > self._matrix.shape[0]:
+            # 按倍数扩容，增量添加的均摊复杂度为 O(1)
+            matrix = np.empty((max(end, 2 * self._matrix.shape[0]), vectors.shape[1]), dtype=np.float32)
+            matrix[:start] = self._matrix[:start]
+            self._matrix = matrix
+        self._matrix[start:end] = vectors
+        self._contexts.extend(_contexts)
+        self._count = end
+        return list(range(start, end))
+
+    def remove(self, indices: Sequence[int]) -> None:
+        """
+        删除指定位置的文本，其余文本保持原有顺序，位置依次前移
+
+        Args:
+            indices: 需要删除的文本在索引中的位置
+        """
+
+        remove = np.zeros(self._count, dtype=bool)
+        remove[np.asarray(indices, dtype=np.int64)] = True
+        if not remove.any():
+            return
+        keep = np.flatnonzero(~remove)
+        self._matrix[:len(keep)] = self._matrix[keep]
+        self._contexts = [self._contexts[i] for i in keep.tolist()]
+        self._count = len(keep)
+
+    def search_embeddings(
+        self,
+        query_embeddings: Union[Message[List[List[float]]], List[List[float]], np.ndarray],
+        top_k: Optional[int] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        根据query的embedding检索
+
+        Args:
+            query_embeddings: 一个或多个query的embedding
+            top_k: 每个query返回的结果数，默认返回全部文本
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: 形状为 (query数, top_k) 的余弦相似度与文本位置，按相似度从高到低排序
+        """
+
+        _embeddings = query_embeddings.content if isinstance(query_embeddings, Message) else query_embeddings
+        queries = self.normalize(_embeddings)
+        k = self._count if top_k is None else min(top_k, self._count)
+        if k < 0:
+            raise ValueError("top_k must not be negative, but got {}".format(top_k))
+        if k == 0:
+            empty = np.empty((len(queries), 0))
+            return empty.astype(np.float32), empty.astype(np.int64)
+
+        scores = queries @ self.matrix.T
+        if k < self._count:
+            indices = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            # argpartition 不保证顺序，按位置排序后再稳定排序，使得分相同时位置小的在前
+            indices.sort(axis=1)
+        else:
+            indices = np.broadcast_to(np.arange(self._count), scores.shape)
+        top_scores = np.take_along_axis(scores, indices, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        return np.take_along_axis(top_scores, order, axis=1), np.take_along_axis(indices, order, axis=1)
+
+    def search(
+        self,
+        queries: Union[Message[str], Message[List[str]], str, List[str]],
+        top_k: Optional[int] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        计算query的embedding后检索，多个query只调用一次embedding_component.batch
+
+        Args:
+            queries: 一个或多个query
+            top_k: 每个query返回的结果数，默认返回全部文本
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: 形状为 (query数, top_k) 的余弦相似度与文本位置
+        """
+
+        _queries = queries.content if isinstance(queries, Message) else queries
+        if self._count == 0:
+            # 索引为空时不需要计算query的embedding
+            rows = 1 if isinstance(_queries, str) else len(_queries)
+            empty = np.empty((rows, 0))
+            return empty.astype(np.float32), empty.astype(np.int64)
+        if isinstance(_queries, str):
+            embeddings = [self.embedding_component(Message(_queries)).content]
+        else:
+            embeddings = self.embedding_component.batch(Message(list(_queries))).content
+        return self.search_embeddings(embeddings, top_k)
@@ -54,16 +54,31 @@ class ObjectRecognition(Component):
                      "score":0.94553,"root":"植物-蔷薇科"},{"keyword":"姬娜果","score":0.730442,"root":"植物-其它"},
                      {"keyword":"红富士","score":0.505194,"root":"植物-其它"}]})
         """
+        req = self._gene_request(message)
+        result = self._recognize(req, timeout, retry)
+        result_dict = proto.Message.to_dict(result)
+        out = ObjectRecognitionOutMsg(**result_dict)
+        return Message(content=out.dict())
+
+    async def arun(self, message: Message, timeout: float = None, retry: int = 0) -> Message:
+        r""" run 的异步版本，参数与返回值同 run
+        """
+        req = self._gene_request(message)
+        result = await self._arecognize(req, timeout, retry)
+        result_dict = proto.Message.to_dict(result)
+        out = ObjectRecognitionOutMsg(**result_dict)
+        return Message(content=out.dict())
+
+    @staticmethod
+    def _gene_request(message: Message) -> ObjectRecognitionRequest:
+        r"""根据输入消息生成通用物体识别请求"""
         inp = ObjectRecognitionInMsg(**message.content)
         req = ObjectRecognitionRequest()
         if inp.raw_image:
             req.image = base64.b64encode(inp.raw_image)
         if inp.url:
             req.url = inp.url
-        result = self._recognize(req, timeout, retry)
-        result_dict = proto.Message.to_dict(result)
-        out = ObjectRecognitionOutMsg(**result_dict)
-        return Message(content=out.dict())
+        return req
 
     def _recognize(self, request: ObjectRecognitionRequest, timeout: float = None,
                   retry: int = 0) -> ObjectRecognitionResponse:
@@ -73,16 +88,32 @@ class ObjectRecognition(Component):
                    返回：
                        response (obj: `ObjectRecognitionResponse`): 通用物体与场景识别返回结果
                """
+        url, headers, data = self._recognize_params(request)
+        if self.retry.total != retry:
+            self.retry.total = retry
+        response = self.s.post(url, headers=headers, data=data, timeout=timeout)
+        return self._parse_response(response)
+
+    async def _arecognize(self, request: ObjectRecognitionRequest, timeout: float = None,
+                          retry: int = 0) -> ObjectRecognitionResponse:
+        r"""_recognize 的异步版本"""
+        url, headers, data = self._recognize_params(request)
+        response = await self._apost(url, headers=headers, data=data, timeout=timeout, retry=retry)
+        return self._parse_response(response)
+
+    def _recognize_params(self, request: ObjectRecognitionRequest):
+        r"""校验请求，返回请求的url、header和body"""
         if not request.image and not request.url:
             raise ValueError("one of image or url must be set")
 
         data = ObjectRecognitionRequest.to_dict(request)
-        if self.retry.total != retry:
-            self.retry.total = retry
         headers = self.auth_header()
         headers['content-type'] = 'application/x-www-form-urlencoded'
         url = self.service_url("/v1/bce/aip/image-classify/v2/advanced_general")
-        response = self.s.post(url, headers=headers, data=data, timeout=timeout)
+        return url, headers, data
+
+    def _parse_response(self, response) -> ObjectRecognitionResponse:
+        r"""检查并解析接口返回"""
         super().check_response_header(response)
         data = response.json()
         super().check_response_json(data)
@@ -18,16 +18,38 @@
 基于baidu ES的retriever
 """
 import importlib
+import itertools
+import math
 import os
+import queue
 import random
 import string
-from typing import Dict, Any
+import threading
+import time
+from typing import Dict, Any, Callable, Iterable, Iterator, List, Optional, Tuple, Union
+from pydantic import BaseModel
+from appbuilder.core._exception import AppBuilderServerException
 from appbuilder.core.component import Component, Message
 from appbuilder.core.components.embeddings.component import Embedding
 from appbuilder.core.constants import GATEWAY_URL
 from appbuilder.utils.logger_util import logger
 
 
+def _embed_batch(embedding, texts: List[str], max_concurrency: int) -> List[List[float]]:
+    """ 批量计算向量，只有 Embedding 支持 max_concurrency，其他 embedding 组件使用默认的 batch """
+    if isinstance(embedding, Embedding):
+        return embedding.batch(Message(texts), max_concurrency=max_concurrency).content
+    return embedding.batch(Message(texts)).content
+
+
+class IngestStats(BaseModel):
+    r"""IngestStats is the progress of BESVectorStoreIndex.add_segments."""
+    indexed: int = 0
+    failed: int = 0
+    elapsed: float = 0.0
+    throughput: float = 0.0
+
+
 class BESVectorStoreIndex:
     """
     BES向量存储检索工具
@@ -35,18 +57,29 @@ class BESVectorStoreIndex:
     base_es_url: str = "/v1/bce/bes/cluster/"
 
     def __init__(self, cluster_id, user_name, password, embedding=None, index_name=None,
-                 index_type="hnsw", prefix="/rpc/2.0/cloud_hub"):
-
+                 index_type="hnsw", prefix="/rpc/2.0/cloud_hub", m: int = 4, ef_construction: int = 200):
+        """
+        参数:
+            m (int): hnsw 索引每个节点的邻居数，越大召回率越高，索引越大、构建越慢
+            ef_construction (int): hnsw 构建索引时的候选集大小，越大索引质量越高，构建越慢
+        """
         if embedding is None:
             embedding = Embedding()
+        if m < 2 or ef_construction < 1:
+            raise ValueError("m must be at least 2 and ef_construction must be greater than 0")
 
         self.embedding = embedding
         self.index_name = index_name if index_name else BESVectorStoreIndex.generate_id()
         self.index_type = index_type
         self.prefix = prefix
+        self.m = m
+        self.ef_construction = ef_construction
 
         self._es = None
         self._helpers = None
+        self._index_created = False
+        # 索引内容每次修改后加一，用于判断检索缓存是否失效
+        self.version = 0
         self.bes_client = self._create_bes_client(cluster_id, user_name, password)
 
     @property
@@ -99,15 +132,35 @@ class BESVectorStoreIndex:
 
         return bes_client
 
-    def as_retriever(self):
+    def as_retriever(self, ef: Optional[int] = None, ef_factor: float = 2.0):
         """
         转化为retriever
+        参数:
+            ef: hnsw 检索时的候选集大小，为 None 时根据 top_k 计算，参见 BESRetriever.search_ef
+            ef_factor: ef 为 None 时 ef 与 top_k 的比例
+        """
+        retriever = BESRetriever(embedding=self.embedding, index_name=self.index_name, bes_client=self.bes_client,
+                                 index_type=self.index_type, ef=ef, ef_factor=ef_factor)
+        retriever.vector_index = self
+        return retriever
+
+    def as_hybrid_retriever(self, fusion: str = "rrf", weights: Tuple[float, float] = (1.0, 1.0), rrf_k: int = 60,
+                            num_candidates: Optional[int] = None, ef: Optional[int] = None, ef_factor: float = 2.0):
         """
-        return BESRetriever(embedding=self.embedding, index_name=self.index_name, bes_client=self.bes_client,
-                            index_type=self.index_type)
+        转化为关键词与向量混合检索的retriever，两路检索通过一次 msearch 请求完成
+        参数:
+            fusion: 融合方式，rrf 或 weighted
+            weights: 关键词与向量检索的权重
+            rrf_k: rrf 的平滑参数
+            num_candidates: 每路检索返回的候选数
+            ef, ef_factor: 向量检索的参数，参见 as_retriever
+        """
+        from appbuilder.core.components.retriever.hybrid_retriever import HybridRetriever
+        return HybridRetriever(self.as_retriever(ef=ef, ef_factor=ef_factor), fusion=fusion, weights=weights,
+                               rrf_k=rrf_k, num_candidates=num_candidates)
 
     @staticmethod
-    def create_index_mappings(index_type, vector_dims):
+    def create_index_mappings(index_type, vector_dims, m=4, ef_construction=200):
         """
         创建索引的mapping
         """
@@ -122,30 +175,129 @@ class BESVectorStoreIndex:
         if index_type == "hnsw":
             mappings["properties"]["vector"]["index_type"] = "hnsw"
             mappings["properties"]["vector"]["space_type"] = "cosine"
-            mappings["properties"]["vector"]["parameters"] = {"m": 4, "ef_construction": 200}
+            mappings["properties"]["vector"]["parameters"] = {"m": m, "ef_construction": ef_construction}
         return mappings
 
-    def add_segments(self, segments: Message, metadata=""):
+    def create_index(self, vector_dims):
+        """
+        创建索引，索引已存在时不做处理，可重复调用
+        参数:
+            vector_dims: 向量维度
+        """
+        if self._index_created:
+            return
+        mappings = BESVectorStoreIndex.create_index_mappings(self.index_type, vector_dims, self.m,
+                                                             self.ef_construction)
+        if not self.bes_client.indices.exists(index=self.index_name):
+            # 并发创建时由服务端判断索引是否已存在
+            resp = self.bes_client.indices.create(
+                index=self.index_name, body={"settings": {"index": {"knn": True}}, "mappings": mappings}, ignore=400)
+            error = resp.get("error") if isinstance(resp, dict) else None
+            if error and (not isinstance(error, dict) or error.get("type") != "resource_already_exists_exception"):
+                raise ValueError("create index {} error: {}".format(self.index_name, error))
+        self._index_created = True
+
+    def add_segments(self, segments: Message, metadata="", embedding_batch_size: int = 256,
+                     chunk_size: int = 500, max_retries: int = 3, initial_backoff: float = 2, prefetch: int = 2,
+                     raise_on_error: bool = True,
+                     progress: Optional[Callable[[IngestStats], None]] = None) -> IngestStats:
         """
         向bes中插入数据
+
+        段落按 embedding_batch_size 分批计算向量，计算下一批向量的同时通过 streaming_bulk 写入上一批，
+        内存中最多保留 prefetch 批数据，段落可以是迭代器，适合导入大量数据。可以多次调用，索引只创建一次。
         参数:
-            query (Message[str]): 需要插入的内容
+            segments (Message[Iterable[str]]): 需要插入的内容
+            metadata: 每条数据的 metadata
+            embedding_batch_size (int): 每批计算向量的段落数
+            chunk_size (int): 每个 bulk 请求的文档数
+            max_retries (int): bulk 请求被限流(429)时的重试次数，重试间隔指数增加
+            initial_backoff (float): 第一次重试前等待的秒数
+            prefetch (int): 等待写入的最大批数
+            raise_on_error (bool): 写入失败时是否抛出异常，为 False 时失败数记录在返回结果中
+            progress (Callable[[IngestStats], None]): 每写入一批后调用，默认输出日志
         返回:
+            IngestStats: 写入的文档数、失败数、耗时与吞吐
         """
-        segment_vectors = self.embedding.batch(segments)
-        segment_vectors = segment_vectors.content
-        vector_dims = len(segment_vectors[0])
-        segments = segments.content
-        documents = [
-            {"_index": self.index_name,
-             "_source": {"text": segment, "vector": vector, "metadata": metadata,
-                         "id": BESVectorStoreIndex.generate_id()}}
-            for segment, vector in zip(segments, segment_vectors)]
-
-        mappings = BESVectorStoreIndex.create_index_mappings(self.index_type, vector_dims)
-        self.bes_client.indices.create(index=self.index_name,
-                                       body={"settings": {"index": {"knn": True}}, "mappings": mappings})
-        self.helpers.bulk(self.bes_client, documents)
+        if embedding_batch_size < 1 or chunk_size < 1 or prefetch < 1:
+            raise ValueError("embedding_batch_size, chunk_size and prefetch must be greater than 0")
+        batches: "queue.Queue" = queue.Queue(maxsize=prefetch)
+        stop = threading.Event()
+        producer = threading.Thread(target=self._embed_batches,
+                                    args=(iter(segments.content), embedding_batch_size, batches, stop),
+                                    name="appbuilder-bes-embedding", daemon=True)
+        producer.start()
+
+        stats = IngestStats()
+        start = time.monotonic()
+        errors = []
+        try:
+            actions = self._iter_actions(batches, metadata)
+            # streaming_bulk 在 raise_on_error=True 时遇到 429 直接抛出而不重试，这里自行汇总失败的文档
+            for ok, item in self.helpers.streaming_bulk(self.bes_client, actions, chunk_size=chunk_size,
+                                                        max_retries=max_retries, initial_backoff=initial_backoff,
+                                                        raise_on_error=False,
+                                                        raise_on_exception=raise_on_error,
+                                                        yield_ok=True):
+                if ok:
+                    stats.indexed += 1
+                else:
+                    stats.failed += 1
+                    errors.append(item)
+                    logger.error("failed to index segment: {}".format(item))
+                done = stats.indexed + stats.failed
+                if done % chunk_size == 0:
+                    self._report(stats, start, progress)
+        finally:
+            self.version += 1
+            stop.set()
+            # unblock the producer if it is waiting on a full queue
+            while producer.is_alive():
+                try:
+                    batches.get_nowait()
+                except queue.Empty:
+                    producer.join(0.1)
+        self._report(stats, start, progress)
+        if errors and raise_on_error:
+            raise self.helpers.BulkIndexError("{} document(s) failed to index.".format(len(errors)), errors)
+        return stats
+
+    def _embed_batches(self, segments: Iterator[str], batch_size: int, batches: "queue.Queue",
+                       stop: threading.Event):
+        try:
+            while not stop.is_set():
+                texts = list(itertools.islice(segments, batch_size))
+                if not texts:
+                    break
+                vectors = self.embedding.batch(Message(texts)).content
+                self.create_index(len(vectors[0]))
+                batches.put((texts, vectors))
+        except Exception as e:
+            batches.put(e)
+            return
+        batches.put(None)
+
+    def _iter_actions(self, batches: "queue.Queue", metadata) -> Iterator[Dict]:
+        while True:
+            batch = batches.get()
+            if batch is None:
+                return
+            if isinstance(batch, Exception):
+                raise batch
+            for segment, vector in zip(*batch):
+                yield {"_index": self.index_name,
+                       "_source": {"text": segment, "vector": vector, "metadata": metadata,
+                                   "id": BESVectorStoreIndex.generate_id()}}
+
+    @staticmethod
+    def _report(stats: IngestStats, start: float, progress: Optional[Callable[[IngestStats], None]]):
+        stats.elapsed = time.monotonic() - start
+        stats.throughput = (stats.indexed + stats.failed) / stats.elapsed if stats.elapsed > 0 else 0.0
+        if progress is not None:
+            progress(stats.copy())
+        else:
+            logger.info("indexed {} segments, {} failed, {:.1f} segments/s".format(
+                stats.indexed, stats.failed, stats.throughput))
 
     @classmethod
     def from_segments(cls, segments, cluster_id, user_name, password, embedding=None, **kwargs):
@@ -167,8 +319,11 @@ class BESVectorStoreIndex:
         index_name = kwargs.get("index_name", None)
         index_type = kwargs.get("index_type", "hnsw")
         prefix = kwargs.get("prefix", "/rpc/2.0/cloud_hub")
+        m = kwargs.get("m", 4)
+        ef_construction = kwargs.get("ef_construction", 200)
 
-        vector_index = cls(cluster_id, user_name, password, embedding, index_name, index_type, prefix)
+        vector_index = cls(cluster_id, user_name, password, embedding, index_name, index_type, prefix, m,
+                           ef_construction)
         vector_index.add_segments(segments)
         return vector_index
 
@@ -182,6 +337,7 @@ class BESVectorStoreIndex:
             }
         }
         resp = self.bes_client.delete_by_query(index=self.index_name, body=query)
+        self.version += 1
         logger.debug("deleted {} documents in index {}".format(resp['deleted'], self.index_name))
 
     def get_all_segments(self):
@@ -220,37 +376,135 @@ class BESRetriever(Component):
     tool_desc: Dict[str, Any] = {"description": "a retriever based on Baidu ElasticSearch"}
     base_es_url: str = "/v1/bce/bes/cluster/"
 
-    def __init__(self, embedding, index_name, bes_client, index_type="hnsw"):
+    min_ef: int = 10
+
+    def __init__(self, embedding, index_name, bes_client, index_type="hnsw", ef: Optional[int] = None,
+                 ef_factor: float = 2.0):
         super().__init__()
+        if ef is not None and ef < 1:
+            raise ValueError("ef must be greater than 0")
+        if ef_factor < 1:
+            raise ValueError("ef_factor must be at least 1")
 
         self.embedding = embedding
         self.index_name = index_name
         self.bes_client = bes_client
         self.index_type = index_type
+        self.ef = ef
+        self.ef_factor = ef_factor
+        # 由 BESVectorStoreIndex.as_retriever 设置，检索缓存据此判断索引是否被修改
+        self.vector_index: Optional[BESVectorStoreIndex] = None
 
-    def run(self, query: Message, top_k: int = 1):
+    def search_ef(self, top_k: int, ef: Optional[int] = None) -> int:
+        """
+        计算 hnsw 检索时的候选集大小
+        参数:
+            top_k (int): 返回的结果数
+            ef (int): 指定的候选集大小，为 None 时使用初始化时的 ef，仍为 None 时取 max(10, top_k * ef_factor)
+        返回:
+            int: 候选集大小，不小于 top_k
+        """
+        if ef is None:
+            ef = self.ef
+        if ef is None:
+            ef = max(self.min_ef, int(math.ceil(top_k * self.ef_factor)))
+        return max(ef, top_k)
+
+    def run(self, query: Message, top_k: int = 1, ef: Optional[int] = None,
+            query_embedding: Optional[List[float]] = None):
         """
         根据query进行查询
         参数:
             query (Message[str]): 需要查询的内容，
             top_k (bool): 查询结果中匹配度最高的top_k个结果
+            ef (int): hnsw 检索时的候选集大小，越大召回率越高、耗时越长，默认根据 top_k 计算
+            query_embedding (List[float]): 已计算好的query向量，须由self.embedding计算，为None时重新计算
         返回:
             obj (Message[Dict]): 查询到的结果，包含文本和匹配得分。
         """
-        query_embedding = self.embedding(query)
-        vector_query = {"vector": query_embedding.content, "k": top_k}
+        if query_embedding is None:
+            query_embedding = self.embedding(query).content
+        query_body = self._query_body(query_embedding, top_k, ef)
+        res = self.bes_client.search(index=self.index_name, body=query_body)
+        return Message(self._parse_hits(res))
+
+    def batch(self, messages: List[Message], top_k: int = 1, ef: Optional[int] = None, fusion: Optional[str] = None,
+              rrf_k: int = 60, max_concurrency: int = 4) -> Union[List[Union[Message, Exception]], Message]:
+        """
+        批量查询，所有 query 一次计算向量，通过一次 msearch 请求检索
+        参数:
+            messages (List[Message[str]]): 需要查询的内容列表
+            top_k (int): 每个 query 返回匹配度最高的 top_k 个结果
+            ef (int): hnsw 检索时的候选集大小，默认根据 top_k 计算
+            fusion (str): 为 "rrf" 时按 reciprocal rank fusion 合并各 query 的结果，返回一个 Message
+            rrf_k (int): reciprocal rank fusion 的平滑参数
+            max_concurrency (int): 计算向量的最大并发请求数，仅对 Embedding 生效
+        返回:
+            List[Message[List[Dict]]]: 按输入顺序返回每个 query 的结果，单个 query 检索失败时对应位置返回异常；
+            fusion 为 "rrf" 时返回合并后的 Message[List[Dict]]，score 为融合得分
+        """
+        if fusion not in (None, "rrf"):
+            raise ValueError("unsupported fusion {}, only rrf is supported".format(fusion))
+        if not messages:
+            return Message([]) if fusion else []
+        texts = [message.content if isinstance(message, Message) else message for message in messages]
+        vectors = _embed_batch(self.embedding, texts, max_concurrency)
+
+        searches = []
+        for vector in vectors:
+            searches.append({"index": self.index_name})
+            searches.append(self._query_body(vector, top_k, ef))
+        res = self.bes_client.msearch(body=searches)
+
+        results = []
+        for i, response in enumerate(res["responses"]):
+            if "error" in response:
+                logger.warning("{} batch item {} failed: {}".format(self.__class__.__name__, i, response["error"]))
+                results.append(AppBuilderServerException(code=response.get("status", ""),
+                                                         message=str(response["error"])))
+            else:
+                results.append(Message(self._parse_hits(response)))
+        if fusion:
+            ranked = [result.content for result in results if not isinstance(result, Exception)]
+            if not ranked and results:
+                raise results[0]
+            return Message(BESRetriever.reciprocal_rank_fusion(ranked, top_k, rrf_k))
+        return results
+
+    @staticmethod
+    def reciprocal_rank_fusion(results: List[List[Dict]], top_k: int, k: int = 60) -> List[Dict]:
+        """
+        按 reciprocal rank fusion 合并多个检索结果，相同文本的得分累加
+        参数:
+            results (List[List[Dict]]): 每个 query 按得分排序的结果
+            top_k (int): 返回的结果数
+            k (int): 平滑参数，得分为 sum(1 / (k + rank))，rank 从 1 开始
+        返回:
+            List[Dict]: 按融合得分排序的结果
+        """
+        fused = {}
+        for docs in results:
+            for rank, doc in enumerate(docs, 1):
+                if doc["text"] not in fused:
+                    fused[doc["text"]] = dict(doc, score=0.0)
+                fused[doc["text"]]["score"] += 1.0 / (k + rank)
+        return sorted(fused.values(), key=lambda doc: -doc["score"])[:top_k]
+
+    def _query_body(self, vector: List[float], top_k: int, ef: Optional[int] = None) -> Dict:
+        vector_query = {"vector": vector, "k": top_k}
         if self.index_type == "linear":
             vector_query["linear"] = True
         else:
-            vector_query["ef"] = 10
+            vector_query["ef"] = self.search_ef(top_k, ef)
 
-        query_body = {
+        return {
             "size": top_k,
             "query": {"knn": {"vector": vector_query}}
         }
-        res = self.bes_client.search(index=self.index_name, body=query_body)
+
+    @staticmethod
+    def _parse_hits(res: Dict) -> List[Dict]:
         docs = []
         for r in res["hits"]["hits"]:
             docs.append({"text": r["_source"]["text"], "meta": r["_source"]["metadata"], "score": r["_score"]})
-
-        return Message(docs)
+        return docs
@@ -0,0 +1,254 @@
+# Copyright (c) 2023 Baidu, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+# -*- coding: utf-8 -*-
+"""
+retriever 检索结果缓存
+"""
+import copy
+import inspect
+import itertools
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from pydantic import BaseModel
+
+from appbuilder.core.component import Component, Message
+from appbuilder.core.components.matching.index import MatchingIndex
+
+
+class RetrievalCacheStats(BaseModel):
+    """CachedRetriever 命中统计"""
+
+    hits: int = 0
+    exact_hits: int = 0
+    semantic_hits: int = 0
+    misses: int = 0
+    hit_rate: float = 0.0
+    evictions: int = 0
+    expirations: int = 0
+    invalidations: int = 0
+    items: int = 0
+
+
+class CachedRetriever(Component):
+    """
+    CachedRetriever
+
+    在任意retriever之前缓存检索结果。query文本与检索参数完全相同时直接从LRU中返回；
+    否则计算query的embedding，与已缓存query的余弦相似度不低于similarity_threshold且检索参数相同时，返回该query的结果。
+    向量索引通过add_segments或delete_all_segments修改后，缓存全部失效。
+
+    语义查找未命中时，若embedding与retriever.embedding相同且retriever.run支持query_embedding参数，
+    已计算的query embedding会直接传给retriever，不再重复计算。
+
+    Examples:
+
+        .. code-block:: python
+
+            import appbuilder
+            os.environ["APPBUILDER_TOKEN"] = '...'
+
+            vector_index = appbuilder.BESVectorStoreIndex.from_segments(segments, cluster_id, username, password)
+            retriever = appbuilder.CachedRetriever(vector_index.as_retriever(), similarity_threshold=0.95)
+
+            retriever(appbuilder.Message("文心一言是什么"), top_k=3)
+            retriever(appbuilder.Message("文心一言是什么？"), top_k=3)  # 语义相近，命中缓存
+            print(retriever.stats())
+    """
+    name: str = "CachedRetriever"
+    tool_desc: Dict[str, Any] = {"description": "a cache in front of a retriever"}
+
+    def __init__(self, retriever: Component, max_items: int = 1000, similarity_threshold: Optional[float] = 0.95,
+                 ttl: Optional[float] = None, vector_index=None, embedding=None):
+        """
+        Args:
+            retriever: 被缓存的retriever，如BESRetriever、LocalRetriever、HybridRetriever
+            max_items: 最多缓存的query数，超出时淘汰最久未访问的query
+            similarity_threshold: 语义命中的余弦相似度阈值，为None时只进行精确匹配
+            ttl: 缓存有效期(秒)，默认永不过期
+            vector_index: retriever检索的向量索引，默认从retriever中获取，索引被修改后缓存失效
+            embedding: 计算query embedding的组件，默认使用retriever.embedding
+        """
+        super().__init__(secret_key=getattr(retriever, "secret_key", None))
+        if max_items < 1:
+            raise ValueError(f"max_items must be greater than 0, but got {max_items}")
+        if similarity_threshold is not None and not -1 <= similarity_threshold <= 1:
+            raise ValueError(f"similarity_threshold must be between -1 and 1, but got {similarity_threshold}")
+        if ttl is not None and ttl <= 0:
+            raise ValueError(f"ttl must be greater than 0, but got {ttl}")
+
+        self.retriever = retriever
+        self.max_items = max_items
+        self.similarity_threshold = similarity_threshold
+        self.ttl = ttl
+        if vector_index is None:
+            vector_index = getattr(retriever, "vector_index", None) or getattr(
+                getattr(retriever, "vector_retriever", None), "vector_index", None)
+        self.vector_index = vector_index
+        self.embedding = embedding if embedding is not None else getattr(retriever, "embedding", None)
+        if similarity_threshold is not None and self.embedding is None:
+            raise ValueError("embedding is required for semantic lookup")
+        # 只有与retriever使用同一个embedding时，计算好的向量才能用于检索
+        self._pass_embedding = (self.embedding is getattr(retriever, "embedding", None)
+                                and "query_embedding" in inspect.signature(retriever.run).parameters)
+
+        self._lock = threading.Lock()
+        # (query, params) -> (entry id, created, content)
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        # entry id -> (query, params)，与 _table 中的文本对应
+        self._keys: Dict[str, tuple] = {}
+        self._table = MatchingIndex(self.embedding)
+        self._ids = itertools.count()
+        self._version = self._index_version()
+        self._stats = RetrievalCacheStats()
+
+    def _index_version(self):
+        return getattr(self.vector_index, "version", None)
+
+    def _check_version(self):
+        version = self._index_version()
+        if version != self._version:
+            if self._entries:
+                self._stats.invalidations += 1
+            self._clear()
+            self._version = version
+
+    def _clear(self):
+        self._entries.clear()
+        self._keys.clear()
+        self._table = MatchingIndex(self.embedding)
+
+    def _remove(self, key: tuple):
+        entry_id = self._entries.pop(key)[0]
+        del self._keys[entry_id]
+        if self.similarity_threshold is not None:
+            self._table.remove([self._table.contexts.index(entry_id)])
+
+    def _expired(self, created: float, now: float) -> bool:
+        return self.ttl is not None and now - created > self.ttl
+
+    def clear(self) -> None:
+        """
+        清空缓存
+        """
+        with self._lock:
+            self._clear()
+
+    def stats(self) -> RetrievalCacheStats:
+        """
+        返回缓存命中统计
+        """
+        with self._lock:
+            stats = self._stats.copy()
+            stats.items = len(self._entries)
+        total = stats.hits + stats.misses
+        stats.hit_rate = stats.hits / total if total else 0.0
+        return stats
+
+    def run(self, query: Message, top_k: int = 1, **kwargs) -> Message:
+        """
+        Args:
+            query (Message[str]): 需要查询的内容
+            top_k (int): 查询结果中匹配度最高的top_k个结果
+            **kwargs: 透传给retriever的其他参数，参数不同的查询互不命中
+        Returns:
+            Message: retriever的查询结果
+        """
+        # 参数可能包含list、dict等不可哈希的值，序列化后作为缓存键
+        params = (top_k, json.dumps(kwargs, sort_keys=True, ensure_ascii=False, default=repr))
+        key = (query.content, params)
+        now = time.time()
+        with self._lock:
+            self._check_version()
+            version = self._version
+            content = self._lookup_exact(key, now)
+        if content is not None:
+            return Message(content)
+
+        vector = None
+        if self.similarity_threshold is not None:
+            vector = self.embedding(query).content
+            with self._lock:
+                self._check_version()
+                content = self._lookup_semantic(vector, params, now)
+            if content is not None:
+                return Message(content)
+
+        with self._lock:
+            self._stats.misses += 1
+        if vector is not None and self._pass_embedding:
+            kwargs["query_embedding"] = vector
+        result = self.retriever(query, top_k=top_k, **kwargs)
+        with self._lock:
+            self._check_version()
+            # 检索期间索引被修改时不缓存结果
+            if self._version == version:
+                self._put(key, vector, now, result.content)
+        return result
+
+    def _get(self, key: tuple, now: float):
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        if self._expired(item[1], now):
+            self._remove(key)
+            self._stats.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        # 返回副本，调用方修改结果不影响缓存
+        return copy.deepcopy(item[2])
+
+    def _lookup_exact(self, key: tuple, now: float):
+        content = self._get(key, now)
+        if content is not None:
+            self._stats.hits += 1
+            self._stats.exact_hits += 1
+        return content
+
+    def _lookup_semantic(self, vector, params: tuple, now: float):
+        if len(self._table) == 0:
+            return None
+        scores, indices = self._table.search_embeddings([vector], top_k=8)
+        contexts = self._table.contexts
+        for score, index in zip(scores[0].tolist(), indices[0].tolist()):
+            if score < self.similarity_threshold:
+                break
+            key = self._keys[contexts[index]]
+            if key[1] != params:
+                continue
+            content = self._get(key, now)
+            if content is not None:
+                self._stats.hits += 1
+                self._stats.semantic_hits += 1
+                return content
+            # 条目已过期并被删除，位置发生变化，不再继续查找
+            return None
+        return None
+
+    def _put(self, key: tuple, vector, now: float, content):
+        if key in self._entries:
+            self._remove(key)
+        entry_id = str(next(self._ids))
+        self._entries[key] = (entry_id, now, copy.deepcopy(content))
+        self._keys[entry_id] = key
+        if vector is not None:
+            self._table.add([entry_id], [vector])
+        while len(self._entries) > self.max_items:
+            self._remove(next(iter(self._entries)))
+            self._stats.evictions += 1
@@ -0,0 +1,323 @@
+# Copyright (c) 2023 Baidu, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+# -*- coding: utf-8 -*-
+"""
+关键词与向量混合检索的retriever
+"""
+import math
+import re
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from pydantic import BaseModel
+
+from appbuilder.core._exception import AppBuilderServerException
+from appbuilder.core.component import Component, Message
+from appbuilder.core.components.retriever.bes_retriever import BESRetriever
+from appbuilder.core.components.retriever.local_retriever import LocalRetriever
+from appbuilder.utils.logger_util import logger
+
+# 与 ES standard analyzer 一致：汉字与平假名按字切分，其余按连续的字母数字切分并转为小写
+_CJK = "\u3040-\u309f\u3400-\u4dbf\u4e00-\u9fff"
+_TOKEN_PATTERN = re.compile(r"[{0}]|[^\W{0}]+".format(_CJK))
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    将文本切分为检索用的词
+    """
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+class HybridSearchStats(BaseModel):
+    r"""HybridSearchStats is the latency in milliseconds of each leg of a hybrid search."""
+    embedding_ms: float = 0.0
+    lexical_ms: float = 0.0
+    vector_ms: float = 0.0
+    fusion_ms: float = 0.0
+    total_ms: float = 0.0
+    lexical_hits: int = 0
+    vector_hits: int = 0
+
+
+class BM25Index(object):
+    """
+    本地 BM25 倒排索引，打分方式与 ES 的 match 查询相同
+
+    Examples:
+
+        .. code-block:: python
+
+            index = appbuilder.BM25Index()
+            index.add(["文心一言大模型", "型号 X-200 的说明书"])
+            print(index.search("x-200", top_k=1))
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        """
+        参数:
+            k1 (float): 词频饱和参数
+            b (float): 文档长度归一化参数
+        """
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._docs: List[Dict] = []
+        self._lengths: List[int] = []
+        self._postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        self._arrays: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, texts: Sequence[str], metadata: Union[Any, Sequence[Any]] = "") -> None:
+        """
+        添加文本
+        参数:
+            texts (Sequence[str]): 文本
+            metadata: 所有文本共用的 metadata，或与 texts 一一对应的列表
+        """
+        metas = metadata if isinstance(metadata, (list, tuple)) else [metadata] * len(texts)
+        with self._lock:
+            for text, meta in zip(texts, metas):
+                doc_id = len(self._docs)
+                counts = Counter(tokenize(text))
+                for token, tf in counts.items():
+                    ids, tfs = self._postings.setdefault(token, ([], []))
+                    ids.append(doc_id)
+                    tfs.append(tf)
+                    self._arrays.pop(token, None)
+                self._docs.append({"text": text, "metadata": meta})
+                self._lengths.append(sum(counts.values()))
+
+    def clear(self) -> None:
+        """
+        清空索引
+        """
+        with self._lock:
+            self._docs, self._lengths, self._postings, self._arrays = [], [], {}, {}
+
+    def search(self, query: str, top_k: int = 10) -> List[Dict]:
+        """
+        检索与 query 相关的文本
+        参数:
+            query (str): 查询内容
+            top_k (int): 返回的结果数
+        返回:
+            List[Dict]: 按 BM25 得分排序的结果，包含文本、metadata 与得分，不包含得分为 0 的文本
+        """
+        with self._lock:
+            count = len(self._docs)
+            if count == 0:
+                return []
+            lengths = np.asarray(self._lengths, dtype=np.float64)
+            norm = self.k1 * (1 - self.b + self.b * lengths / lengths.mean())
+            scores = np.zeros(count)
+            for token in set(tokenize(query)):
+                if token not in self._postings:
+                    continue
+                if token not in self._arrays:
+                    ids, tfs = self._postings[token]
+                    self._arrays[token] = (np.asarray(ids), np.asarray(tfs, dtype=np.float64))
+                ids, tfs = self._arrays[token]
+                idf = math.log(1 + (count - len(ids) + 0.5) / (len(ids) + 0.5))
+                scores[ids] += idf * tfs * (self.k1 + 1) / (tfs + norm[ids])
+            docs = self._docs
+
+        matched = np.flatnonzero(scores)
+        if len(matched) > top_k:
+            matched = matched[np.argpartition(-scores[matched], top_k - 1)[:top_k]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        return [{"text": docs[i]["text"], "meta": docs[i]["metadata"], "score": float(scores[i])}
+                for i in matched.tolist()]
+
+
+def fuse_results(lexical: List[Dict], vector: List[Dict], top_k: int, fusion: str = "rrf",
+                 weights: Tuple[float, float] = (1.0, 1.0), rrf_k: int = 60) -> List[Dict]:
+    """
+    合并关键词与向量检索的结果，相同文本视为同一结果
+    参数:
+        lexical (List[Dict]): 关键词检索结果，按得分排序
+        vector (List[Dict]): 向量检索结果，按得分排序
+        top_k (int): 返回的结果数
+        fusion (str): rrf 按排名融合，得分为 sum(weight / (rrf_k + rank))；
+            weighted 将每路得分按最大最小值归一化后加权求和
+        weights (Tuple[float, float]): 关键词与向量检索的权重
+        rrf_k (int): rrf 的平滑参数
+    返回:
+        List[Dict]: 按融合得分排序的结果，lexical_score 与 vector_score 为原始得分，未命中时为 None
+    """
+    if fusion not in ("rrf", "weighted"):
+        raise ValueError("fusion must be rrf or weighted, but got {}".format(fusion))
+    fused = {}
+    for leg, docs, weight in (("lexical_score", lexical, weights[0]), ("vector_score", vector, weights[1])):
+        if not docs:
+            continue
+        high, low = max(doc["score"] for doc in docs), min(doc["score"] for doc in docs)
+        for rank, doc in enumerate(docs, 1):
+            if doc["text"] not in fused:
+                fused[doc["text"]] = {"text": doc["text"], "meta": doc["meta"], "score": 0.0,
+                                      "lexical_score": None, "vector_score": None}
+            item = fused[doc["text"]]
+            item[leg] = doc["score"]
+            if fusion == "rrf":
+                item["score"] += weight / (rrf_k + rank)
+            else:
+                item["score"] += weight * ((doc["score"] - low) / (high - low) if high > low else 1.0)
+    return sorted(fused.values(), key=lambda doc: -doc["score"])[:top_k]
+
+
+class HybridRetriever(Component):
+    """
+    关键词与向量混合检索组件，同时进行 BM25(match) 检索与向量检索并融合结果，提高型号、名称等精确词的召回
+
+    基于 BESVectorStoreIndex 时，两路检索通过一次 msearch 请求完成，关键词检索使用索引中的 text 字段；
+    基于 LocalVectorStoreIndex 时，关键词检索使用本地 BM25 倒排索引。每次检索的各路耗时记录在 last_stats 中。
+
+    Examples:
+
+        .. code-block:: python
+
+            import appbuilder
+            os.environ["APPBUILDER_TOKEN"] = '...'
+
+            segments = appbuilder.Message(["文心一言大模型", "型号 X-200 的说明书"])
+            vector_index = appbuilder.BESVectorStoreIndex.from_segments(segments, cluster_id, username, password)
+            retriever = vector_index.as_hybrid_retriever(fusion="weighted", weights=(0.3, 0.7))
+            res = retriever(appbuilder.Message("X-200"), top_k=1)
+            print(retriever.last_stats)
+    """
+    name: str = "HybridRetriever"
+    tool_desc: Dict[str, Any] = {"description": "a retriever combining keyword and vector search"}
+
+    def __init__(self, vector_retriever: Union[BESRetriever, LocalRetriever],
+                 lexical_index: Optional[BM25Index] = None, fusion: str = "rrf",
+                 weights: Tuple[float, float] = (1.0, 1.0), rrf_k: int = 60, num_candidates: Optional[int] = None):
+        """
+        参数:
+            vector_retriever: BESRetriever 或 LocalRetriever
+            lexical_index (BM25Index): vector_retriever 为 LocalRetriever 时的关键词索引，默认根据向量索引中的文本构建，
+                并在向量索引修改后自动同步；传入的索引由调用方维护，不会被写入或清空
+            fusion (str): 融合方式，rrf 或 weighted
+            weights (Tuple[float, float]): 关键词与向量检索的权重
+            rrf_k (int): rrf 的平滑参数
+            num_candidates (int): 每路检索返回的候选数，默认为 max(10, 2 * top_k)
+        """
+        super().__init__(secret_key=getattr(vector_retriever, "secret_key", None))
+        if fusion not in ("rrf", "weighted"):
+            raise ValueError("fusion must be rrf or weighted, but got {}".format(fusion))
+        if len(weights) != 2 or min(weights) < 0:
+            raise ValueError("weights must be two non-negative numbers, but got {}".format(weights))
+        if num_candidates is not None and num_candidates < 1:
+            raise ValueError("num_candidates must be greater than 0")
+
+        self.vector_retriever = vector_retriever
+        self.embedding = vector_retriever.embedding
+        self.fusion = fusion
+        self.weights = tuple(weights)
+        self.rrf_k = rrf_k
+        self.num_candidates = num_candidates
+        self.last_stats: Optional[HybridSearchStats] = None
+        self.lexical_index = lexical_index
+        self._sync_lock = threading.Lock()
+        self._synced = 0
+        self._synced_version = None
+        self._synced_last_id = None
+        # 只同步自行构建的关键词索引
+        self._owns_lexical_index = isinstance(vector_retriever, LocalRetriever) and lexical_index is None
+        if self._owns_lexical_index:
+            self.lexical_index = BM25Index()
+            self._sync_lexical_index()
+
+    def _sync_lexical_index(self):
+        """ 向量索引被修改后同步关键词索引：只新增文本时增量添加，否则重建 """
+        vector_index = self.vector_retriever.vector_index
+        with self._sync_lock:
+            version = vector_index.version
+            if version == self._synced_version:
+                return
+            segments = vector_index.get_all_segments()
+            # 已同步的文本仍是索引的前缀时只添加新增的部分，删除后重新写入的文本可能数量更多，需要比对
+            synced = self._synced
+            if synced > len(segments) or (synced and segments[synced - 1]["id"] != self._synced_last_id):
+                self.lexical_index.clear()
+                synced = 0
+            new = segments[synced:]
+            self.lexical_index.add([s["text"] for s in new], [s["metadata"] for s in new])
+            self._synced = len(segments)
+            self._synced_last_id = segments[-1]["id"] if segments else None
+            self._synced_version = version
+
+    def run(self, query: Message, top_k: int = 1, query_embedding: Optional[List[float]] = None) -> Message:
+        """
+        根据query进行混合检索
+        参数:
+            query (Message[str]): 需要查询的内容
+            top_k (int): 返回融合后匹配度最高的top_k个结果
+            query_embedding (List[float]): 已计算好的query向量，须由self.embedding计算，为None时重新计算
+        返回:
+            obj (Message[List[Dict]]): 查询到的结果，包含文本、融合得分，以及关键词与向量检索的原始得分
+        """
+        start = time.perf_counter()
+        stats = HybridSearchStats()
+        size = self.num_candidates or max(10, 2 * top_k)
+        if query_embedding is None:
+            query_embedding = self.embedding(query).content
+        stats.embedding_ms = (time.perf_counter() - start) * 1000
+
+        if isinstance(self.vector_retriever, BESRetriever):
+            lexical, vector = self._search_bes(query.content, query_embedding, size, stats)
+        else:
+            lexical, vector = self._search_local(query.content, query_embedding, size, stats)
+        stats.lexical_hits, stats.vector_hits = len(lexical), len(vector)
+
+        fusion_start = time.perf_counter()
+        docs = fuse_results(lexical, vector, top_k, self.fusion, self.weights, self.rrf_k)
+        end = time.perf_counter()
+        stats.fusion_ms = (end - fusion_start) * 1000
+        stats.total_ms = (end - start) * 1000
+        self.last_stats = stats
+        logger.debug("hybrid search: {}".format(stats))
+        return Message(docs)
+
+    def _search_bes(self, text: str, vector: List[float], size: int, stats: HybridSearchStats):
+        retriever = self.vector_retriever
+        searches = [{"index": retriever.index_name}, {"size": size, "query": {"match": {"text": text}}},
+                    {"index": retriever.index_name}, retriever._query_body(vector, size)]
+        res = retriever.bes_client.msearch(body=searches)
+        results = []
+        for leg, response in zip(("lexical", "vector"), res["responses"]):
+            if "error" in response:
+                raise AppBuilderServerException(code=response.get("status", ""),
+                                                message="{} search error: {}".format(leg, response["error"]))
+            # took 为服务端的检索耗时，两路检索在一次请求中完成
+            setattr(stats, leg + "_ms", float(response.get("took", 0)))
+            results.append(BESRetriever._parse_hits(response))
+        return results
+
+    def _search_local(self, text: str, vector: List[float], size: int, stats: HybridSearchStats):
+        start = time.perf_counter()
+        if self._owns_lexical_index:
+            self._sync_lexical_index()
+        lexical = self.lexical_index.search(text, size)
+        middle = time.perf_counter()
+        vector_docs = self.vector_retriever.vector_index.search([vector], size)[0]
+        stats.lexical_ms = (middle - start) * 1000
+        stats.vector_ms = (time.perf_counter() - middle) * 1000
+        return lexical, vector_docs
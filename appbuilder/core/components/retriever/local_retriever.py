@@ -0,0 +1,450 @@
+# Copyright (c) 2023 Baidu, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+# -*- coding: utf-8 -*-
+"""
+基于本地向量矩阵的retriever
+"""
+import itertools
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from appbuilder.core.component import Component, Message
+from appbuilder.core.components.embeddings.component import Embedding
+from appbuilder.core.components.retriever.bes_retriever import BESRetriever, BESVectorStoreIndex, IngestStats, \
+    _embed_batch
+from appbuilder.utils.logger_util import logger
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _top_k(scores: np.ndarray, k: int):
+    """ 返回每行得分最高的 k 个下标与得分，按得分从高到低排序 """
+    if k < scores.shape[1]:
+        index = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(scores, index, axis=1)
+    else:
+        index = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    order = np.argsort(-scores, axis=1, kind="stable")
+    return np.take_along_axis(index, order, axis=1), np.take_along_axis(scores, order, axis=1)
+
+
+class LocalVectorStoreIndex:
+    """
+    本地向量存储检索工具，接口与 BESVectorStoreIndex 相同，检索在进程内完成
+
+    向量归一化后以 float32 矩阵保存，指定 path 时追加写入磁盘文件并以内存映射方式读取，重新打开时直接加载。
+    默认 flat 方式精确检索，分块计算相似度并用 argpartition 取 top_k；语料较大时可以使用 ivf 方式，
+    先用 k-means 将向量划分到 nlist 个簇，检索时只计算最近的 nprobe 个簇内的向量。
+
+    Examples:
+
+        .. code-block:: python
+
+            import appbuilder
+            os.environ["APPBUILDER_TOKEN"] = '...'
+
+            segments = appbuilder.Message(["文心一言大模型", "百度在线科技有限公司"])
+            vector_index = appbuilder.LocalVectorStoreIndex.from_segments(segments, path="./vector_index")
+            retriever = vector_index.as_retriever()
+            res = retriever(appbuilder.Message("文心一言"), top_k=1)
+    """
+    block_size: int = 65536
+    ivf_min_segments: int = 1000
+
+    def __init__(self, embedding=None, path: Optional[str] = None, index_type: str = "flat",
+                 nlist: Optional[int] = None, nprobe: int = 8):
+        """
+        参数:
+            embedding: 文本段落embedding工具，默认为Embedding
+            path (str): 索引保存的目录，为 None 时只保存在内存中
+            index_type (str): flat 精确检索，ivf 近似检索，段落数少于 ivf_min_segments 时仍然精确检索
+            nlist (int): ivf 的簇数，默认为段落数的平方根
+            nprobe (int): ivf 检索时计算的簇数，越大召回率越高、耗时越长
+        """
+        if embedding is None:
+            embedding = Embedding()
+        if index_type not in ("flat", "ivf"):
+            raise ValueError("index_type must be flat or ivf, but got {}".format(index_type))
+        if nprobe < 1 or (nlist is not None and nlist < 1):
+            raise ValueError("nlist and nprobe must be greater than 0")
+
+        self.embedding = embedding
+        self.path = path
+        self.index_type = index_type
+        self.nlist = nlist
+        self.nprobe = nprobe
+
+        self._lock = threading.RLock()
+        self._dims = None
+        self._count = 0
+        self._matrix = None
+        self._segments: List[Dict] = []
+        self._ivf = None
+        # segments.jsonl 中已提交段落的字节数
+        self._segments_size = 0
+        # 索引内容每次修改后加一，用于判断检索缓存是否失效
+        self.version = 0
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+            self._load()
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _load(self):
+        if not os.path.exists(self._file("index.json")):
+            return
+        with open(self._file("index.json")) as f:
+            meta = json.load(f)
+        self._dims, self._count = meta["dims"], meta["count"]
+        # index.json 最后写入，写入中断时多出的向量与段落以其中的数量为准，截断后再追加
+        with open(self._file("segments.jsonl"), "r+", encoding="utf-8") as f:
+            self._segments = [json.loads(line) for line in itertools.islice(f, self._count)]
+            f.seek(0)
+            self._segments_size = sum(len(f.readline().encode("utf-8")) for _ in range(self._count))
+        self._truncate_files()
+
+    def _truncate_files(self):
+        """ 将磁盘文件截断到已提交的段落数 """
+        for name, size in (("vectors.f32", self._count * (self._dims or 0) * 4),
+                           ("segments.jsonl", self._segments_size)):
+            if os.path.exists(self._file(name)):
+                with open(self._file(name), "r+b") as f:
+                    f.truncate(size)
+
+    def _save_meta(self):
+        tmp = self._file("index.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump({"dims": self._dims, "count": self._count}, f)
+        os.replace(tmp, self._file("index.json"))
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """
+        归一化后的向量矩阵，每行对应一个段落
+        """
+        with self._lock:
+            if self._count == 0:
+                return np.empty((0, self._dims or 0), dtype=np.float32)
+            if self.path is None:
+                return self._matrix[:self._count]
+            if self._matrix is None or self._matrix.shape[0] != self._count:
+                self._matrix = np.memmap(self._file("vectors.f32"), dtype=np.float32, mode="r",
+                                         shape=(self._count, self._dims))
+            return self._matrix
+
+    def __len__(self):
+        return self._count
+
+    def as_retriever(self):
+        """
+        转化为retriever
+        """
+        return LocalRetriever(embedding=self.embedding, vector_index=self)
+
+    def as_hybrid_retriever(self, fusion: str = "rrf", weights: Tuple[float, float] = (1.0, 1.0), rrf_k: int = 60,
+                            num_candidates: Optional[int] = None):
+        """
+        转化为关键词与向量混合检索的retriever，关键词检索使用根据索引中的文本构建的本地 BM25 索引
+        参数:
+            fusion: 融合方式，rrf 或 weighted
+            weights: 关键词与向量检索的权重
+            rrf_k: rrf 的平滑参数
+            num_candidates: 每路检索返回的候选数
+        """
+        from appbuilder.core.components.retriever.hybrid_retriever import HybridRetriever
+        return HybridRetriever(self.as_retriever(), fusion=fusion, weights=weights, rrf_k=rrf_k,
+                               num_candidates=num_candidates)
+
+    def add_segments(self, segments: Message, metadata="", embedding_batch_size: int = 256,
+                     progress: Optional[Callable[[IngestStats], None]] = None) -> IngestStats:
+        """
+        向索引中插入数据，段落按 embedding_batch_size 分批计算向量后写入
+        参数:
+            segments (Message[Iterable[str]]): 需要插入的内容
+            metadata: 每条数据的 metadata
+            embedding_batch_size (int): 每批计算向量的段落数
+            progress (Callable[[IngestStats], None]): 每写入一批后调用
+        返回:
+            IngestStats: 写入的段落数、耗时与吞吐
+        """
+        if embedding_batch_size < 1:
+            raise ValueError("embedding_batch_size must be greater than 0")
+        stats = IngestStats()
+        start = time.monotonic()
+        contents = iter(segments.content)
+        while True:
+            texts = list(itertools.islice(contents, embedding_batch_size))
+            if not texts:
+                break
+            vectors = self.embedding.batch(Message(texts)).content
+            self.add_vectors(texts, vectors, metadata)
+            stats.indexed += len(texts)
+            stats.elapsed = time.monotonic() - start
+            stats.throughput = stats.indexed / stats.elapsed if stats.elapsed > 0 else 0.0
+            if progress is not None:
+                progress(stats.copy())
+        logger.debug("indexed {} segments in {:.3f}s".format(stats.indexed, time.monotonic() - start))
+        return stats
+
+    def add_vectors(self, texts: Sequence[str], vectors: Union[Sequence[Sequence[float]], np.ndarray],
+                    metadata=""):
+        """
+        插入已经计算好向量的段落
+        参数:
+            texts (Sequence[str]): 段落
+            vectors: 段落的向量，与 texts 一一对应
+            metadata: 每条数据的 metadata
+        """
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32).reshape(len(texts), -1))
+        records = [{"id": BESVectorStoreIndex.generate_id(), "text": text, "metadata": metadata} for text in texts]
+        # 写入前先序列化，metadata 无法序列化时不修改任何文件
+        lines = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records).encode("utf-8") \
+            if self.path is not None else b""
+        with self._lock:
+            if self._dims is not None and vectors.shape[1] != self._dims:
+                raise ValueError("vector dims {} mismatch index dims {}".format(vectors.shape[1], self._dims))
+            dims = self._dims
+            self._dims = vectors.shape[1]
+            try:
+                if self.path is None:
+                    self._append_memory(vectors)
+                else:
+                    with open(self._file("vectors.f32"), "ab") as f:
+                        f.write(vectors.tobytes())
+                    with open(self._file("segments.jsonl"), "ab") as f:
+                        f.write(lines)
+            except BaseException:
+                # 写入失败时回到已提交的状态，避免之后的向量与段落错位
+                self._dims = dims
+                if self.path is not None:
+                    self._truncate_files()
+                raise
+            self._segments_size += len(lines)
+            self._segments.extend(records)
+            self._count += len(records)
+            self.version += 1
+            if self.path is not None:
+                self._save_meta()
+
+    def _append_memory(self, vectors: np.ndarray):
+        capacity = 0 if self._matrix is None else self._matrix.shape[0]
+        if self._count + len(vectors) > capacity:
+            # 按倍数扩容，追加的均摊复杂度为 O(1)
+            matrix = np.empty((max(2 * capacity, self._count + len(vectors), 1024), self._dims), dtype=np.float32)
+            if self._count:
+                matrix[:self._count] = self._matrix[:self._count]
+            self._matrix = matrix
+        self._matrix[self._count:self._count + len(vectors)] = vectors
+
+    def search(self, vectors: Union[Sequence[Sequence[float]], np.ndarray], top_k: int = 1) -> List[List[Dict]]:
+        """
+        按向量检索
+        参数:
+            vectors: 一个或多个 query 的向量
+            top_k (int): 每个 query 返回匹配度最高的 top_k 个结果
+        返回:
+            List[List[Dict]]: 每个 query 的结果，包含文本、metadata 与余弦相似度
+        """
+        if top_k < 1:
+            raise ValueError("top_k must be greater than 0")
+        queries = np.asarray(vectors, dtype=np.float32)
+        queries = _normalize(queries.reshape(1, -1) if queries.ndim == 1 else queries)
+        with self._lock:
+            matrix, segments = self.matrix, self._segments[:self._count]
+            ivf = self._ivf_lists(matrix) if self.index_type == "ivf" else None
+        if not segments:
+            return [[] for _ in range(len(queries))]
+        if queries.shape[1] != matrix.shape[1]:
+            raise ValueError("query dims {} mismatch index dims {}".format(queries.shape[1], matrix.shape[1]))
+
+        if ivf is None:
+            hits = self._flat_search(matrix, queries, min(top_k, len(segments)))
+        else:
+            hits = self._ivf_search(matrix, ivf, queries, top_k)
+        return [[{"text": segments[i]["text"], "meta": segments[i]["metadata"], "score": float(score)}
+                 for i, score in zip(index, scores)] for index, scores in hits]
+
+    def _flat_search(self, matrix: np.ndarray, queries: np.ndarray, k: int):
+        best_index, best_scores = None, None
+        # 分块计算，内存占用与段落数无关
+        for start in range(0, matrix.shape[0], self.block_size):
+            index, scores = _top_k(queries @ matrix[start:start + self.block_size].T, k)
+            index = index + start
+            if best_index is not None:
+                index, scores = np.hstack([best_index, index]), np.hstack([best_scores, scores])
+                top, scores = _top_k(scores, k)
+                index = np.take_along_axis(index, top, axis=1)
+            best_index, best_scores = index, scores
+        return list(zip(best_index.tolist(), best_scores.tolist()))
+
+    def _ivf_lists(self, matrix: np.ndarray):
+        """ 返回 (簇中心, 每个簇的段落下标)，段落数翻倍后重新聚类，否则只划分新增的段落 """
+        count = matrix.shape[0]
+        if count < self.ivf_min_segments:
+            return None
+        if self._ivf is None or count > 2 * self._ivf["trained"]:
+            nlist = min(self.nlist or int(np.sqrt(count)), count)
+            self._ivf = {"centroids": self._kmeans(matrix, nlist), "trained": count, "count": 0,
+                         "lists": [np.empty(0, dtype=np.int64) for _ in range(nlist)]}
+        ivf = self._ivf
+        if ivf["count"] < count:
+            assign = np.concatenate([np.argmax(matrix[start:min(start + self.block_size, count)] @ ivf["centroids"].T,
+                                               axis=1)
+                                     for start in range(ivf["count"], count, self.block_size)])
+            order = np.argsort(assign, kind="stable")
+            bounds = np.searchsorted(assign[order], np.arange(len(ivf["lists"]) + 1))
+            ivf["lists"] = [np.concatenate([ids, order[bounds[c]:bounds[c + 1]] + ivf["count"]])
+                            for c, ids in enumerate(ivf["lists"])]
+            ivf["count"] = count
+        return ivf["centroids"], ivf["lists"]
+
+    @staticmethod
+    def _kmeans(matrix: np.ndarray, nlist: int, iterations: int = 10) -> np.ndarray:
+        rng = np.random.RandomState(0)
+        sample = matrix[np.sort(rng.choice(matrix.shape[0], min(matrix.shape[0], nlist * 64), replace=False))]
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            # 空簇保留原来的中心
+            filled = np.bincount(assign, minlength=nlist) > 0
+            centroids[filled] = _normalize(sums[filled])
+        return centroids
+
+    def _ivf_search(self, matrix: np.ndarray, ivf, queries: np.ndarray, top_k: int):
+        centroids, lists = ivf
+        probes, _ = _top_k(queries @ centroids.T, min(self.nprobe, len(lists)))
+        hits = []
+        for query, probe in zip(queries, probes):
+            ids = np.sort(np.concatenate([lists[c] for c in probe]))
+            if len(ids) == 0:
+                hits.append(([], []))
+                continue
+            index, scores = _top_k((matrix[ids] @ query)[np.newaxis], min(top_k, len(ids)))
+            hits.append((ids[index[0]].tolist(), scores[0].tolist()))
+        return hits
+
+    @classmethod
+    def from_segments(cls, segments, embedding=None, **kwargs):
+        """
+        根据段落创建一个本地向量索引
+        参数：
+            segments: 切分的文本段落
+            embedding: 文本段落embedding工具
+            kwargs: 其他初始化参数，path、index_type、nlist、nprobe
+        返回：
+            本地索引实例
+        """
+        vector_index = cls(embedding=embedding, **kwargs)
+        vector_index.add_segments(segments)
+        return vector_index
+
+    def delete_all_segments(self):
+        """
+        删除索引中的全部内容
+        """
+        with self._lock:
+            deleted = self._count
+            self.version += 1
+            self._dims, self._count, self._matrix, self._segments, self._ivf = None, 0, None, [], None
+            self._segments_size = 0
+            if self.path is not None:
+                for name in ("vectors.f32", "segments.jsonl", "index.json"):
+                    if os.path.exists(self._file(name)):
+                        os.remove(self._file(name))
+        logger.debug("deleted {} segments in local index".format(deleted))
+
+    def get_all_segments(self) -> List[Dict]:
+        """
+        获取索引中的全部内容
+        """
+        with self._lock:
+            return [dict(segment) for segment in self._segments]
+
+
+class LocalRetriever(Component):
+    """
+    本地向量检索组件，用于检索和query相匹配的内容
+
+    Examples:
+
+        .. code-block:: python
+
+            import appbuilder
+            os.environ["APPBUILDER_TOKEN"] = '...'
+
+            segments = appbuilder.Message(["文心一言大模型", "百度在线科技有限公司"])
+            vector_index = appbuilder.LocalVectorStoreIndex.from_segments(segments)
+            retriever = vector_index.as_retriever()
+            res = retriever(appbuilder.Message("文心一言"))
+    """
+    name: str = "LocalVectorRetriever"
+    tool_desc: Dict[str, Any] = {"description": "a retriever based on local vector index"}
+
+    def __init__(self, embedding, vector_index: LocalVectorStoreIndex):
+        super().__init__(secret_key=getattr(embedding, "secret_key", None))
+
+        self.embedding = embedding
+        self.vector_index = vector_index
+
+    def run(self, query: Message, top_k: int = 1, query_embedding: Optional[List[float]] = None):
+        """
+        根据query进行查询
+        参数:
+            query (Message[str]): 需要查询的内容，
+            top_k (int): 查询结果中匹配度最高的top_k个结果
+            query_embedding (List[float]): 已计算好的query向量，须由self.embedding计算，为None时重新计算
+        返回:
+            obj (Message[Dict]): 查询到的结果，包含文本和匹配得分。
+        """
+        if query_embedding is None:
+            query_embedding = self.embedding(query).content
+        return Message(self.vector_index.search([query_embedding], top_k)[0])
+
+    def batch(self, messages: List[Message], top_k: int = 1, fusion: Optional[str] = None, rrf_k: int = 60,
+              max_concurrency: int = 4) -> Union[List[Message], Message]:
+        """
+        批量查询，所有 query 一次计算向量，通过一次矩阵乘法检索
+        参数:
+            messages (List[Message[str]]): 需要查询的内容列表
+            top_k (int): 每个 query 返回匹配度最高的 top_k 个结果
+            fusion (str): 为 "rrf" 时按 reciprocal rank fusion 合并各 query 的结果，返回一个 Message
+            rrf_k (int): reciprocal rank fusion 的平滑参数
+            max_concurrency (int): 计算向量的最大并发请求数，仅对 Embedding 生效
+        返回:
+            List[Message[List[Dict]]]: 按输入顺序返回每个 query 的结果；fusion 为 "rrf" 时返回合并后的结果
+        """
+        if fusion not in (None, "rrf"):
+            raise ValueError("unsupported fusion {}, only rrf is supported".format(fusion))
+        if not messages:
+            return Message([]) if fusion else []
+        texts = [message.content if isinstance(message, Message) else message for message in messages]
+        vectors = _embed_batch(self.embedding, texts, max_concurrency)
+        results = self.vector_index.search(vectors, top_k)
+        if fusion:
+            return Message(BESRetriever.reciprocal_rank_fusion(results, top_k, rrf_k))
+        return [Message(docs) for docs in results]
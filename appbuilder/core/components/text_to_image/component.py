@@ -14,6 +14,7 @@
 
 r"""Text2Image component.
 """
+import asyncio
 import time
 import json
 
@@ -57,12 +58,7 @@ class Text2Image(Component):
         返回:
             obj:`Message`: 输出生成图片的url。举例: Message(content={"img_urls": ["xxx"]})。
         """
-        inp = Text2ImageInMessage(**message.content)
-        text2ImageSubmitRequest = Text2ImageSubmitRequest()
-        text2ImageSubmitRequest.prompt = inp.prompt
-        text2ImageSubmitRequest.width = width
-        text2ImageSubmitRequest.height = height
-        text2ImageSubmitRequest.image_num = image_num
+        text2ImageSubmitRequest = self._gene_submit_request(message, width, height, image_num)
         text2ImageSubmitResponse = self.submitText2ImageTask(text2ImageSubmitRequest)
         taskId = text2ImageSubmitResponse.data.primary_task_id
         if taskId is not None:
@@ -79,6 +75,41 @@ class Text2Image(Component):
             out = Text2ImageOutMessage(img_urls=img_urls)
             return Message(content=dict(out))
 
+    async def arun(self, message: Message, width: int = 1024, height: int = 1024, image_num: int = 1,
+                   timeout: float = None, retry: int = 0):
+        """
+        run 的异步版本，参数与返回值同 run，轮询任务进度时不阻塞事件循环。
+        """
+        text2ImageSubmitRequest = self._gene_submit_request(message, width, height, image_num)
+        text2ImageSubmitResponse = await self.asubmitText2ImageTask(text2ImageSubmitRequest)
+        taskId = text2ImageSubmitResponse.data.primary_task_id
+        if taskId is not None:
+            while True:
+                request = Text2ImageQueryRequest()
+                request.task_id = taskId
+                text2ImageQueryResponse = await self.aqueryText2ImageData(request)
+                if text2ImageQueryResponse.data.task_progress is not None:
+                    task_progress = text2ImageQueryResponse.data.task_progress
+                    if task_progress == 1:
+                        break
+                    await asyncio.sleep(0.2)
+            img_urls = self.extract_img_urls(text2ImageQueryResponse)
+            out = Text2ImageOutMessage(img_urls=img_urls)
+            return Message(content=dict(out))
+
+    @staticmethod
+    def _gene_submit_request(message: Message, width: int, height: int, image_num: int) -> Text2ImageSubmitRequest:
+        """
+        根据输入消息生成AI作画任务请求。
+        """
+        inp = Text2ImageInMessage(**message.content)
+        text2ImageSubmitRequest = Text2ImageSubmitRequest()
+        text2ImageSubmitRequest.prompt = inp.prompt
+        text2ImageSubmitRequest.width = width
+        text2ImageSubmitRequest.height = height
+        text2ImageSubmitRequest.image_num = image_num
+        return text2ImageSubmitRequest
+
     def submitText2ImageTask(self, request: Text2ImageSubmitRequest, timeout: float = None,
                            retry: int = 0) -> Text2ImageSubmitResponse:
 
@@ -100,14 +131,19 @@ class Text2Image(Component):
         if retry != self.retry.total:
             self.retry.total = retry
         response = self.s.post(url, data=data, headers=headers, timeout=timeout)
-        super().check_response_header(response)
-        data = response.json()
-        super().check_response_json(data)
-        self.__class__.check_service_error(data)
-        request_id = response.headers.get('X-Appbuilder-Request-Id')
-        response = Text2ImageSubmitResponse.from_json(payload=json.dumps(data))
-        response.request_id = request_id
-        return response
+        return self._parse_response(response, Text2ImageSubmitResponse)
+
+    async def asubmitText2ImageTask(self, request: Text2ImageSubmitRequest, timeout: float = None,
+                                    retry: int = 0) -> Text2ImageSubmitResponse:
+        """
+        submitText2ImageTask 的异步版本。
+        """
+        url = self.service_url("/v1/bce/aip/ernievilg/v1/txt2imgv2")
+        data = Text2ImageSubmitRequest.to_json(request)
+        headers = self.auth_header()
+        headers['content-type'] = 'application/json'
+        response = await self._apost(url, data=data, headers=headers, timeout=timeout, retry=retry)
+        return self._parse_response(response, Text2ImageSubmitResponse)
 
     def queryText2ImageData(self, request: Text2ImageQueryRequest, timeout: float = None,
                           retry: int = 0) -> Text2ImageQueryResponse:
@@ -132,14 +168,34 @@ class Text2Image(Component):
         if retry != self.retry.total:
             self.retry.total = retry
         response = self.s.post(url, json=data, headers=headers, timeout=timeout)
+        return self._parse_response(response, Text2ImageQueryResponse)
+
+    async def aqueryText2ImageData(self, request: Text2ImageQueryRequest, timeout: float = None,
+                                   retry: int = 0) -> Text2ImageQueryResponse:
+        """
+        queryText2ImageData 的异步版本。
+        """
+        url = self.service_url("/v1/bce/aip/ernievilg/v1/getImgv2")
+        data = {
+            "task_id": request.task_id
+        }
+        headers = self.auth_header()
+        headers['content-type'] = 'application/json'
+        response = await self._apost(url, json=data, headers=headers, timeout=timeout, retry=retry)
+        return self._parse_response(response, Text2ImageQueryResponse)
+
+    def _parse_response(self, response, response_cls):
+        """
+        检查接口返回，并解析为 response_cls 类型。
+        """
         super().check_response_header(response)
         data = response.json()
         super().check_response_json(data)
         self.__class__.check_service_error(data)
         request_id = response.headers.get('X-Appbuilder-Request-Id')
-        response = Text2ImageQueryResponse.from_json(payload=json.dumps(data))
-        response.request_id = request_id
-        return response
+        result = response_cls.from_json(payload=json.dumps(data))
+        result.request_id = request_id
+        return result
 
     def extract_img_urls(self, response: Text2ImageQueryResponse):
         """
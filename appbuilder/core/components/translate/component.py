@@ -67,7 +67,20 @@ class Translation(Component):
         req.to_lang = to_lang
         result = self._translate(req, timeout=timeout, retry=retry)
         result_dict = proto.Message.to_dict(result)
+        out = TranslateOutMsg(**result_dict["result"])
+        return Message(content=out.dict())
 
+    async def arun(self, message: Message, from_lang: str = "auto", to_lang: str = "en",
+                   timeout: float = None, retry: int = 0) -> Message:
+        """
+        run 的异步版本，参数与返回值同 run。
+        """
+        req = TranslateRequest()
+        req.q = message.content
+        req.from_lang = from_lang
+        req.to_lang = to_lang
+        result = await self._atranslate(req, timeout=timeout, retry=retry)
+        result_dict = proto.Message.to_dict(result)
         out = TranslateOutMsg(**result_dict["result"])
         return Message(content=out.dict())
 
@@ -84,20 +97,39 @@ class Translation(Component):
         Returns:
             TranslateResponse: 文本翻译结果的响应体。
         """
+        url, headers, request_data = self._translate_params(request)
+        if retry != self.retry.total:
+            self.retry.total = retry
+        response = self.s.post(url, headers=headers, data=request_data, timeout=timeout)
+        return self._parse_response(response)
+
+    async def _atranslate(self, request: TranslateRequest, timeout: float = None,
+                          retry: int = 0) -> TranslateResponse:
+        """
+        _translate 的异步版本。
+        """
+        url, headers, request_data = self._translate_params(request)
+        response = await self._apost(url, headers=headers, data=request_data, timeout=timeout, retry=retry)
+        return self._parse_response(response)
+
+    def _translate_params(self, request: TranslateRequest):
+        """
+        校验请求并补充默认值，返回请求的url、header和body。
+        """
         if not request.to_lang or not request.q:
             raise ValueError("params `to_lang` and `q` must be set")
         if not request.from_lang:
             request.from_lang = "auto"
         request_data = TranslateRequest.to_json(request)
-        if retry != self.retry.total:
-            self.retry.total = retry
         headers = self.auth_header()
         headers['content-type'] = 'application/json;charset=utf-8'
-
         url = self.service_url("/v1/bce/aip/mt/texttrans/v1")
+        return url, headers, request_data
 
-        response = self.s.post(url, headers=headers, data=request_data, timeout=timeout)
-
+    def _parse_response(self, response) -> TranslateResponse:
+        """
+        检查并解析接口返回。
+        """
         self.check_response_header(response)
         data = response.json()
         self.check_response_json(data)
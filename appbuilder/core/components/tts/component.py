@@ -91,8 +91,34 @@ class TTS(Component):
               返回:
                  message (obj: `Message`): 文本转语音结果. 举例: Message(content={"audio_binary": b"xxx", "audio_type": "mp3"})
         """
+        request = self.__gene_request(message, model, speed, pitch, volume, person, audio_type)
+        response = self.__synthesis(request, model, timeout, retry)
+        out = TTSOutMsg(audio_binary=response.binary, audio_type=audio_type)
+        return Message(content=dict(out))
+
+    async def arun(self,
+                   message: Message,
+                   model: Literal["baidu-tts", "paddlespeech-tts"] = "baidu-tts",
+                   speed: int = 5,
+                   pitch: int = 5,
+                   volume: int = 5,
+                   person: int = 0,
+                   audio_type: Literal["mp3", "wav"] = "mp3",
+                   timeout: float = None,
+                   retry: int = 0
+                   ) -> Message:
+        r"""run 的异步版本，参数与返回值同 run
+        """
+        request = self.__gene_request(message, model, speed, pitch, volume, person, audio_type)
+        response = await self.__asynthesis(request, model, timeout, retry)
+        out = TTSOutMsg(audio_binary=response.binary, audio_type=audio_type)
+        return Message(content=dict(out))
+
+    def __gene_request(self, message, model, speed, pitch, volume, person, audio_type) -> TTSRequest:
+        r"""校验参数并生成语音合成请求"""
         if model != self.Baidu_TTS and model != self.PaddleSpeech_TTS:
             raise ValueError("unsupported model {}".format(model))
+        # last requested model, kept for compatibility, concurrent requests use the model passed per call
         self.model = model
         inp = TTSInMsg(**message.content)
         if len(inp.text) == 0:
@@ -112,45 +138,62 @@ class TTS(Component):
             request.aue = 3
         elif audio_type == "wav":
             request.aue = 6
-        response = self.__synthesis(request, timeout, retry)
-        out = TTSOutMsg(audio_binary=response.binary, audio_type=audio_type)
-        return Message(content=dict(out))
+        return request
 
     def __synthesis(self,
                     request: TTSRequest,
+                    model: str,
                     timeout: float = None,
                     retry: int = 0) -> TTSResponse:
         r"""调用底层接口进行语音合成
 
             参数:
                 request (obj: `[PaddleTTSRequest, TTSRequest]`) : 语音合成输入参数
+                model (str) : 语音合成模型
 
             返回：
                 response (obj: `TTSResponse`): 语音合成输出参数
         """
+        url, kwargs = self.__synthesis_params(request, model)
+        if retry != self.retry.total:
+            self.retry.total = retry
+        response = self.s.post(url, timeout=timeout, **kwargs)
+        return self.__parse_response(response, request)
+
+    async def __asynthesis(self,
+                           request: TTSRequest,
+                           model: str,
+                           timeout: float = None,
+                           retry: int = 0) -> TTSResponse:
+        r"""__synthesis 的异步版本"""
+        url, kwargs = self.__synthesis_params(request, model)
+        response = await self._apost(url, timeout=timeout, retry=retry, **kwargs)
+        return self.__parse_response(response, request)
+
+    def __synthesis_params(self, request: TTSRequest, model: str):
+        r"""补充并校验请求，返回请求的url和body、header参数"""
         request.ctp = "1"
         request.lan = "zh"
         request.cuid = "1"
-        if self.model == self.Baidu_TTS:
+        if model == self.Baidu_TTS:
             request.tex = quote_plus(request.tex)
             request.validate_baidu_tts()
             url = self.service_url("/v1/bce/aip_speech/tts_online")
-        elif self.model == self.PaddleSpeech_TTS:
+        elif model == self.PaddleSpeech_TTS:
             request.tp_project_id = "paddlespeech"
             request.tp_per_id = "100001"
             request.validate_paddle_speech_tts()
             url = self.service_url("/v1/bce/paddle_speech/text2audio")
         else:
-            raise ValueError("model '{}' is not supported".format(self.model))
-        if retry != self.retry.total:
-            self.retry.total = retry
+            raise ValueError("model '{}' is not supported".format(model))
         auth_header = self.auth_header()
-        if self.model == self.Baidu_TTS:
-            response = self.s.post(url, data=TTSRequest.to_dict(request), timeout=timeout, headers=auth_header)
-        elif self.model == self.PaddleSpeech_TTS:
-            auth_header = self.auth_header()
-            auth_header['Content-type'] = "application/json"
-            response = self.s.post(url, json=TTSRequest.to_dict(request), timeout=timeout, headers=auth_header)
+        if model == self.Baidu_TTS:
+            return url, {"data": TTSRequest.to_dict(request), "headers": auth_header}
+        auth_header['Content-type'] = "application/json"
+        return url, {"json": TTSRequest.to_dict(request), "headers": auth_header}
+
+    def __parse_response(self, response, request: TTSRequest) -> TTSResponse:
+        r"""检查并解析接口返回"""
         super().check_response_header(response)
         content_type = response.headers.get("Content-Type", "application/json")
         if content_type.find("application/json") != -1:
@@ -0,0 +1,420 @@
+# Copyright (c) 2023 Baidu, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Pipeline module run components as a DAG.
+
+Every stage runs in its own threads and hands items to downstream stages through bounded
+queues, so downstream stages start on the first items while upstream stages are still
+producing, and a slow stage blocks its producers instead of buffering without limit.
+"""
+
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from pydantic import BaseModel
+
+from appbuilder.core.component import Component
+from appbuilder.core.message import Message
+
+# end of stream marker passed through stage queues
+_END = object()
+# interval to re-check cancellation while blocked on a queue
+_POLL_INTERVAL = 0.1
+
+
+class StageMetrics(BaseModel):
+    r"""StageMetrics is a snapshot of one stage of the last pipeline run."""
+    calls: int = 0
+    items_in: int = 0
+    items_out: int = 0
+    errors: int = 0
+    busy_time: float = 0.0
+    latency_avg: float = 0.0
+    latency_max: float = 0.0
+    wall_time: float = 0.0
+    throughput: float = 0.0
+
+
+class _RunState(object):
+    r"""cancellation and first error shared by all stages of one run"""
+
+    def __init__(self):
+        self.cancelled = threading.Event()
+        self.error: Optional[Tuple[str, BaseException]] = None
+        self._lock = threading.Lock()
+
+    def fail(self, stage: str, error: BaseException):
+        with self._lock:
+            if self.error is None:
+                self.error = (stage, error)
+        self.cancelled.set()
+
+    def put(self, q: queue.Queue, item) -> bool:
+        while not self.cancelled.is_set():
+            try:
+                q.put(item, timeout=_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(self, q: queue.Queue):
+        while not self.cancelled.is_set():
+            try:
+                return q.get(timeout=_POLL_INTERVAL)
+            except queue.Empty:
+                continue
+        return _END
+
+
+class _Stage(object):
+    r"""stage definition and its metrics counters"""
+
+    def __init__(self, name: str, fn: Callable, inputs: List[str], split: bool, batch_size: Optional[int],
+                 workers: int, queue_size: int, kwargs: Dict[str, Any]):
+        self.name = name
+        self.fn = fn
+        self.inputs = inputs
+        self.split = split
+        self.batch_size = batch_size
+        self.workers = workers
+        self.queue_size = queue_size
+        self.kwargs = kwargs
+        # split and batch stages on the path from the pipeline input, they decide the number of items
+        self.reshapers = frozenset()
+        self.lock = threading.Lock()
+        self.reset_metrics()
+
+    def reset_metrics(self):
+        self.calls = 0
+        self.items_in = 0
+        self.items_out = 0
+        self.errors = 0
+        self.busy_time = 0.0
+        self.latency_max = 0.0
+        self.first_start = None
+        self.last_end = None
+
+    def call(self, messages: List[Message]) -> Iterator[Message]:
+        r"""call the stage function, split outputs are yielded lazily as the function produces them"""
+        start = time.monotonic()
+        busy = 0.0
+        try:
+            result = self.fn(*messages, **self.kwargs)
+            busy = time.monotonic() - start
+            if not isinstance(result, Message):
+                result = Message(result)
+            if not self.split:
+                yield result
+                return
+            content = result.content
+            if isinstance(content, (str, bytes, dict)) or not hasattr(content, "__iter__"):
+                raise ValueError("stage {} is split, but output content {} is not iterable".format(
+                    self.name, type(content).__name__))
+            items = iter(content)
+            while True:
+                # time spent in downstream queues is not counted as busy time
+                item_start = time.monotonic()
+                try:
+                    item = next(items)
+                finally:
+                    busy += time.monotonic() - item_start
+                yield item if isinstance(item, Message) else Message(item)
+        except StopIteration:
+            return
+        except Exception:
+            with self.lock:
+                self.errors += 1
+            raise
+        finally:
+            end = time.monotonic()
+            with self.lock:
+                self.calls += 1
+                self.busy_time += busy
+                self.latency_max = max(self.latency_max, busy)
+                self.first_start = start if self.first_start is None else min(self.first_start, start)
+                self.last_end = end if self.last_end is None else max(self.last_end, end)
+
+    def metrics(self) -> StageMetrics:
+        with self.lock:
+            wall_time = self.last_end - self.first_start if self.calls else 0.0
+            return StageMetrics(
+                calls=self.calls,
+                items_in=self.items_in,
+                items_out=self.items_out,
+                errors=self.errors,
+                busy_time=self.busy_time,
+                latency_avg=self.busy_time / self.calls if self.calls else 0.0,
+                latency_max=self.latency_max,
+                wall_time=wall_time,
+                throughput=self.items_out / wall_time if wall_time > 0 else 0.0,
+            )
+
+
+class Pipeline(object):
+    r"""Pipeline 将多个组件连接为有向无环图并发执行。
+
+    每个stage在独立线程中运行，通过有界队列向下游逐条传递Message：下游在上游产出第一条结果后即开始处理，
+    下游处理较慢时上游会阻塞等待(back-pressure)；互不依赖的分支并发执行。
+
+    有多个上游的stage逐条配对(zip)各上游的输出，因此各上游必须经过相同的split/batch stage、产出相同条数的Message，
+    否则add_stage抛出ValueError：条数不同时配对会错位，且条数较多的分支会填满有界队列、阻塞共同的上游，导致pipeline死锁。
+
+    Examples:
+
+        .. code-block:: python
+
+            import appbuilder
+
+            pipeline = appbuilder.Pipeline()
+            pipeline.add_stage("parse", appbuilder.DocParser(), return_raw=True)
+            pipeline.add_stage("split", appbuilder.DocSplitter(splitter_type="split_by_chunk"), inputs=["parse"])
+            # DocSplitter的输出为{"paragraphs": [...]}，取出每个段落的文本逐条发往下游
+            pipeline.add_stage("texts", lambda message: [p["text"] for p in message.content["paragraphs"]],
+                               inputs=["split"], split=True)
+            pipeline.add_stage("embedding", appbuilder.Embedding().batch, inputs=["texts"],
+                               batch_size=16, workers=4)
+
+            for stage, message in pipeline.stream(appbuilder.Message(file_path)):
+                print(stage, message.content)
+            print(pipeline.metrics())
+    """
+    INPUT = "input"
+
+    def __init__(self, queue_size: int = 16):
+        r"""Pipeline初始化方法.
+
+            参数:
+                queue_size(int, 可选): stage之间队列的默认容量，默认为16。
+            返回：
+                无
+        """
+        if queue_size < 1:
+            raise ValueError("queue_size must be greater than 0, but got {}".format(queue_size))
+        self.queue_size = queue_size
+        self._stages: "OrderedDict[str, _Stage]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add_stage(self,
+                  name: str,
+                  component: Union[Component, Callable[..., Any]],
+                  inputs: Optional[List[str]] = None,
+                  split: bool = False,
+                  batch_size: Optional[int] = None,
+                  workers: int = 1,
+                  queue_size: Optional[int] = None,
+                  **kwargs) -> "Pipeline":
+        r"""添加一个stage，上游stage需要先添加，因此图中不会出现环。
+
+            参数:
+                name(str): stage名称，不能与已有stage重复，也不能为"input"。
+                component(Component|Callable): 组件或可调用对象，每条输入调用一次，返回值不是Message时会被包装为Message。
+                inputs(List[str], 可选): 上游stage名称，默认为["input"]，即pipeline的输入。
+                    有多个上游时按顺序逐条配对(zip)后调用component(*messages)，各上游需经过相同的split/batch stage。
+                split(bool, 可选): 为True时将输出content中的每个元素作为一条Message发往下游。
+                batch_size(int, 可选): 将最多batch_size条输入的content合并为一个列表后调用一次component，仅支持单个上游。
+                workers(int, 可选): 并发调用component的线程数，输出保持输入顺序，默认为1。
+                queue_size(int, 可选): 输入队列容量，默认使用Pipeline的queue_size。
+                **kwargs(dict): 调用component时透传的参数。
+            返回：
+                Pipeline: 返回自身，便于链式调用。
+        """
+        inputs = list(inputs) if inputs else [self.INPUT]
+        if name == self.INPUT or name in self._stages:
+            raise ValueError("stage name {} is reserved or already exists".format(name))
+        for upstream in inputs:
+            if upstream != self.INPUT and upstream not in self._stages:
+                raise ValueError("input {} of stage {} is not defined, add upstream stage first".format(
+                    upstream, name))
+        if batch_size is not None and (batch_size < 1 or len(inputs) != 1):
+            raise ValueError("batch_size must be greater than 0 and requires exactly one input")
+        if workers < 1:
+            raise ValueError("workers must be greater than 0, but got {}".format(workers))
+        if not callable(component):
+            raise ValueError("component of stage {} is not callable".format(name))
+        reshapers = {self._reshapers(upstream) for upstream in inputs}
+        if len(reshapers) > 1:
+            raise ValueError("inputs {} of stage {} pass through different split or batch stages, their items "
+                             "can not be zipped one by one".format(inputs, name))
+        stage = _Stage(name, component, inputs, split, batch_size, workers, queue_size or self.queue_size, kwargs)
+        stage.reshapers = reshapers.pop() | ({name} if split or batch_size is not None else frozenset())
+        self._stages[name] = stage
+        return self
+
+    def run(self, message: Message) -> Dict[str, List[Message]]:
+        r"""执行pipeline，返回每个末端stage(没有下游的stage)按顺序产出的Message列表。
+
+            参数:
+                message(Message): pipeline的输入。
+            返回：
+                Dict[str, List[Message]]: 末端stage名称到输出列表的映射。
+        """
+        outputs = {name: [] for name in self._sinks()}
+        for name, output in self.stream(message):
+            outputs[name].append(output)
+        return outputs
+
+    def stream(self, message: Message) -> Iterator[Tuple[str, Message]]:
+        r"""执行pipeline，末端stage每产出一条Message即返回(stage名称, Message)。
+        任一stage抛出异常时，整个pipeline停止并重新抛出该异常。
+
+            参数:
+                message(Message): pipeline的输入。
+            返回：
+                Iterator[Tuple[str, Message]]
+        """
+        if not self._stages:
+            raise ValueError("pipeline has no stage")
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("pipeline is already running, create another Pipeline to run concurrently")
+        state = _RunState()
+        threads = []
+        try:
+            # bounded as well, a slow consumer of stream() throttles the whole pipeline
+            output_queue = queue.Queue(maxsize=self.queue_size)
+            consumers: Dict[str, List[queue.Queue]] = {self.INPUT: []}
+            stage_queues: Dict[str, List[queue.Queue]] = {}
+            for stage in self._stages.values():
+                stage.reset_metrics()
+                consumers[stage.name] = []
+                stage_queues[stage.name] = []
+                for upstream in stage.inputs:
+                    q = queue.Queue(maxsize=stage.queue_size)
+                    stage_queues[stage.name].append(q)
+                    consumers[upstream].append(q)
+            sinks = self._sinks()
+
+            for stage in self._stages.values():
+                thread = threading.Thread(target=self._run_stage, name="pipeline-" + stage.name, daemon=True,
+                                          args=(stage, stage_queues[stage.name], consumers[stage.name],
+                                                output_queue if stage.name in sinks else None, state))
+                thread.start()
+                threads.append(thread)
+            for q in consumers[self.INPUT]:
+                state.put(q, message)
+                state.put(q, _END)
+
+            finished = 0
+            while finished < len(sinks):
+                item = state.get(output_queue)
+                if item is _END:
+                    if state.cancelled.is_set():
+                        break
+                    finished += 1
+                    continue
+                yield item
+        finally:
+            # all stages have finished on normal exit, otherwise the consumer stopped iterating early
+            state.cancelled.set()
+            for thread in threads:
+                thread.join()
+            self._lock.release()
+        if state.error is not None:
+            raise state.error[1]
+
+    def metrics(self) -> Dict[str, StageMetrics]:
+        r"""返回最近一次执行中每个stage的调用次数、延迟与吞吐(每秒输出条数)"""
+        return {name: stage.metrics() for name, stage in self._stages.items()}
+
+    def _reshapers(self, name: str) -> frozenset:
+        r"""names of the split and batch stages that decide how many items the stage produces"""
+        return frozenset() if name == self.INPUT else self._stages[name].reshapers
+
+    def _sinks(self) -> List[str]:
+        upstreams = {upstream for stage in self._stages.values() for upstream in stage.inputs}
+        return [name for name in self._stages if name not in upstreams]
+
+    @staticmethod
+    def _iter_inputs(stage: _Stage, queues: List[queue.Queue], state: _RunState) -> Iterator[List[Message]]:
+        r"""zip items of all input queues, group them into batches if batch_size is set"""
+        batch = []
+        while True:
+            items = [state.get(q) for q in queues]
+            if any(item is _END for item in items):
+                # drain the longer inputs so that their producers are not blocked forever
+                for q, item in zip(queues, items):
+                    while item is not _END:
+                        item = state.get(q)
+                break
+            with stage.lock:
+                stage.items_in += 1
+            if stage.batch_size is None:
+                yield items
+                continue
+            batch.append(items[0].content)
+            if len(batch) == stage.batch_size:
+                yield [Message(batch)]
+                batch = []
+        if batch and not state.cancelled.is_set():
+            yield [Message(batch)]
+
+    def _run_stage(self, stage: _Stage, queues: List[queue.Queue], outputs: List[queue.Queue],
+                   sink: Optional[queue.Queue], state: _RunState):
+        slots = threading.Semaphore(stage.workers)
+        lock = threading.Lock()
+        ready: Dict[int, List[Message]] = {}
+        next_seq = [0]
+
+        def put(output: Message) -> bool:
+            if not all(state.put(q, output) for q in outputs):
+                return False
+            if sink is not None and not state.put(sink, (stage.name, output)):
+                return False
+            with stage.lock:
+                stage.items_out += 1
+            return True
+
+        def emit(seq: int, messages: List[Message]):
+            # keep input order when workers finish out of order
+            with lock:
+                ready[seq] = messages
+                while next_seq[0] in ready:
+                    for output in ready.pop(next_seq[0]):
+                        if not put(output):
+                            return
+                    next_seq[0] += 1
+
+        def work(seq: int, messages: List[Message]):
+            try:
+                if stage.workers == 1:
+                    # a single worker is always in order, stream split outputs as soon as they are produced
+                    for output in stage.call(messages):
+                        if not put(output):
+                            break
+                    results = []
+                else:
+                    results = list(stage.call(messages))
+            except Exception as e:
+                state.fail(stage.name, e)
+                results = []
+            finally:
+                slots.release()
+            if stage.workers > 1:
+                emit(seq, results)
+
+        with ThreadPoolExecutor(max_workers=stage.workers, thread_name_prefix="pipeline-" + stage.name) as executor:
+            for seq, messages in enumerate(self._iter_inputs(stage, queues, state)):
+                while not slots.acquire(timeout=_POLL_INTERVAL):
+                    if state.cancelled.is_set():
+                        break
+                if state.cancelled.is_set():
+                    break
+                executor.submit(work, seq, messages)
+        for q in outputs + ([sink] if sink is not None else []):
+            state.put(q, _END)
@@ -0,0 +1,362 @@
+# Copyright (c) 2023 Baidu, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Session stores used by UserSession instead of a SQL database.
+
+A store keeps the recent history of each session, rows are dicts with the fields of
+SessionMessage.as_dict. MemorySessionStore keeps a ring buffer per session in process,
+RedisSessionStore keeps a capped list per session in a Redis compatible server.
+"""
+
+import datetime
+import json
+import os
+import queue
+import select
+import socket
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional, Tuple, Union
+from urllib.parse import parse_qs, unquote, urlparse
+
+
+_DATETIME_FIELDS = ("created_at", "updated_at")
+
+
+class SessionStore(ABC):
+    r"""SessionStore is the storage interface of UserSession."""
+
+    @abstractmethod
+    def save(self, session_id: str, row: Dict) -> None:
+        r"""save append one row to the history of session_id"""
+
+    @abstractmethod
+    def get(self, session_id: str, limit: int) -> List[Dict]:
+        r"""get return at most limit recent rows of session_id, oldest first"""
+
+    def flush(self, session_id: Optional[str] = None, timeout: Optional[float] = None) -> bool:
+        r"""flush wait for pending writes, stores writing synchronously return True"""
+        return True
+
+    def close(self) -> None:
+        r"""close release resources held by the store"""
+
+
+class MemorySessionStore(SessionStore):
+    r"""MemorySessionStore keep recent history in a ring buffer per session.
+
+        Sessions are evicted by least recent use when there are more than max_sessions,
+        and expire ttl seconds after their last write. History is lost when the process exits
+        and is not shared between processes.
+    """
+
+    def __init__(self, max_sessions: int = 10000, max_messages: int = 100, ttl: Optional[float] = None):
+        r"""
+            :param max_sessions: number of sessions kept.
+            :param max_messages: number of recent rows kept per session.
+            :param ttl: seconds a session is kept after its last write, None means forever.
+        """
+        if max_sessions < 1 or max_messages < 1:
+            raise ValueError("max_sessions and max_messages must be greater than 0")
+        if ttl is not None and ttl <= 0:
+            raise ValueError("ttl must be greater than 0, but got {}".format(ttl))
+        self.max_sessions = max_sessions
+        self.max_messages = max_messages
+        self.ttl = ttl
+        # session_id -> (rows, expire time)
+        self._sessions: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def save(self, session_id: str, row: Dict) -> None:
+        expire = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            rows = entry[0] if entry is not None and not self._expired(entry) else deque(maxlen=self.max_messages)
+            rows.append(dict(row))
+            self._sessions[session_id] = (rows, expire)
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def get(self, session_id: str, limit: int) -> List[Dict]:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return []
+            if self._expired(entry):
+                del self._sessions[session_id]
+                return []
+            self._sessions.move_to_end(session_id)
+            rows = list(entry[0])
+        return [dict(row) for row in rows[-limit:]] if limit > 0 else []
+
+    def close(self) -> None:
+        with self._lock:
+            self._sessions.clear()
+
+    def __len__(self):
+        with self._lock:
+            return sum(1 for entry in self._sessions.values() if not self._expired(entry))
+
+    @staticmethod
+    def _expired(entry) -> bool:
+        return entry[1] is not None and entry[1] <= time.monotonic()
+
+
+class RedisError(Exception):
+    r"""RedisError is an error reply of the Redis server."""
+
+
+# commands that give the same result when executed twice, safe to retry after a broken connection
+_IDEMPOTENT_COMMANDS = {"LRANGE", "DEL", "LTRIM", "PEXPIRE", "PING"}
+
+
+class _RedisConnection(object):
+    r"""a blocking RESP2 connection"""
+
+    def __init__(self, host: str, port: int, db: int, password: Optional[str],
+                 username: Optional[str], timeout: Optional[float]):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile("rb")
+        commands = []
+        if password:
+            commands.append(("AUTH", username, password) if username else ("AUTH", password))
+        if db:
+            commands.append(("SELECT", db))
+        if commands:
+            self.execute(*commands)
+
+    def execute(self, *commands) -> list:
+        r"""send commands in one pipeline and return their replies"""
+        buf = bytearray()
+        for command in commands:
+            buf += b"*%d\r\n" % len(command)
+            for arg in command:
+                if not isinstance(arg, bytes):
+                    arg = str(arg).encode("utf-8")
+                buf += b"$%d\r\n%b\r\n" % (len(arg), arg)
+        self.sock.sendall(buf)
+        replies = [self._read_reply() for _ in commands]
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies
+
+    def closed_by_server(self) -> bool:
+        r"""an idle connection has nothing to read, readable means the server closed it"""
+        try:
+            readable, _, _ = select.select([self.sock], [], [], 0)
+        except (OSError, ValueError):
+            return True
+        return bool(readable)
+
+    def _read_reply(self):
+        line = self.reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("connection closed by redis server")
+        prefix, body = line[:1], line[1:-2]
+        if prefix == b"+":
+            return body.decode("utf-8")
+        if prefix == b"-":
+            return RedisError(body.decode("utf-8"))
+        if prefix == b":":
+            return int(body)
+        if prefix == b"$":
+            length = int(body)
+            if length < 0:
+                return None
+            data = self.reader.read(length + 2)
+            if len(data) != length + 2:
+                raise ConnectionError("connection closed by redis server")
+            return data[:-2]
+        if prefix == b"*":
+            length = int(body)
+            return None if length < 0 else [self._read_reply() for _ in range(length)]
+        raise ConnectionError("invalid redis reply: {!r}".format(line))
+
+    def close(self):
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RedisSessionStore(SessionStore):
+    r"""RedisSessionStore keep recent history in a capped list per session on a Redis server.
+
+        Each session is a list at key_prefix + session_id, trimmed to max_messages on every write,
+        so all processes sharing the server see the same history. Only the Redis protocol is used,
+        any compatible server works and no client package is required.
+    """
+
+    def __init__(self,
+                 url: str = "redis://localhost:6379/0",
+                 max_messages: int = 100,
+                 ttl: Optional[float] = None,
+                 key_prefix: str = "appbuilder:session:",
+                 pool_size: int = 8,
+                 timeout: Optional[float] = 5.0):
+        r"""
+            :param url: redis://[[username]:password@]host[:port][/db].
+            :param max_messages: number of recent rows kept per session.
+            :param ttl: seconds a session is kept after its last write, None means forever.
+            :param key_prefix: prefix of the list keys.
+            :param pool_size: number of idle connections kept.
+            :param timeout: socket timeout in seconds.
+        """
+        parsed = urlparse(url)
+        if parsed.scheme != "redis":
+            raise ValueError("redis url must start with redis://, but got {}".format(url))
+        if max_messages < 1 or pool_size < 1:
+            raise ValueError("max_messages and pool_size must be greater than 0")
+        if ttl is not None and ttl <= 0:
+            raise ValueError("ttl must be greater than 0, but got {}".format(ttl))
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.db = int(parsed.path.strip("/") or 0)
+        self.username = unquote(parsed.username) if parsed.username else None
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.max_messages = max_messages
+        self.ttl = ttl
+        self.key_prefix = key_prefix
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._pool = queue.LifoQueue()
+        self._pid = os.getpid()
+
+    def save(self, session_id: str, row: Dict) -> None:
+        key = self.key_prefix + session_id
+        commands = [("RPUSH", key, _dump_row(row)), ("LTRIM", key, -self.max_messages, -1)]
+        if self.ttl is not None:
+            commands.append(("PEXPIRE", key, int(self.ttl * 1000)))
+        self._execute(*commands)
+
+    def get(self, session_id: str, limit: int) -> List[Dict]:
+        if limit <= 0:
+            return []
+        items = self._execute(("LRANGE", self.key_prefix + session_id, -limit, -1))[0]
+        return [_load_row(item) for item in items or []]
+
+    def delete(self, session_id: str) -> None:
+        r"""delete remove the history of session_id"""
+        self._execute(("DEL", self.key_prefix + session_id))
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def _execute(self, *commands) -> list:
+        if self._pid != os.getpid():
+            # connections opened by the parent process must not be shared after fork
+            self._pool = queue.LifoQueue()
+            self._pid = os.getpid()
+        connection, reused = self._acquire()
+        try:
+            replies = connection.execute(*commands)
+        except (ConnectionError, OSError):
+            connection.close()
+            # the server may have executed the commands before the connection broke,
+            # retry once on a new connection only when running them twice is harmless
+            if not reused or not all(str(command[0]).upper() in _IDEMPOTENT_COMMANDS for command in commands):
+                raise
+            connection = self._connect()
+            try:
+                replies = connection.execute(*commands)
+            except Exception:
+                connection.close()
+                raise
+        except Exception:
+            connection.close()
+            raise
+        if self._pool.qsize() < self.pool_size:
+            self._pool.put(connection)
+        else:
+            connection.close()
+        return replies
+
+    def _acquire(self) -> Tuple[_RedisConnection, bool]:
+        r"""an idle pooled connection, or a new one, and whether it was pooled"""
+        while True:
+            try:
+                connection = self._pool.get_nowait()
+            except queue.Empty:
+                return self._connect(), False
+            if not connection.closed_by_server():
+                return connection, True
+            # closed by the server while idle, the commands have not been sent yet
+            connection.close()
+
+    def _connect(self) -> _RedisConnection:
+        return _RedisConnection(self.host, self.port, self.db, self.password, self.username, self.timeout)
+
+
+def _dump_row(row: Dict) -> bytes:
+    row = dict(row)
+    for field in _DATETIME_FIELDS:
+        if isinstance(row.get(field), datetime.datetime):
+            row[field] = row[field].isoformat()
+    return json.dumps(row, ensure_ascii=False).encode("utf-8")
+
+
+def _load_row(data: bytes) -> Dict:
+    row = json.loads(data)
+    for field in _DATETIME_FIELDS:
+        if isinstance(row.get(field), str):
+            row[field] = datetime.datetime.fromisoformat(row[field])
+    return row
+
+
+def create_session_store(config: Union[str, SessionStore]) -> Optional[SessionStore]:
+    r"""create_session_store create a store from a url, return None for SQL database urls.
+
+        memory://?max_sessions=10000&max_messages=100&ttl=3600 creates MemorySessionStore,
+        redis://host:6379/0?max_messages=100&ttl=3600&key_prefix=app: creates RedisSessionStore.
+
+        :param config: store url or SessionStore.
+        :rtype: SessionStore or None.
+    """
+    if isinstance(config, SessionStore):
+        return config
+    if not isinstance(config, str):
+        return None
+    parsed = urlparse(config)
+    if parsed.scheme not in ("memory", "redis"):
+        return None
+    options = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+    kwargs = {}
+    for key in ("max_sessions", "max_messages", "pool_size"):
+        if key in options:
+            kwargs[key] = int(options.pop(key))
+    for key in ("ttl", "timeout"):
+        if key in options:
+            kwargs[key] = float(options.pop(key))
+    if "key_prefix" in options:
+        kwargs["key_prefix"] = options.pop("key_prefix")
+    if options:
+        raise ValueError("unknown session store options: {}".format(", ".join(sorted(options))))
+    if parsed.scheme == "memory":
+        if "pool_size" in kwargs or "timeout" in kwargs or "key_prefix" in kwargs:
+            raise ValueError("memory session store only accepts max_sessions, max_messages and ttl")
+        return MemorySessionStore(**kwargs)
+    if "max_sessions" in kwargs:
+        raise ValueError("redis session store does not accept max_sessions")
+    return RedisSessionStore(parsed._replace(query="").geturl(), **kwargs)
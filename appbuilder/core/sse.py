@@ -0,0 +1,142 @@
+# Copyright (c) 2023 Baidu, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Incremental server-sent events decoder.
+
+Network chunks are not aligned with events: one chunk may carry several events, an event
+may be split over chunks, and servers send comment lines to keep the connection alive.
+SSEDecoder buffers raw bytes, splits complete lines in place and dispatches an event on
+every blank line, following https://html.spec.whatwg.org/multipage/server-sent-events.html.
+"""
+
+from typing import Iterable, Iterator, List, Optional
+
+
+class SSEEvent(object):
+    r"""SSEEvent is one dispatched server-sent event."""
+    __slots__ = ("event", "data", "id", "retry")
+
+    def __init__(self, data: str, event: str = "message", id: Optional[str] = None, retry: Optional[int] = None):
+        self.data = data
+        self.event = event
+        self.id = id
+        self.retry = retry
+
+    def __repr__(self):
+        return "SSEEvent(event={!r}, data={!r}, id={!r})".format(self.event, self.data, self.id)
+
+
+class SSEDecoder(object):
+    r"""SSEDecoder turn a stream of bytes chunks into SSEEvent.
+
+    Examples:
+
+        .. code-block:: python
+
+            decoder = SSEDecoder()
+            for chunk in response.iter_content(chunk_size=None):
+                for event in decoder.feed(chunk):
+                    print(event.data)
+            for event in decoder.flush():
+                print(event.data)
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._data: List[str] = []
+        self._event = ""
+        self._id = None
+        self._retry = None
+
+    def feed(self, chunk: bytes) -> List[SSEEvent]:
+        r"""feed append a chunk and return the events completed by it."""
+        events = []
+        buffer = self._buffer
+        # only search the new bytes for line ends, the buffer never holds a complete line
+        search_from = len(buffer)
+        buffer += chunk
+        start = 0
+        view = memoryview(buffer)
+        try:
+            while True:
+                end = buffer.find(b"\n", max(start, search_from))
+                if end < 0:
+                    break
+                line_end = end - 1 if end > start and buffer[end - 1] == 0x0D else end
+                event = self._process_line(view[start:line_end])
+                if event is not None:
+                    events.append(event)
+                start = end + 1
+        finally:
+            view.release()
+        if start:
+            del buffer[:start]
+        return events
+
+    def flush(self) -> List[SSEEvent]:
+        r"""flush dispatch the pending event at the end of stream, the last blank line may be missing."""
+        events = []
+        if self._buffer:
+            line = bytes(self._buffer).rstrip(b"\r")
+            self._buffer.clear()
+            event = self._process_line(memoryview(line))
+            if event is not None:
+                events.append(event)
+        event = self._dispatch()
+        if event is not None:
+            events.append(event)
+        return events
+
+    def iter_events(self, chunks: Iterable[bytes]) -> Iterator[SSEEvent]:
+        r"""iter_events decode all chunks of a stream, events are yielded as soon as they complete."""
+        for chunk in chunks:
+            yield from self.feed(chunk)
+        yield from self.flush()
+
+    def _process_line(self, line: memoryview) -> Optional[SSEEvent]:
+        if len(line) == 0:
+            return self._dispatch()
+        first = line[0]
+        if first == 0x3A:
+            # ":" comment, used as keep-alive
+            return None
+        if first == 0x7B:
+            # tolerate a bare JSON body, e.g. a gateway error returned without SSE framing
+            self._data.append(str(line, "utf-8"))
+            return None
+        line = bytes(line)
+        name, sep, value = line.partition(b":")
+        if sep and value.startswith(b" "):
+            value = value[1:]
+        if name == b"data":
+            self._data.append(value.decode("utf-8"))
+        elif name == b"event":
+            self._event = value.decode("utf-8")
+        elif name == b"id":
+            if b"\0" not in value:
+                self._id = value.decode("utf-8")
+        elif name == b"retry":
+            if value.isdigit():
+                self._retry = int(value)
+        return None
+
+    def _dispatch(self) -> Optional[SSEEvent]:
+        if not self._data:
+            self._event = ""
+            return None
+        event = SSEEvent("\n".join(self._data), self._event or "message", self._id, self._retry)
+        self._data = []
+        self._event = ""
+        return event
@@ -0,0 +1,343 @@
+# Copyright (c) 2023 Baidu, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""Shared HTTP transport for components.
+
+All Component instances talking to the same gateway share one connection pool manager,
+so keep-alive connections and TLS sessions are reused across components instead of
+being opened per instance. Pool statistics are exposed for sizing the pool under load.
+
+The asyncio path uses one aiohttp session per event loop and gateway, configured from
+the same TransportConfig, and returns requests.Response objects so that components
+check and parse responses the same way on both paths.
+"""
+
+import asyncio
+import socket
+import threading
+import time
+import weakref
+from typing import Dict, Optional
+
+import requests
+from pydantic import BaseModel, Field
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.poolmanager import PoolManager
+
+
+class TransportConfig(BaseModel):
+    r"""TransportConfig define the shared connection pool settings."""
+    pool_connections: int = Field(default=10, gt=0, description="每个网关缓存的host连接池数量")
+    pool_maxsize: int = Field(default=32, gt=0, description="单个host的最大保持连接数")
+    pool_block: bool = Field(default=False, description="连接数达到上限时是否等待空闲连接，而不是新建临时连接")
+    keep_alive: bool = Field(default=True, description="是否复用长连接，并开启TCP keep-alive")
+
+
+class TransportStats(BaseModel):
+    r"""TransportStats is a snapshot of a shared connection pool."""
+    requests: int = 0
+    connections_created: int = 0
+    connections_discarded: int = 0
+    open_connections: int = 0
+    idle_connections: int = 0
+    reuse_ratio: float = 0.0
+    wait_time_total: float = 0.0
+    wait_time_max: float = 0.0
+
+
+class _PoolCounters(object):
+    r"""thread safe counters shared by all host pools of one gateway"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.created = 0
+        self.discarded = 0
+        self.in_use = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def on_get(self, wait, connect):
+        with self.lock:
+            self.requests += 1
+            self.in_use += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            if connect:
+                self.created += 1
+
+    def on_put(self, discarded):
+        with self.lock:
+            self.in_use = max(self.in_use - 1, 0)
+            if discarded:
+                self.discarded += 1
+
+
+class _CountingPoolMixin(object):
+    r"""record connection checkout, connect and wait time of a urllib3 pool"""
+    counters: Optional[_PoolCounters] = None
+
+    def _get_conn(self, timeout=None):
+        start = time.monotonic()
+        conn = super()._get_conn(timeout=timeout)
+        if self.counters is not None:
+            # a connection without socket is either new or was dropped by server, it will connect again
+            self.counters.on_get(time.monotonic() - start, getattr(conn, "sock", None) is None)
+        return conn
+
+    def _put_conn(self, conn):
+        discarded = self.pool is None or self.pool.full()
+        super()._put_conn(conn)
+        if self.counters is not None:
+            self.counters.on_put(discarded)
+
+
+class _CountingHTTPConnectionPool(_CountingPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class _CountingHTTPSConnectionPool(_CountingPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+class _SharedPoolManager(PoolManager):
+    r"""PoolManager whose host pools report to one set of counters"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool_classes_by_scheme = {
+            "http": _CountingHTTPConnectionPool,
+            "https": _CountingHTTPSConnectionPool,
+        }
+        self.counters = _PoolCounters()
+
+    def _new_pool(self, scheme, host, port, request_context=None):
+        pool = super()._new_pool(scheme, host, port, request_context=request_context)
+        pool.counters = self.counters
+        return pool
+
+    def stats(self) -> TransportStats:
+        r"""stats return a snapshot of counters of all host pools"""
+        idle = 0
+        with self.pools.lock:
+            pools = [self.pools[key] for key in self.pools.keys()]
+        for pool in pools:
+            if pool.pool is not None:
+                idle += sum(1 for conn in list(pool.pool.queue) if conn is not None and conn.sock is not None)
+        c = self.counters
+        with c.lock:
+            reuse_ratio = (c.requests - c.created) / c.requests if c.requests else 0.0
+            return TransportStats(
+                requests=c.requests,
+                connections_created=c.created,
+                connections_discarded=c.discarded,
+                open_connections=idle + c.in_use,
+                idle_connections=idle,
+                reuse_ratio=max(reuse_ratio, 0.0),
+                wait_time_total=c.wait_total,
+                wait_time_max=c.wait_max,
+            )
+
+
+_config = TransportConfig()
+_managers: Dict[str, _SharedPoolManager] = {}
+_lock = threading.Lock()
+
+
+def _new_manager(config: TransportConfig) -> _SharedPoolManager:
+    kwargs = {}
+    if config.keep_alive:
+        kwargs["socket_options"] = HTTPConnection.default_socket_options + [
+            (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+    return _SharedPoolManager(num_pools=config.pool_connections, maxsize=config.pool_maxsize,
+                              block=config.pool_block, **kwargs)
+
+
+def get_pool_manager(gateway: str) -> PoolManager:
+    r"""get_pool_manager return the process wide pool manager of gateway.
+        :param gateway: backend server host.
+        :rtype: urllib3.PoolManager.
+    """
+    manager = _managers.get(gateway)
+    if manager is not None:
+        return manager
+    with _lock:
+        if gateway not in _managers:
+            _managers[gateway] = _new_manager(_config)
+        return _managers[gateway]
+
+
+def configure_transport(config: Optional[TransportConfig] = None, **kwargs) -> TransportConfig:
+    r"""configure_transport update the shared connection pool settings.
+
+        Existing pools are closed, all components pick up the new settings on their next request.
+
+        :param config: TransportConfig, new settings, fields in kwargs override it.
+        :rtype: TransportConfig.
+    """
+    global _config
+    config = config.copy(update=kwargs) if config is not None else _config.copy(update=kwargs)
+    config = TransportConfig(**config.dict())
+    with _lock:
+        _config = config
+        managers = list(_managers.values())
+        _managers.clear()
+    for manager in managers:
+        manager.clear()
+    return config
+
+
+def get_transport_config() -> TransportConfig:
+    r"""get_transport_config return current shared connection pool settings"""
+    return _config
+
+
+def get_transport_stats(gateway: Optional[str] = None) -> Dict[str, TransportStats]:
+    r"""get_transport_stats return pool statistics of every gateway, or of the given one.
+        :param gateway: backend server host, optional.
+        :rtype: Dict[str, TransportStats].
+    """
+    with _lock:
+        managers = dict(_managers)
+    if gateway is not None:
+        managers = {gateway: managers[gateway]} if gateway in managers else {}
+    return {key: manager.stats() for key, manager in managers.items()}
+
+
+class SharedHTTPAdapter(HTTPAdapter):
+    r"""HTTPAdapter backed by the process wide pool of a gateway.
+
+    Every component keeps its own adapter and Retry policy, while connections are drawn
+    from the pool shared by all components of the same gateway.
+    """
+    __attrs__ = HTTPAdapter.__attrs__ + ["gateway"]
+
+    def __init__(self, gateway: str, *args, **kwargs):
+        self.gateway = gateway
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        # the shared pool manager is resolved per request, see poolmanager property
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self._pool_block = block
+
+    @property
+    def poolmanager(self):
+        return get_pool_manager(self.gateway)
+
+    def add_headers(self, request, **kwargs):
+        if not _config.keep_alive:
+            request.headers["Connection"] = "close"
+
+    def close(self):
+        # shared pools outlive a single component, only close proxy managers owned by self
+        for proxy in self.proxy_manager.values():
+            proxy.clear()
+
+
+# aiohttp sessions are bound to an event loop, so they are registered per loop
+_async_sessions = weakref.WeakKeyDictionary()
+
+
+def _lazy_import_aiohttp():
+    try:
+        import aiohttp
+    except ImportError:
+        raise ImportError("aiohttp module is not installed. Please install it using 'pip install "
+                          "aiohttp~=3.9'.")
+    return aiohttp
+
+
+def get_async_session(gateway: str):
+    r"""get_async_session return the aiohttp session of gateway for the running event loop.
+        :param gateway: backend server host.
+        :rtype: aiohttp.ClientSession.
+    """
+    aiohttp = _lazy_import_aiohttp()
+    loop = asyncio.get_running_loop()
+    sessions = _async_sessions.setdefault(loop, {})
+    session, config = sessions.get(gateway, (None, None))
+    if session is not None and not session.closed and config is not _config:
+        # settings changed by configure_transport, close the old session in background
+        loop.create_task(session.close())
+        session = None
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(limit=_config.pool_connections * _config.pool_maxsize,
+                                         limit_per_host=_config.pool_maxsize,
+                                         force_close=not _config.keep_alive)
+        session = aiohttp.ClientSession(connector=connector)
+        sessions[gateway] = (session, _config)
+    return session
+
+
+async def aclose_transport():
+    r"""aclose_transport close all aiohttp sessions of the running event loop"""
+    sessions = _async_sessions.pop(asyncio.get_running_loop(), {})
+    for session, _ in sessions.values():
+        await session.close()
+
+
+async def async_request(gateway: str, method: str, url: str, timeout: Optional[float] = None,
+                        retry: int = 0, stream: bool = False, **kwargs):
+    r"""async_request send a HTTP request without blocking the event loop.
+
+        The request body is encoded by requests, so params, data, json and headers behave exactly
+        like requests.Session.request. Connection errors are retried up to retry times.
+
+        :param gateway: backend server host, select the shared session.
+        :param method: HTTP method.
+        :param url: request url.
+        :param timeout: total timeout in seconds, None means no timeout.
+        :param retry: retry times on connection error.
+        :param stream: if True return the unread aiohttp.ClientResponse, the caller must release it.
+        :rtype: requests.Response or aiohttp.ClientResponse.
+    """
+    aiohttp = _lazy_import_aiohttp()
+    prepared = requests.Request(method, url, **kwargs).prepare()
+    session = get_async_session(gateway)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    for attempt in range(retry + 1):
+        try:
+            response = await session.request(prepared.method, prepared.url, data=prepared.body,
+                                             headers=dict(prepared.headers), timeout=client_timeout)
+            break
+        except aiohttp.ClientConnectionError:
+            if attempt == retry:
+                raise
+            await asyncio.sleep(0.1 * (2 ** attempt))
+    if stream:
+        return response
+    try:
+        content = await response.read()
+    finally:
+        response.release()
+    return to_requests_response(response, content)
+
+
+def to_requests_response(response, content: bytes) -> requests.Response:
+    r"""to_requests_response convert a read aiohttp response to requests.Response"""
+    resp = requests.Response()
+    resp.status_code = response.status
+    resp.reason = response.reason
+    resp.headers = CaseInsensitiveDict(response.headers)
+    resp.url = str(response.url)
+    resp.encoding = get_encoding_from_headers(resp.headers)
+    resp._content = content
+    return resp
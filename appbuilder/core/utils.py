@@ -12,9 +12,51 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-
+import asyncio
+import threading
+import time
+from typing import Optional
 
 
 def utils_get_user_agent():
     return 'appbuilder-sdk-python/{}'.format("__version__")
 
+
+class RateLimiter(object):
+    r"""RateLimiter is a thread safe token bucket, used to limit the request rate of a component.
+
+        :param rate: permitted calls per second.
+        :param burst: bucket capacity, max calls allowed at once, default max(1, rate).
+    """
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        if rate <= 0:
+            raise ValueError("rate must be greater than 0, but got {}".format(rate))
+        self.rate = float(rate)
+        self.burst = burst if burst is not None else max(1, int(rate))
+        if self.burst < 1:
+            raise ValueError("burst must be greater than 0, but got {}".format(burst))
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        r"""take one token, return seconds to wait before the token is usable"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= 1
+            return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+    def acquire(self):
+        r"""block until a call is permitted"""
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self):
+        r"""asyncio counterpart of acquire, wait without blocking the event loop"""
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
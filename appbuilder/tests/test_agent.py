@@ -1,7 +1,13 @@
 import unittest
 import pydantic
 import os
+import sys
+import json
+import asyncio
+import tempfile
+from unittest import mock
 import appbuilder
+from appbuilder.core.component import Component
 
 
 class TestAgentBase(unittest.TestCase):
@@ -56,5 +62,92 @@ class TestAgentBase(unittest.TestCase):
         for it in answer.content:
             self.assertIs(type(it), str)
 
+
+class _EchoComponent(Component):
+    """ 回显输入的组件，stream 时逐字返回 """
+
+    def __init__(self, delay=0.0):
+        super().__init__(secret_key="test")
+        self.delay = delay
+
+    def run(self, message, stream=False):
+        return appbuilder.Message(message.content)
+
+    async def arun(self, message, stream=False):
+        text = message.content
+        if text == "error":
+            raise RuntimeError("echo failed")
+        if not stream:
+            await asyncio.sleep(self.delay)
+            return appbuilder.Message(text)
+
+        async def gen():
+            for ch in text:
+                await asyncio.sleep(self.delay)
+                yield ch
+        return appbuilder.Message(gen())
+
+
+class TestAgentAsyncServer(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        from aiohttp.test_utils import TestClient, TestServer
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.agent = appbuilder.AgentBase(
+            component=_EchoComponent(delay=0.01),
+            user_session_config="sqlite:///" + os.path.join(self.tmpdir.name, "session.db"))
+        self.client = TestClient(TestServer(self.agent.create_async_app(max_concurrency=8, timeout=0.5)))
+        await self.client.start_server()
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        self.tmpdir.cleanup()
+
+    async def test_blocking_chat(self):
+        """ 测试非流式请求与 session 保存 """
+        resp = await self.client.post("/chat", json={"message": "你好", "session_id": "s1"})
+        data = await resp.json()
+        self.assertEqual(data["code"], 0)
+        self.assertEqual(data["result"]["session_id"], "s1")
+        self.assertEqual(data["result"]["answer_message"]["content"], "你好")
+        history = self.agent.user_session_handle.get_session_messages("s1")
+        self.assertEqual(len(history), 1)
+
+    async def test_stream_chat(self):
+        """ 测试流式请求的 SSE 格式，且多个流式请求并发处理 """
+        async def stream(text):
+            resp = await self.client.post("/chat", json={"message": text, "stream": True})
+            self.assertEqual(resp.headers["Content-Type"], "text/event-stream; charset=utf-8")
+            body = (await resp.read()).decode("utf-8")
+            events = [json.loads(line[len("data: "):]) for line in body.split("\n\n") if line]
+            return "".join(e["result"]["answer_message"]["content"] for e in events)
+
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        texts = ["abcdefghij"] * 5
+        self.assertEqual(await asyncio.gather(*[stream(t) for t in texts]), texts)
+        # 5个请求每个约0.1秒，并发执行
+        self.assertLess(loop.time() - start, 0.4)
+
+    async def test_errors_and_timeout(self):
+        """ 测试参数错误、组件异常与超时 """
+        resp = await self.client.post("/chat", json={"session_id": "s1"})
+        self.assertEqual(resp.status, 400)
+        resp = await self.client.post("/chat", json={"message": "x", "stream": "yes"})
+        self.assertEqual(resp.status, 400)
+        resp = await self.client.post("/chat", json={"message": "error"})
+        self.assertEqual((await resp.json())["code"], 1000)
+        resp = await self.client.post("/chat", json={"message": "x" * 100, "stream": True})
+        body = (await resp.read()).decode("utf-8")
+        self.assertIn('"code": 504', body.strip().split("\n\n")[-1])
+
+    def test_missing_aiohttp(self):
+        """ 测试未安装 aiohttp 时提示安装方式 """
+        with mock.patch.dict(sys.modules, {"aiohttp": None}):
+            with self.assertRaisesRegex(ImportError, "pip install"):
+                self.agent.create_async_app()
+            with self.assertRaisesRegex(ImportError, "pip install"):
+                self.agent.serve_async(port=0)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -11,11 +11,245 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import hashlib
+import heapq
+import json
+import math
 import os
+import re
+import threading
 
 import unittest
 import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import numpy as np
+
 import appbuilder
+from appbuilder.core.component import Component
+from appbuilder.core.message import Message
+
+
+class _HashEmbedding(Component):
+    """ 根据文本哈希生成确定的向量，记录每次 batch 的文本数 """
+
+    def __init__(self, dims=8):
+        super().__init__(secret_key="test")
+        self.dims = dims
+        self.batch_sizes = []
+
+    def vector(self, text):
+        digest = hashlib.sha256(text.encode()).digest()
+        return [b / 255.0 - 0.5 for b in digest[:self.dims]]
+
+    def run(self, text):
+        return Message(self.vector(text.content))
+
+    def batch(self, texts):
+        self.batch_sizes.append(len(texts.content))
+        return Message([self.vector(text) for text in texts.content])
+
+
+class _TableEmbedding(_HashEmbedding):
+    """ 从给定的向量表中查询文本的向量 """
+
+    def __init__(self, table):
+        super().__init__(dims=len(next(iter(table.values()))))
+        self.table = table
+
+    def vector(self, text):
+        return self.table[text]
+
+
+class _HNSWGraph(object):
+    """ 单层 hnsw 图，按 m、ef_construction 构建，按 ef 检索，用于模拟近似检索的召回率 """
+
+    def __init__(self, vectors, m, ef_construction):
+        self.vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        self.m = m
+        self.neighbors = [np.empty(0, dtype=np.int64)]
+        for i in range(1, len(vectors)):
+            found = self.search(self.vectors[i], ef_construction, ef_construction)
+            self.neighbors.append(np.array([j for _, j in found[:m]], dtype=np.int64))
+            for j in self.neighbors[i]:
+                links = np.append(self.neighbors[j], i)
+                if len(links) > 2 * m:
+                    # 只保留最相似的 2m 个邻居
+                    links = links[np.argsort(-self.vectors[links] @ self.vectors[j])[:2 * m]]
+                self.neighbors[j] = links
+
+    def search(self, query, ef, size):
+        query = query / np.linalg.norm(query)
+        score = float(self.vectors[0] @ query)
+        visited = {0}
+        candidates = [(-score, 0)]
+        results = [(score, 0)]
+        while candidates:
+            neg_score, node = heapq.heappop(candidates)
+            if -neg_score < results[0][0] and len(results) >= ef:
+                break
+            links = [j for j in self.neighbors[node].tolist() if j not in visited]
+            if not links:
+                continue
+            visited.update(links)
+            for j, score in zip(links, (self.vectors[links] @ query).tolist()):
+                if len(results) < ef or score > results[0][0]:
+                    heapq.heappush(candidates, (-score, j))
+                    heapq.heappush(results, (score, j))
+                    if len(results) > ef:
+                        heapq.heappop(results)
+        return sorted(results, reverse=True)[:size]
+
+
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class _ESHandler(BaseHTTPRequestHandler):
+    """ Elasticsearch 兼容的测试服务，支持索引管理、bulk 与 knn 检索 """
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def _send(self, status, body=None):
+        data = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(data)
+
+    def _path(self):
+        # 去掉 BES 网关的前缀，只保留 ES 的路径
+        path = urlparse(self.path).path
+        prefix = "/v1/bce/bes/cluster/test"
+        return [part for part in path[len(prefix):].split("/") if part]
+
+    def _body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_HEAD(self):
+        parts = self._path()
+        self._send(200 if parts and parts[0] in self.server.indices else 404)
+
+    def do_GET(self):
+        self._body()
+        if not self._path():
+            return self._send(200, {"version": {"number": "7.10.2"}, "tagline": "You Know, for Search"})
+        self.do_POST()
+
+    def do_PUT(self):
+        parts, body = self._path(), json.loads(self._body() or b"{}")
+        with self.server.lock:
+            self.server.requests.append(("create", parts[0]))
+            if parts[0] in self.server.indices:
+                return self._send(400, {"error": {"type": "resource_already_exists_exception"}, "status": 400})
+            self.server.indices[parts[0]] = {"body": body, "docs": []}
+        self._send(200, {"acknowledged": True, "index": parts[0]})
+
+    def do_POST(self):
+        parts, raw = self._path(), self._body()
+        if parts[-1] == "_bulk":
+            return self._send(200, self._bulk(raw))
+        if parts[-1] == "_msearch":
+            return self._send(200, self._msearch(raw))
+        body = json.loads(raw or b"{}")
+        if parts[-1] == "_search":
+            return self._send(200, self.server.search(parts[0], body))
+        if parts[-1] == "_delete_by_query":
+            with self.server.lock:
+                deleted = len(self.server.indices[parts[0]]["docs"])
+                self.server.indices[parts[0]]["docs"] = []
+            return self._send(200, {"deleted": deleted})
+        self._send(404, {"error": "unsupported {}".format(self.path)})
+
+    def _bulk(self, raw):
+        lines = [json.loads(line) for line in raw.decode().splitlines() if line.strip()]
+        items, errors = [], False
+        with self.server.lock:
+            self.server.bulk_sizes.append(len(lines) // 2)
+            for action, source in zip(lines[0::2], lines[1::2]):
+                index = action["index"]["_index"]
+                if self.server.reject > 0:
+                    self.server.reject -= 1
+                    errors = True
+                    items.append({"index": {"_index": index, "status": 429,
+                                            "error": {"type": "es_rejected_execution_exception"}}})
+                    continue
+                docs = self.server.indices[index]["docs"]
+                docs.append(source)
+                items.append({"index": {"_index": index, "_id": str(len(docs)), "status": 201}})
+        return {"took": 1, "errors": errors, "items": items}
+
+    def _msearch(self, raw):
+        lines = [json.loads(line) for line in raw.decode().splitlines() if line.strip()]
+        self.server.msearches.append(len(lines) // 2)
+        responses = []
+        for i, (header, body) in enumerate(zip(lines[0::2], lines[1::2])):
+            if i in self.server.msearch_errors:
+                responses.append({"error": {"type": "search_phase_execution_exception"}, "status": 500})
+            else:
+                responses.append(dict(self.server.search(header["index"], body), status=200))
+        return {"took": 1, "responses": responses}
+
+    def log_message(self, *args):
+        pass
+
+
+class _ESServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _ESHandler)
+        self.lock = threading.Lock()
+        self.indices = {}
+        self.requests = []
+        self.bulk_sizes = []
+        self.searches = []
+        self.msearches = []
+        self.msearch_errors = set()
+        self.reject = 0
+        self.url = "http://127.0.0.1:{}".format(self.server_address[1])
+
+    def search(self, index, body):
+        with self.lock:
+            self.searches.append(body)
+            docs = list(self.indices[index]["docs"])
+        query = body.get("query", {})
+        if not docs:
+            scored = []
+        elif "knn" in query and "ef" in query["knn"]["vector"]:
+            knn = query["knn"]["vector"]
+            found = self.graph(index, docs).search(np.array(knn["vector"]), knn["ef"], body.get("size", 10))
+            scored = [(score, docs[i]) for score, i in found]
+        elif "knn" in query:
+            knn = query["knn"]["vector"]
+            scored = sorted(((_cosine(knn["vector"], doc["vector"]), doc) for doc in docs),
+                            key=lambda item: -item[0])[:body.get("size", 10)]
+        elif "match" in query:
+            # 以命中的词数作为得分
+            words = set(re.findall(r"\w+", query["match"]["text"].lower()))
+            scored = [(float(len(words & set(re.findall(r"\w+", doc["text"].lower())))), doc) for doc in docs]
+            scored = sorted([item for item in scored if item[0] > 0],
+                            key=lambda item: -item[0])[:body.get("size", 10)]
+        else:
+            scored = [(1.0, doc) for doc in docs][:body.get("size", 10)]
+        return {"took": 1, "hits": {"total": {"value": len(docs)}, "hits": [
+            {"_index": index, "_score": score, "_source": doc} for score, doc in scored]}}
+
+    def graph(self, index, docs):
+        """ 按索引 mapping 中的 hnsw 参数构建图，文档变化后重建 """
+        with self.lock:
+            info = self.indices[index]
+            if info.get("graph_size") != len(docs):
+                params = info["body"]["mappings"]["properties"]["vector"]["parameters"]
+                info["graph"] = _HNSWGraph(np.array([doc["vector"] for doc in docs]), params["m"],
+                                           params["ef_construction"])
+                info["graph_size"] = len(docs)
+            return info["graph"]
 
 
 class TestBESRetriever(unittest.TestCase):
@@ -96,5 +330,225 @@ class TestBESRetriever(unittest.TestCase):
         self.assertEqual(vector_index.get_all_segments()["hits"]["total"]["value"], 0)
 
 
+class TestBESVectorStoreIndexOffline(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = _ESServer()
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.environ = dict(os.environ)
+        os.environ["GATEWAY_URL"] = self.server.url
+        os.environ["APPBUILDER_TOKEN"] = "test"
+        self.server.reject = 0
+        self.server.searches = []
+        self.server.msearches = []
+        self.server.msearch_errors = set()
+        self.embedding = _HashEmbedding()
+        self.vector_index = appbuilder.BESVectorStoreIndex(
+            cluster_id="test", user_name="user", password="password", embedding=self.embedding, prefix="")
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.environ)
+
+    def test_incremental_ingestion(self):
+        """ 测试分批计算向量并写入，多次写入同一索引 """
+        reports = []
+        segments = ("segment {}".format(i) for i in range(1000))
+        stats = self.vector_index.add_segments(Message(segments), embedding_batch_size=64, chunk_size=100,
+                                               progress=reports.append)
+        self.assertEqual((stats.indexed, stats.failed), (1000, 0))
+        self.assertEqual(max(self.embedding.batch_sizes), 64)
+        self.assertTrue(all(size <= 100 for size in self.server.bulk_sizes))
+        self.assertEqual([report.indexed for report in reports[:3]], [100, 200, 300])
+        self.assertGreater(stats.throughput, 0)
+
+        stats = self.vector_index.add_segments(Message(["more", "segments"]), progress=reports.append)
+        self.assertEqual(stats.indexed, 2)
+        docs = self.server.indices[self.vector_index.index_name]["docs"]
+        self.assertEqual(len(docs), 1002)
+        self.assertEqual(docs[0]["vector"], self.embedding.vector("segment 0"))
+
+    def test_create_index_idempotent(self):
+        self.vector_index.create_index(8)
+        other = appbuilder.BESVectorStoreIndex(cluster_id="test", user_name="user", password="password",
+                                               embedding=self.embedding, index_name=self.vector_index.index_name,
+                                               prefix="")
+        other.add_segments(Message(["a"]))
+        self.vector_index.add_segments(Message(["b"]))
+        self.assertEqual(len(self.server.indices[self.vector_index.index_name]["docs"]), 2)
+        mappings = self.server.indices[self.vector_index.index_name]["body"]["mappings"]
+        self.assertEqual(mappings["properties"]["vector"]["dims"], 8)
+
+    def test_batch_search(self):
+        """ 测试批量查询只计算一次向量并发送一次 msearch """
+        texts = ["segment {}".format(i) for i in range(50)]
+        self.vector_index.add_segments(Message(texts))
+        retriever = self.vector_index.as_retriever()
+        queries = [Message(texts[3]), Message(texts[17]), Message(texts[42])]
+        self.embedding.batch_sizes.clear()
+        results = retriever.batch(queries, top_k=3)
+        self.assertEqual(self.embedding.batch_sizes, [3])
+        self.assertEqual(self.server.msearches, [3])
+        self.assertEqual([res.content[0]["text"] for res in results], [texts[3], texts[17], texts[42]])
+        for query, res in zip(queries, results):
+            self.assertEqual(res.content, retriever(query, top_k=3).content)
+
+        self.server.msearch_errors = {1}
+        results = retriever.batch(queries, top_k=3)
+        self.assertIsInstance(results[1], appbuilder.AppBuilderServerException)
+        self.assertEqual(results[2].content[0]["text"], texts[42])
+        self.assertEqual(retriever.batch([]), [])
+
+    def test_batch_fusion(self):
+        texts = ["segment {}".format(i) for i in range(50)]
+        self.vector_index.add_segments(Message(texts))
+        retriever = self.vector_index.as_retriever()
+        fused = retriever.batch([Message(texts[3]), Message(texts[3]), Message(texts[9])], top_k=2, fusion="rrf")
+        self.assertEqual(fused.content[0]["text"], texts[3])
+        self.assertAlmostEqual(fused.content[0]["score"], 2 / 61)
+        self.assertEqual(len(fused.content), 2)
+        with self.assertRaises(ValueError):
+            retriever.batch([Message("a")], fusion="max")
+
+    def test_reciprocal_rank_fusion(self):
+        a = [{"text": "x", "meta": "", "score": 0.9}, {"text": "y", "meta": "", "score": 0.8}]
+        b = [{"text": "y", "meta": "", "score": 0.7}, {"text": "z", "meta": "", "score": 0.6}]
+        fused = appbuilder.BESRetriever.reciprocal_rank_fusion([a, b], top_k=3, k=1)
+        self.assertEqual([doc["text"] for doc in fused], ["y", "x", "z"])
+        self.assertAlmostEqual(fused[0]["score"], 1 / 3 + 1 / 2)
+        self.assertEqual(a[1]["score"], 0.8)
+
+    def test_hybrid_search(self):
+        """ 测试关键词与向量检索在一次 msearch 中完成并融合 """
+        texts = ["segment {}".format(i) for i in range(50)] + ["型号 X200 的说明书"]
+        self.vector_index.add_segments(Message(texts))
+        retriever = self.vector_index.as_hybrid_retriever(num_candidates=5)
+        self.server.searches.clear()
+        res = retriever(Message("X200"), top_k=3)
+        self.assertEqual(self.server.msearches, [2])
+        self.assertEqual(res.content[0]["text"], texts[-1])
+        self.assertIsNotNone(res.content[0]["lexical_score"])
+        self.assertEqual(len(res.content), 3)
+        self.assertEqual(self.server.searches[0]["query"], {"match": {"text": "X200"}})
+        self.assertEqual(self.server.searches[1]["size"], 5)
+        stats = retriever.last_stats
+        self.assertEqual((stats.lexical_ms, stats.vector_ms), (1.0, 1.0))
+        self.assertEqual((stats.lexical_hits, stats.vector_hits), (1, 5))
+
+        # 向量检索命中的文本仍参与融合
+        res = retriever(Message(texts[7]), top_k=1)
+        self.assertEqual(res.content[0]["text"], texts[7])
+
+        self.server.msearch_errors = {0}
+        with self.assertRaises(appbuilder.AppBuilderServerException):
+            retriever(Message("X200"))
+
+    def test_cache_invalidation(self):
+        """ 测试写入或删除数据后检索缓存失效 """
+        texts = ["segment {}".format(i) for i in range(20)]
+        self.vector_index.add_segments(Message(texts))
+        cache = appbuilder.CachedRetriever(self.vector_index.as_retriever())
+        cache(Message(texts[1]), top_k=2)
+        cache(Message(texts[1]), top_k=2)
+        self.assertEqual(len(self.server.searches), 1)
+
+        self.vector_index.add_segments(Message(["more"]))
+        cache(Message(texts[1]), top_k=2)
+        self.assertEqual(len(self.server.searches), 2)
+        self.vector_index.delete_all_segments()
+        self.assertEqual(cache(Message(texts[1]), top_k=2).content, [])
+        self.assertEqual(cache.stats().invalidations, 2)
+
+    def test_bulk_retry(self):
+        """ 测试 bulk 被限流的文档重试写入 """
+        self.server.reject = 5
+        stats = self.vector_index.add_segments(Message(["s{}".format(i) for i in range(20)]),
+                                               chunk_size=10, initial_backoff=0.01)
+        self.assertEqual((stats.indexed, stats.failed), (20, 0))
+        self.assertEqual(len(self.server.indices[self.vector_index.index_name]["docs"]), 20)
+
+        self.server.reject = 100
+        stats = self.vector_index.add_segments(Message(["x", "y"]), max_retries=1, initial_backoff=0.01,
+                                               raise_on_error=False)
+        self.assertEqual((stats.indexed, stats.failed), (0, 2))
+
+        self.server.reject = 100
+        with self.assertRaises(Exception) as ctx:
+            self.vector_index.add_segments(Message(["z"]), max_retries=1, initial_backoff=0.01)
+        self.assertEqual(len(ctx.exception.errors), 1)
+
+
+class TestBESRecallBenchmark(unittest.TestCase):
+    """ 对比不同 hnsw 参数下的召回率与检索耗时 """
+
+    def setUp(self):
+        self.server = _ESServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.environ = dict(os.environ)
+        os.environ["GATEWAY_URL"] = self.server.url
+        os.environ["APPBUILDER_TOKEN"] = "test"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        os.environ.clear()
+        os.environ.update(self.environ)
+
+    def test_search_ef(self):
+        retriever = appbuilder.BESRetriever(embedding=None, index_name="test", bes_client=None)
+        self.assertEqual(retriever.search_ef(1), 10)
+        self.assertEqual(retriever.search_ef(20), 40)
+        self.assertEqual(retriever.search_ef(20, ef=5), 20)
+        retriever = appbuilder.BESRetriever(embedding=None, index_name="test", bes_client=None, ef=64, ef_factor=3)
+        self.assertEqual(retriever.search_ef(10), 64)
+        self.assertEqual(retriever.search_ef(10, ef=16), 16)
+        with self.assertRaises(ValueError):
+            appbuilder.BESRetriever(embedding=None, index_name="test", bes_client=None, ef_factor=0.5)
+
+    def test_recall_latency_sweep(self):
+        rng = np.random.RandomState(0)
+        top_k = 10
+        docs = rng.normal(size=(1000, 16))
+        queries = rng.normal(size=(30, 16))
+        table = {"doc {}".format(i): vector.tolist() for i, vector in enumerate(docs)}
+        table.update({"query {}".format(i): vector.tolist() for i, vector in enumerate(queries)})
+        normed = docs / np.linalg.norm(docs, axis=1, keepdims=True)
+        truth = [set(np.argsort(-normed @ query)[:top_k].tolist()) for query in queries]
+        embedding = _TableEmbedding(table)
+
+        results = {}
+        for m, ef_construction in [(4, 200), (16, 200)]:
+            vector_index = appbuilder.BESVectorStoreIndex(cluster_id="test", user_name="user", password="password",
+                                                          embedding=embedding, prefix="", m=m,
+                                                          ef_construction=ef_construction)
+            vector_index.add_segments(Message(["doc {}".format(i) for i in range(len(docs))]), progress=id)
+            retriever = vector_index.as_retriever()
+            # 首次检索时构建图，不计入耗时
+            retriever(Message("query 0"), top_k=top_k)
+            for ef in [10, None, 100]:
+                hits, start = 0, time.perf_counter()
+                for i in range(len(queries)):
+                    res = retriever(Message("query {}".format(i)), top_k=top_k, ef=ef)
+                    hits += len(truth[i] & {int(doc["text"].split()[1]) for doc in res.content})
+                latency = (time.perf_counter() - start) / len(queries)
+                ef = retriever.search_ef(top_k, ef)
+                results[(m, ef)] = hits / (top_k * len(queries))
+                appbuilder.logger.info("m={} ef_construction={} ef={}: recall@{}={:.3f}, latency={:.2f}ms".format(
+                    m, ef_construction, ef, top_k, results[(m, ef)], latency * 1000))
+
+        # 候选集随 top_k 增大后召回率不低于原先固定的 ef=10
+        self.assertGreater(results[(4, 20)], results[(4, 10)])
+        self.assertGreater(results[(4, 100)], results[(4, 10)])
+        self.assertGreater(results[(16, 100)], results[(4, 10)])
+        self.assertGreaterEqual(results[(16, 100)], 0.95)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,130 @@
+# Copyright (c) 2023 Baidu, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import appbuilder
+from appbuilder.core.components.llms.cache import CompletionCache, FileCacheBackend, SqliteCacheBackend
+
+
+class _CompletionHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    calls = 0
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        _CompletionHandler.calls += 1
+        if request["response_mode"] == "streaming":
+            body = "".join("data: {}\n\n".format(json.dumps({"answer": a})) for a in ["he", "llo"]).encode()
+            content_type = "text/event-stream"
+        else:
+            body = json.dumps({"answer": "hello"}).encode()
+            content_type = "application/json"
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestCompletionCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _CompletionHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        patcher = mock.patch.dict(os.environ, {"APPBUILDER_TOKEN": "test"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        _CompletionHandler.calls = 0
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _component(self, cache):
+        component = appbuilder.StyleWriting(model="eb-turbo-appbuilder")
+        component.gateway = "http://127.0.0.1:{}".format(self.server.server_address[1])
+        component.set_completion_cache(cache)
+        return component
+
+    def _check_backend(self, cache):
+        component = self._component(cache)
+        message = appbuilder.Message("足球")
+        self.assertEqual(component(message).content, "hello")
+        self.assertEqual(component(message).content, "hello")
+        self.assertEqual(list(component(message, stream=True).content), ["hello"])
+        self.assertEqual(_CompletionHandler.calls, 1)
+
+        # 其它输入与高温度请求不命中缓存
+        self.assertEqual(component(message, length=300).content, "hello")
+        self.assertEqual(component(message, temperature=0.9).content, "hello")
+        self.assertEqual(_CompletionHandler.calls, 3)
+        stats = cache.stats()
+        self.assertEqual((stats.hits, stats.misses, stats.bypasses, stats.writes), (2, 2, 1, 2))
+
+        self.assertEqual(cache.invalidate("other_component"), 0)
+        self.assertEqual(cache.invalidate(component.name), 2)
+        component(message)
+        self.assertEqual(_CompletionHandler.calls, 4)
+
+    def test_memory_backend(self):
+        """ 测试内存缓存命中、回放与失效 """
+        self._check_backend(CompletionCache())
+
+    def test_sqlite_backend(self):
+        """ 测试sqlite缓存 """
+        backend = SqliteCacheBackend(os.path.join(self.tmpdir.name, "cache.db"))
+        self._check_backend(CompletionCache(backend))
+        backend.close()
+
+    def test_file_backend(self):
+        """ 测试文件缓存 """
+        self._check_backend(CompletionCache(FileCacheBackend(os.path.join(self.tmpdir.name, "cache"))))
+
+    def test_stream_replay(self):
+        """ 测试流式结果被完整消费后写入缓存，命中时按原分片回放 """
+        cache = CompletionCache()
+        component = self._component(cache)
+        message = appbuilder.Message("篮球")
+        self.assertEqual(list(component(message, stream=True).content), ["he", "llo"])
+        self.assertEqual(list(component(message, stream=True).content), ["he", "llo"])
+        self.assertEqual(component(message).content, "hello")
+        self.assertEqual(_CompletionHandler.calls, 1)
+
+        async def consume():
+            answer = await component.arun(message, stream=True)
+            return [chunk async for chunk in answer.content]
+
+        self.assertEqual(asyncio.run(consume()), ["he", "llo"])
+        self.assertEqual(_CompletionHandler.calls, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
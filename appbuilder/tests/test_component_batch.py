@@ -0,0 +1,81 @@
+# Copyright (c) 2023 Baidu, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import threading
+import time
+import unittest
+
+from appbuilder.core.component import Component
+from appbuilder.core.message import Message
+from appbuilder.core.utils import RateLimiter
+
+
+class _EchoComponent(Component):
+    def __init__(self):
+        super().__init__(secret_key="test", gateway="http://127.0.0.1")
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def run(self, message, suffix=""):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            time.sleep(0.02)
+            if message.content == "bad":
+                raise ValueError("bad input")
+            return Message(message.content + suffix)
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+class TestComponentBatch(unittest.TestCase):
+    def test_batch_order_and_errors(self):
+        """ 测试batch按输入顺序返回，单条失败不影响其它结果 """
+        component = _EchoComponent()
+        inputs = [Message(str(i)) for i in range(10)] + [Message("bad")]
+        results = component.batch(inputs, max_concurrency=3, suffix="!")
+        self.assertEqual([r.content for r in results[:10]], ["{}!".format(i) for i in range(10)])
+        self.assertIsInstance(results[10], ValueError)
+        self.assertLessEqual(component.max_running, 3)
+        self.assertEqual(component.batch([]), [])
+        with self.assertRaises(ValueError):
+            component.batch(inputs, max_concurrency=0)
+
+    def test_batch_rate_limit(self):
+        """ 测试batch遵守组件调用频率限制 """
+        component = _EchoComponent()
+        component.set_rate_limit(20, burst=1)
+        start = time.monotonic()
+        component.batch([Message(str(i)) for i in range(6)], max_concurrency=6)
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+
+    def test_abatch(self):
+        """ 测试abatch的并发上限与单条失败 """
+        component = _EchoComponent()
+        results = asyncio.run(component.abatch([Message("a"), Message("bad"), Message("b")], max_concurrency=1))
+        self.assertEqual(results[0].content, "a")
+        self.assertIsInstance(results[1], ValueError)
+        self.assertEqual(results[2].content, "b")
+        self.assertEqual(component.max_running, 1)
+
+    def test_rate_limiter_invalid(self):
+        with self.assertRaises(ValueError):
+            RateLimiter(0)
+
+
+if __name__ == '__main__':
+    unittest.main()
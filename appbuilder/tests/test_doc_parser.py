@@ -13,10 +13,50 @@
 # limitations under the License.
 
 
+import base64
+import copy
+import hashlib
+import io
+import json
+import mmap
+import tempfile
+import threading
+import time
+import tracemalloc
 import unittest
 import os
-from appbuilder.core.components.doc_parser.doc_parser import DocParser, ParserConfig
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from appbuilder.core.components.doc_parser.doc_parser import DocParser, ParserConfig, count_pdf_pages
+from appbuilder.core.components.doc_parser.base import LazyModelList, ParaNode, ParseResult
 from appbuilder.core.message import Message
+from appbuilder.utils.logger_util import logger
+
+# 设置 APPBUILDER_BENCHMARK=1 时按完整规模运行基准测试并校验耗时，默认只用小规模数据校验结果并记录耗时
+_BENCHMARK = bool(os.getenv("APPBUILDER_BENCHMARK"))
+
+
+class _DigestHandler(BaseHTTPRequestHandler):
+    """ 分块读取请求体并记录 sha256，不保留完整请求体 """
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        length = int(self.headers["Content-Length"])
+        digest = hashlib.sha256()
+        while length > 0:
+            chunk = self.rfile.read(min(length, 64 * 1024))
+            digest.update(chunk)
+            length -= len(chunk)
+        self.server.digests.append(digest.hexdigest())
+        body = json.dumps({"error_code": 0, "log_id": "1", "result": {"result_list": [
+            {"para_nodes": [], "catalog": [], "pdf_data": "", "file_content": []}]}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
 
 
 class TestDocParser(unittest.TestCase):
@@ -68,5 +108,415 @@ class TestDocParser(unittest.TestCase):
         self.assertIsNotNone(result.content.pdf_data)
 
 
+def _shard_result(pages, local=True):
+    """ 模拟云端对 page_filter 的解析结果：根节点、每页一个标题与一个正文 """
+    para_nodes = [{"node_id": 0, "text": "", "para_type": "root", "parent": None,
+                   "children": [], "position": []}]
+    catalog, file_content = [], []
+    for i, page in enumerate(pages):
+        page_num = i if local else page
+        title_id, text_id = len(para_nodes), len(para_nodes) + 1
+        position = [{"pageno": page_num, "box": [0, 0, 10, 10]}]
+        para_nodes[0]["children"].append(title_id)
+        para_nodes.append({"node_id": title_id, "text": "title {}".format(page), "para_type": "title",
+                           "parent": 0, "children": [text_id], "position": position})
+        para_nodes.append({"node_id": text_id, "text": "text {}".format(page), "para_type": "text",
+                           "parent": title_id, "children": [], "position": position})
+        catalog.append({"node_id": title_id, "text": "title {}".format(page), "level": "title",
+                        "position": position})
+        layouts = [{"type": "title", "text": "title {}".format(page), "box": [0, 0, 10, 10], "node_id": title_id},
+                   {"type": "text", "text": "text {}".format(page), "box": [0, 0, 10, 10], "node_id": text_id}]
+        file_content.append({"page_num": page_num, "page_size": {"width": 100, "height": 100},
+                             "page_angle": 0, "page_content": {"type": "text", "layout": layouts}})
+    return {"para_nodes": para_nodes, "catalog": catalog, "file_content": file_content, "pdf_data": ""}
+
+
+def _make_pdf(page_count, updated_page_count=None):
+    """ 生成使用 xref 表的最小 PDF，updated_page_count 不为 None 时追加一次增量更新，改写 /Pages 节点 """
+    def pages(count):
+        kids = " ".join("{} 0 R".format(i + 3) for i in range(count))
+        return "<< /Type /Pages /Kids [{}] /Count {} >>".format(kids, count).encode()
+
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", pages(page_count)]
+    objects += [b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 100 100] >>"] * page_count
+    data = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(data))
+        data += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(data)
+    data += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    data += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    data += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    if updated_page_count is not None:
+        offset = len(data)
+        data += b"2 0 obj\n%s\nendobj\n" % pages(updated_page_count)
+        prev, xref = xref, len(data)
+        data += b"xref\n0 1\n0000000000 65535 f \n2 1\n%010d 00000 n \n" % offset
+        data += b"trailer\n<< /Size %d /Root 1 0 R /Prev %d >>\nstartxref\n%d\n%%%%EOF\n" % (
+            len(objects) + 1, prev, xref)
+    return data
+
+
+class _ShardHandler(BaseHTTPRequestHandler):
+    """ 按 page_filter 返回模拟的分片解析结果 """
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        pages = request["file_list"][0]["page_filter"]
+        with self.server.lock:
+            self.server.shards.append(pages)
+            self.server.active += 1
+            self.server.max_active = max(self.server.max_active, self.server.active)
+        time.sleep(0.05)
+        with self.server.lock:
+            self.server.active -= 1
+        body = json.dumps({"error_code": 0, "log_id": "1", "result": {"result_list": [
+            _shard_result(pages)]}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestDocParserShards(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _ShardHandler)
+        cls.server.lock = threading.Lock()
+        cls.gateway = "http://127.0.0.1:{}".format(cls.server.server_address[1])
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.shards, self.server.active, self.server.max_active = [], 0, 0
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "manual.pdf")
+        with open(self.path, "wb") as f:
+            f.write(_make_pdf(10))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_count_pdf_pages(self):
+        self.assertEqual(count_pdf_pages(self.path), 10)
+        self.assertEqual(count_pdf_pages(os.path.join(os.path.dirname(__file__), "test.pdf")), 1)
+        other = os.path.join(self.tmpdir.name, "a.txt")
+        with open(other, "wb") as f:
+            f.write(b"/Type /Page")
+        self.assertIsNone(count_pdf_pages(other))
+
+    def test_count_pdf_pages_incremental_update(self):
+        """ 测试增量更新删除页面后以最新的 xref 段为准，旧版本的页面对象仍留在文件中 """
+        path = os.path.join(self.tmpdir.name, "updated.pdf")
+        with open(path, "wb") as f:
+            f.write(_make_pdf(10, updated_page_count=7))
+        self.assertEqual(count_pdf_pages(path), 7)
+        with open(path, "wb") as f:
+            f.write(_make_pdf(3, updated_page_count=5))
+        self.assertEqual(count_pdf_pages(path), 5)
+
+        # 没有 xref 表时无法统计，解析时不分片
+        with open(path, "wb") as f:
+            f.write(b"%PDF-1.4\n" + b"<< /Type /Page /Parent 3 0 R >>\n" * 10 + b"<< /Type /Pages /Count 10 >>\n")
+        self.assertIsNone(count_pdf_pages(path))
+
+    def test_parse_shards(self):
+        """ 测试按页分片并发解析，并合并为与整篇解析一致的结果 """
+        parser = DocParser(secret_key="test", gateway=self.gateway)
+        result = parser(Message(self.path), pages_per_shard=3, max_workers=4).content
+        self.assertEqual(sorted(self.server.shards), [[0, 1, 2], [3, 4, 5], [6, 7, 8], [9]])
+        self.assertGreater(self.server.max_active, 1)
+
+        expected = parser.make_parse_result(_shard_result(list(range(10)), local=False))
+        self.assertEqual([page.page_num for page in result.page_contents], list(range(10)))
+        nodes = result.para_node_tree
+        self.assertEqual([node.node_id for node in nodes], list(range(len(nodes))))
+        for node in nodes:
+            for child in node.children:
+                self.assertEqual(nodes[child].parent, node.node_id)
+        texts = [node.text for node in nodes if node.para_type != "root"]
+        self.assertEqual(texts, [node["text"] for node in expected["para_node_tree"] if node["para_type"] != "root"])
+        for page in result.page_contents:
+            self.assertEqual(len(page.page_layouts), 1)
+            self.assertEqual(page.page_layouts[0].text, "text {}".format(page.page_num))
+            self.assertEqual(nodes[page.page_layouts[0].node_id].text, "text {}".format(page.page_num))
+
+    def test_parse_shards_page_filter(self):
+        parser = DocParser(secret_key="test", gateway=self.gateway)
+        parser.set_config(ParserConfig(page_filter=[2, 3, 4, 5, 6]))
+        result = parser(Message(self.path), pages_per_shard=2, return_raw=True).content
+        self.assertEqual(sorted(self.server.shards), [[2, 3], [4, 5], [6]])
+        self.assertEqual([page.page_num for page in result.page_contents], [2, 3, 4, 5, 6])
+        self.assertEqual(len(result.raw["shards"]), 3)
+        with self.assertRaises(ValueError):
+            parser(Message(io.BytesIO(b"%PDF-")), pages_per_shard=2)
+
+    def test_merge_absolute_page_numbers(self):
+        shards = [[0, 1], [2, 3]]
+        merged = DocParser.merge_shard_results([_shard_result(pages, local=False) for pages in shards], shards)
+        self.assertEqual([content["page_num"] for content in merged["file_content"]], [0, 1, 2, 3])
+        self.assertEqual([title["position"][0]["pageno"] for title in merged["catalog"]], [0, 1, 2, 3])
+        self.assertEqual([title["node_id"] for title in merged["catalog"]], [1, 3, 6, 8])
+        self.assertEqual(merged["para_nodes"][5]["children"], [6, 8])
+
+
+def _large_response(pages=200, layouts_per_page=100, tables_per_page=2):
+    """ 构造大文档的模拟解析结果，每页一个标题、若干正文与表格 """
+    para_nodes, catalog, file_content = [], [], []
+    box = [0, 0, 10, 10]
+    for page in range(pages):
+        layouts = []
+        for i in range(layouts_per_page):
+            node_id = len(para_nodes)
+            position = [{"pageno": page, "box": box}]
+            if i == 0:
+                para_type = "title"
+                catalog.append({"node_id": node_id, "text": "t", "level": "title", "position": position})
+                layout = {"type": "title", "text": "t", "box": box, "node_id": node_id}
+            elif i <= tables_per_page:
+                para_type = "table"
+                cells = [{"type": "cell", "text": "c{}".format(c), "box": box, "node_id": c} for c in range(6)]
+                layout = {"type": "table", "box": box, "node_id": node_id, "children": cells,
+                          "matrix": [[r * 3, r * 3 + 1, r * 3 + 1, r * 3 + 2] for r in range(2)]}
+            else:
+                para_type = "text"
+                layout = {"type": "text", "text": "x" * 50, "box": box, "node_id": node_id}
+            para_nodes.append({"node_id": node_id, "text": layout.get("text", ""), "para_type": para_type,
+                               "parent": None, "children": [], "position": position})
+            layouts.append(layout)
+        file_content.append({"page_num": page, "page_size": {"width": 100, "height": 100}, "page_angle": 0,
+                             "page_content": {"type": "text", "layout": layouts}})
+    return {"para_nodes": para_nodes, "catalog": catalog, "file_content": file_content, "pdf_data": ""}
+
+
+def _reference_make_parse_result(response):
+    """ 优化前的 make_parse_result 实现，用于核对结果与基准测试 """
+    para_nodes = response["para_nodes"] if response["para_nodes"] is not None else []
+    catalog = response["catalog"] if response["catalog"] is not None else []
+    title_node_ids = [title["node_id"] for title in catalog] if catalog else []
+    page_contents = []
+    for content in response["file_content"]:
+        page_content = {"page_num": content["page_num"], "page_width": content["page_size"]["width"],
+                        "page_height": content["page_size"]["height"], "page_angle": content["page_angle"],
+                        "page_type": content["page_content"]["type"], "page_layouts": [], "page_titles": [],
+                        "page_tables": []}
+        for layout_item in content["page_content"]["layout"]:
+            if layout_item["node_id"] in title_node_ids:
+                continue
+            if layout_item["type"] == "table":
+                page_content["page_tables"].append(layout_item)
+                if para_nodes:
+                    para_nodes[layout_item["node_id"]]["table"] = layout_item
+                    table_row = []
+                    for i in range(len(layout_item["matrix"])):
+                        cell_index = layout_item["matrix"][i]
+                        row_markdown = "|" + "|".join(
+                            [layout_item["children"][index]["text"] for index in set(cell_index)]) + "|"
+                        if i != len(layout_item["matrix"]) - 1:
+                            row_markdown += "\n"
+                        table_row.append(row_markdown)
+                    para_nodes[layout_item["node_id"]]["text"] = "".join(table_row)
+            else:
+                page_content["page_layouts"].append(layout_item)
+        page_contents.append(page_content)
+    for title in catalog:
+        page_num = title["position"][0]["pageno"]
+        page_contents[page_num]["page_titles"].append(
+            {"text": title["text"], "type": title["level"], "box": title["position"][0]["box"],
+             "node_id": title["node_id"]})
+    return {"para_node_tree": para_nodes, "page_contents": page_contents, "pdf_data": response["pdf_data"]}
+
+
+class TestMakeParseResult(unittest.TestCase):
+    def test_same_result_as_reference(self):
+        response = _large_response(pages=5, layouts_per_page=20)
+        expected = _reference_make_parse_result(copy.deepcopy(response))
+        result = DocParser(secret_key="test").make_parse_result(copy.deepcopy(response))
+        self.assertEqual(result, expected)
+        self.assertEqual(result["para_node_tree"][1]["text"], "|c0|c1|c2|\n|c3|c4|c5|")
+
+    def test_table_markdown_column_order(self):
+        """ 测试合并单元格去重后保持列的顺序 """
+        cells = [{"type": "cell", "text": "c{}".format(c), "box": [0, 0, 1, 1], "node_id": c} for c in range(12)]
+        table = {"type": "table", "box": [0, 0, 1, 1], "node_id": 0, "children": cells,
+                 "matrix": [[r * 3, r * 3 + 1, r * 3 + 1, r * 3 + 2] for r in range(4)]}
+        response = {"para_nodes": [{"node_id": 0, "text": "", "para_type": "table", "parent": None,
+                                    "children": [], "position": []}], "catalog": [], "pdf_data": "",
+                    "file_content": [{"page_num": 0, "page_size": {"width": 1, "height": 1}, "page_angle": 0,
+                                      "page_content": {"type": "text", "layout": [table]}}]}
+        result = DocParser(secret_key="test").make_parse_result(response)
+        self.assertEqual(result["para_node_tree"][0]["text"], "|c0|c1|c2|\n|c3|c4|c5|\n|c6|c7|c8|\n|c9|c10|c11|")
+
+    def test_lazy_parse_result(self):
+        """ 测试延迟校验的 ParseResult 与完整校验的结果一致 """
+        parse_result = DocParser(secret_key="test").make_parse_result(_large_response(pages=3, layouts_per_page=10))
+        eager = ParseResult.parse_obj(parse_result)
+        lazy = ParseResult.lazy_parse_obj(parse_result)
+        self.assertIsInstance(lazy.para_node_tree, LazyModelList)
+        self.assertIsInstance(list.__getitem__(lazy.para_node_tree, 5), dict)
+        self.assertIsInstance(lazy.para_node_tree[5], ParaNode)
+        self.assertIs(lazy.para_node_tree[5], lazy.para_node_tree[5])
+        self.assertEqual(lazy.para_node_tree[-1], eager.para_node_tree[-1])
+        self.assertEqual(lazy.para_node_tree[2:4], eager.para_node_tree[2:4])
+        self.assertEqual(list(reversed(lazy.page_contents)), list(reversed(eager.page_contents)))
+        self.assertEqual(lazy.dict(), eager.dict())
+        self.assertEqual(ParseResult.lazy_parse_obj({}).para_node_tree, [])
+
+    def test_lazy_model_list_methods(self):
+        """ 测试 LazyModelList 的其余列表方法同样返回转换后的 model """
+        nodes = [{"node_id": i, "text": "t{}".format(i), "para_type": "text", "parent": None,
+                  "children": [], "position": []} for i in range(5)]
+        eager = [ParaNode.parse_obj(node) for node in nodes]
+
+        lazy = LazyModelList(nodes, ParaNode)
+        self.assertEqual(lazy, eager)
+        self.assertTrue(all(isinstance(list.__getitem__(lazy, i), ParaNode) for i in range(5)))
+        self.assertEqual(LazyModelList(nodes, ParaNode), LazyModelList(nodes, ParaNode))
+        self.assertNotEqual(LazyModelList(nodes, ParaNode), eager[:4])
+
+        lazy = LazyModelList(nodes, ParaNode)
+        self.assertEqual(lazy.pop(), eager[4])
+        self.assertEqual(lazy.pop(0), eager[0])
+        self.assertEqual(len(lazy), 3)
+        self.assertIn(eager[2], lazy)
+        self.assertNotIn(eager[0], lazy)
+        self.assertEqual(lazy.index(eager[3]), 2)
+        self.assertEqual(lazy.count(eager[1]), 1)
+
+        lazy = LazyModelList(nodes, ParaNode)
+        copied = lazy.copy()
+        self.assertIsInstance(copied, LazyModelList)
+        self.assertIsInstance(copied[0], ParaNode)
+        self.assertIsInstance(list.__getitem__(lazy, 0), dict)
+        self.assertEqual(lazy[1:3], eager[1:3])
+        self.assertEqual(lazy[::-2], eager[::-2])
+        self.assertEqual(lazy + [], eager)
+        self.assertEqual([] + lazy, eager)
+        self.assertEqual(lazy * 2, eager * 2)
+        lazy.sort(key=lambda node: -node.node_id)
+        self.assertEqual(lazy, eager[::-1])
+        self.assertEqual(sorted(LazyModelList(nodes, ParaNode), key=lambda node: node.node_id), eager)
+
+    def test_make_parse_result_benchmark(self):
+        """ 基准测试：200 页、每页 100 个版面元素的解析结果转换耗时 """
+        pages = 200 if _BENCHMARK else 20
+        response = _large_response(pages=pages)
+        reference_input, input = copy.deepcopy(response), copy.deepcopy(response)
+        parser = DocParser(secret_key="test")
+
+        start = time.perf_counter()
+        expected = _reference_make_parse_result(reference_input)
+        reference_time = time.perf_counter() - start
+        start = time.perf_counter()
+        result = parser.make_parse_result(input)
+        make_time = time.perf_counter() - start
+        self.assertEqual(result, expected)
+
+        start = time.perf_counter()
+        ParseResult.parse_obj(result)
+        eager_time = time.perf_counter() - start
+        start = time.perf_counter()
+        lazy = ParseResult.lazy_parse_obj(result)
+        lazy_time = time.perf_counter() - start
+        self.assertEqual(len(lazy.para_node_tree), pages * 100)
+
+        logger.info("{} pages: make_parse_result {:.3f}s (before {:.3f}s), parse_obj {:.3f}s, "
+                    "lazy_parse_obj {:.5f}s".format(pages, make_time, reference_time, eager_time, lazy_time))
+        if _BENCHMARK:
+            self.assertLess(make_time, reference_time)
+            self.assertLess(lazy_time, eager_time)
+
+
+class TestDocParserStreamUpload(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _DigestHandler)
+        cls.server.digests = []
+        cls.gateway = "http://127.0.0.1:{}".format(cls.server.server_address[1])
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.parser = DocParser(secret_key="test", gateway=self.gateway)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _write_file(self, size):
+        path = os.path.join(self.tmpdir.name, "doc.pdf")
+        with open(path, "wb") as f:
+            for offset in range(0, size, 1 << 20):
+                f.write(os.urandom(min(1 << 20, size - offset)))
+        return path
+
+    def _expected_digest(self, data, name):
+        param = self.parser.config.dict(by_alias=True)
+        param["name"] = name
+        param["data"] = base64.b64encode(data).decode()
+        return hashlib.sha256(json.dumps({"file_list": [param]}).encode()).hexdigest()
+
+    def test_stream_body_matches_json_payload(self):
+        """ 测试流式请求体与一次性 json.dumps 的结果逐字节一致 """
+        for size in (0, 1, 2, 3, 1000, 3 * 256 * 1024 + 1):
+            data = os.urandom(size)
+            body = self.parser._request_body(io.BytesIO(data), "a.pdf")
+            chunks = []
+            while True:
+                chunk = body.read(8191)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+            payload = b"".join(chunks)
+            self.assertEqual(len(payload), len(body))
+            self.assertEqual(hashlib.sha256(payload).hexdigest(), self._expected_digest(data, "a.pdf"))
+            # 重试时可以从头重新发送
+            body.seek(0)
+            self.assertEqual(body.read(), payload)
+
+    def test_upload_path_and_mmap(self):
+        """ 测试文件路径与 mmap 两种输入 """
+        path = self._write_file(100 * 1024)
+        with open(path, "rb") as f:
+            data = f.read()
+        self.parser(Message(path))
+        self.assertEqual(self.server.digests[-1], self._expected_digest(data, "doc.pdf"))
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            self.parser(Message(m))
+        self.assertEqual(self.server.digests[-1], self._expected_digest(data, "file"))
+        with self.assertRaises(ValueError):
+            self.parser(Message(123))
+
+    def test_upload_peak_memory_benchmark(self):
+        """ 基准测试：上传 32MB 文件的内存峰值，原实现约为文件大小的 4 倍 """
+        size = 32 * 1024 * 1024
+        path = self._write_file(size)
+        tracemalloc.start()
+        try:
+            start = time.perf_counter()
+            self.parser(Message(path))
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        logger.info("doc parser upload {}MB: peak memory {:.1f}MB, {:.2f}s".format(
+            size >> 20, peak / (1 << 20), elapsed))
+        self.assertLess(peak, size / 4)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -13,13 +13,22 @@
 # limitations under the License.
 
 
+import gc
 import json
+import random
+import time
 import unittest
 import os
+from unittest import mock
 
 from appbuilder.utils.logger_util import logger
 from appbuilder import Message, DocParser
-from appbuilder.core.components.doc_splitter.doc_splitter import DocSplitter
+from appbuilder.core.components.doc_splitter.doc_splitter import DocSplitter, TitleSplitter
+from appbuilder.core.components.doc_splitter.chunk_engine import iter_chunks
+from appbuilder.core.components.doc_parser.base import DocSegment, ParaNode, ParseResult
+
+# 设置 APPBUILDER_BENCHMARK=1 时按完整规模运行基准测试并校验耗时，默认只用小规模数据校验结果并记录耗时
+_BENCHMARK = bool(os.getenv("APPBUILDER_BENCHMARK"))
 
 
 class TestDocSplitter(unittest.TestCase):
@@ -91,6 +100,195 @@ class TestDocSplitter(unittest.TestCase):
             doc_splitter.run(message)
 
 
+class TestLocalChunkSplitter(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(os.environ, {"APPBUILDER_TOKEN": "test"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        sentences = ["第{}句话，内容长度不等{}。".format(i, "啊" * (i % 7)) for i in range(300)]
+        self.paragraphs = [(i + 1, "".join(sentences[i * 10:(i + 1) * 10])) for i in range(30)]
+        nodes = [{"node_id": 0, "text": "", "para_type": "root", "parent": None, "children": [], "position": []}]
+        for node_id, text in self.paragraphs:
+            nodes.append({"node_id": node_id, "text": text, "para_type": "text", "parent": 0,
+                          "children": [], "position": []})
+        nodes.append({"node_id": 31, "text": "页脚", "para_type": "head_tail", "parent": 0,
+                      "children": [], "position": []})
+        self.nodes = nodes
+
+    def test_chunk_boundaries(self):
+        """ 测试块长度、分隔符截断与重叠 """
+        text = "".join(text for _, text in self.paragraphs)
+        chunks = list(iter_chunks(self.paragraphs, max_segment_length=100, overlap=0))
+        self.assertEqual("".join(chunk["text"] for chunk in chunks), text)
+        for chunk in chunks:
+            self.assertLessEqual(len(chunk["text"]), 100)
+        for chunk in chunks[:-1]:
+            self.assertEqual(chunk["text"][-1], "。")
+
+        chunks = list(iter_chunks(self.paragraphs, max_segment_length=100, overlap=20))
+        for prev, chunk in zip(chunks, chunks[1:]):
+            self.assertEqual(prev["text"][-20:], chunk["text"][:20])
+        self.assertTrue(text.endswith(chunks[-1]["text"]))
+        self.assertEqual(chunks[0]["node_ids"], [1])
+
+        # 没有分隔符时按长度截断
+        chunks = list(iter_chunks([(1, "x" * 25)], max_segment_length=10, overlap=2))
+        self.assertEqual([chunk["text"] for chunk in chunks], ["x" * 10, "x" * 10, "x" * 9])
+        with self.assertRaises(ValueError):
+            list(iter_chunks([(1, "x")], max_segment_length=10, overlap=10))
+
+    def test_streaming(self):
+        """ 测试输入未结束时即返回已确定的块 """
+        consumed = []
+
+        def paragraphs():
+            for item in self.paragraphs:
+                consumed.append(item[0])
+                yield item
+
+        chunks = iter_chunks(paragraphs(), max_segment_length=100, overlap=10, join_symbol="\n")
+        next(chunks)
+        self.assertLess(len(consumed), len(self.paragraphs))
+        streamed = [chunk["text"] for chunk in chunks]
+        batch = [chunk["text"] for chunk in iter_chunks(self.paragraphs, 100, 10, join_symbol="\n")]
+        self.assertEqual(streamed, batch[1:])
+
+    def test_doc_splitter_local_engine(self):
+        """ 测试 DocSplitter 选择本地切分，结果与直接切分段落一致 """
+        splitter = DocSplitter(splitter_type="split_by_chunk", max_segment_length=200, overlap=50, engine="local")
+        expected = list(iter_chunks(self.paragraphs, 200, 50))
+        result = splitter(Message(ParseResult.parse_obj({"para_node_tree": self.nodes})))
+        self.assertEqual(result.content["paragraphs"], expected)
+        result = splitter(Message(ParseResult.lazy_parse_obj({"para_node_tree": self.nodes})), stream=True)
+        self.assertEqual(list(result.content), expected)
+        self.assertNotIn("页脚", "".join(chunk["text"] for chunk in expected))
+
+
+def _make_tree(size, depth, seed=0):
+    """ 构造节点树：标题最多嵌套 depth 层，标题下为若干正文，夹杂页眉页脚 """
+    rng = random.Random(seed)
+    nodes = [{"node_id": 0, "text": "", "para_type": "root", "parent": None, "children": [], "position": []}]
+    stack = [0]
+    while len(nodes) < size:
+        node_id = len(nodes)
+        r = rng.random()
+        if r < 0.25:
+            while len(stack) > rng.randint(1, depth):
+                stack.pop()
+            nodes.append({"node_id": node_id, "text": "标题{}".format(node_id), "para_type": "title_1",
+                          "parent": stack[-1], "children": [], "position": []})
+            stack.append(node_id)
+        else:
+            para_type = "head_tail" if r > 0.95 else "text"
+            nodes.append({"node_id": node_id, "text": "正文{}".format(node_id), "para_type": para_type,
+                          "parent": stack[-1], "children": [], "position": []})
+    return nodes
+
+
+def _construct(nodes):
+    """ 不校验地构造 ParseResult，基准测试中排除 pydantic 校验的耗时 """
+    return ParseResult.construct(para_node_tree=[ParaNode.construct(**node) for node in nodes])
+
+
+def _reference_title_split(para_node_tree):
+    """ 优化前的 TitleSplitter 实现，用于核对结果与基准测试 """
+    def get_title(nodes, parent_id, titles):
+        def inner_get_titles(nodes, parent_id, titles):
+            if parent_id:
+                titles.append(nodes[parent_id].text)
+                inner_get_titles(nodes, nodes[parent_id].parent, titles)
+        inner_get_titles(nodes, parent_id, titles)
+        return titles[::-1]
+
+    doc_segments = []
+    paragraphs = []
+    segment = DocSegment()
+    for i in range(1, len(para_node_tree)):
+        node = para_node_tree[i]
+        if node.para_type == "head_tail":
+            continue
+        if node.para_type[:5] != "title":
+            segment.content += " " + node.text
+            if i < len(para_node_tree) - 1 and para_node_tree[i + 1].para_type[:5] == "title" or i == len(
+                    para_node_tree) - 1:
+                segment.title = get_title(para_node_tree, node.parent, [])
+                doc_segments.append(segment)
+                paragraphs.append({"text": " ".join(segment.title) + " " + segment.content, "node_id": i})
+                segment = DocSegment()
+    if segment.content:
+        segment.title = get_title(para_node_tree, node.parent, [])
+        doc_segments.append(segment)
+        paragraphs.append({"text": " ".join(segment.title) + " " + segment.content, "node_id": i})
+    return {"doc_segments": doc_segments, "paragraphs": paragraphs}
+
+
+class TestTitleSplitter(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(os.environ, {"APPBUILDER_TOKEN": "test"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.splitter = TitleSplitter()
+
+    def test_same_result_as_reference(self):
+        for seed in range(20):
+            nodes = _make_tree(300, depth=6, seed=seed)
+            if seed % 2:
+                nodes[-1]["para_type"] = "head_tail"
+            expected = _reference_title_split(ParseResult.parse_obj({"para_node_tree": nodes}).para_node_tree)
+            result = self.splitter(Message(ParseResult.parse_obj({"para_node_tree": nodes}))).content
+            self.assertEqual(result, expected)
+            result = self.splitter(Message(ParseResult.lazy_parse_obj({"para_node_tree": nodes}))).content
+            self.assertEqual(result, expected)
+
+    def test_deep_tree(self):
+        """ 测试超过递归深度限制的标题层级 """
+        depth = 5000
+        nodes = [{"node_id": 0, "text": "", "para_type": "root", "parent": None, "children": [], "position": []}]
+        for i in range(1, depth + 1):
+            nodes.append({"node_id": i, "text": "t{}".format(i), "para_type": "title", "parent": i - 1,
+                          "children": [], "position": []})
+        nodes.append({"node_id": depth + 1, "text": "body", "para_type": "text", "parent": depth,
+                      "children": [], "position": []})
+        segments = list(self.splitter.iter_segments(Message(_construct(nodes))))
+        self.assertEqual(len(segments), 1)
+        segment, paragraph = segments[0]
+        self.assertEqual(len(segment.title), depth)
+        self.assertEqual(segment.title[0], "t1")
+        self.assertEqual(paragraph["node_id"], depth + 1)
+
+    def _benchmark(self, nodes):
+        parse_result = _construct(nodes)
+        gc.collect()
+        start = time.perf_counter()
+        expected = _reference_title_split(parse_result.para_node_tree)
+        reference_time = time.perf_counter() - start
+        gc.collect()
+        start = time.perf_counter()
+        result = self.splitter(Message(parse_result)).content
+        split_time = time.perf_counter() - start
+        self.assertEqual(result["paragraphs"], expected["paragraphs"])
+        return split_time, reference_time
+
+    def test_title_splitter_benchmark(self):
+        """ 基准测试：100k 节点的节点树，分别为标题嵌套较深与单个标题下正文很长两种情况 """
+        size = 100000 if _BENCHMARK else 10000
+        split_time, reference_time = self._benchmark(_make_tree(size, depth=100))
+        logger.info("title splitter on {} nodes with nested titles: {:.3f}s (before {:.3f}s)".format(
+            size, split_time, reference_time))
+
+        section = size // 5
+        nodes = [{"node_id": 0, "text": "", "para_type": "root", "parent": None, "children": [], "position": []}]
+        for i in range(1, size + 1):
+            title = i % section == 1
+            nodes.append({"node_id": i, "text": "标题" if title else "正文内容" * 5,
+                          "para_type": "title" if title else "text", "parent": 0 if title else i - (i - 1) % section,
+                          "children": [], "position": []})
+        split_time, reference_time = self._benchmark(nodes)
+        logger.info("title splitter on {} nodes with long sections: {:.3f}s (before {:.3f}s)".format(
+            size, split_time, reference_time))
+        if _BENCHMARK:
+            self.assertLess(split_time, reference_time)
+
 if __name__ == '__main__':
     # unittest.main()
     suite = unittest.TestLoader().loadTestsFromTestCase(TestDocSplitter)
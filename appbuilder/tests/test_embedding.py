@@ -6,11 +6,17 @@ import sys
 sys.path.append('../..')
 
 import unittest
+from unittest import mock
 import asyncio
 
 import appbuilder
 
 import numpy as np
+import json
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 
 class TestEmbedding(unittest.TestCase):
@@ -43,5 +49,221 @@ class TestEmbedding(unittest.TestCase):
         print(embedding_1.content)
 
 
+class _ThrottlingHandler(BaseHTTPRequestHandler):
+    """ 每个请求第一次返回限流错误，之后返回每条文本的长度作为embedding """
+    protocol_version = "HTTP/1.1"
+    lock = threading.Lock()
+    seen = set()
+    in_flight = 0
+    max_in_flight = 0
+    texts = []
+
+    def do_POST(self):
+        texts = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))["input"]
+        cls = self.__class__
+        with cls.lock:
+            throttled = texts[0] not in cls.seen
+            cls.seen.add(texts[0])
+            cls.in_flight += 1
+            if not throttled:
+                cls.texts.extend(texts)
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        time.sleep(0.01)
+        if throttled:
+            data = {"error_code": 18, "error_msg": "Open api qps request limit reached"}
+        else:
+            data = {"data": [{"embedding": [float(len(text))]} for text in texts]}
+        body = json.dumps(data).encode()
+        with cls.lock:
+            cls.in_flight -= 1
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestEmbeddingConcurrency(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _ThrottlingHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        patcher = mock.patch.dict(os.environ, {"APPBUILDER_TOKEN": "test"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.embedding = appbuilder.Embedding()
+        self.embedding.gateway = "http://127.0.0.1:{}".format(self.server.server_address[1])
+        self.embedding.throttle_backoff = 0.001
+        _ThrottlingHandler.seen = set()
+        _ThrottlingHandler.max_in_flight = 0
+        self.texts = ["t{}-".format(i) + "x" * (i % 7) for i in range(100)]
+
+    def test_concurrent_batch(self):
+        """ 测试并发batch在限流重试后按输入顺序返回 """
+        result = self.embedding.batch(self.texts, max_concurrency=3)
+        self.assertEqual(result.content, [[float(len(text))] for text in self.texts])
+        self.assertLessEqual(_ThrottlingHandler.max_in_flight, 3)
+        self.assertGreater(_ThrottlingHandler.max_in_flight, 1)
+
+    def test_stream_batch(self):
+        """ 测试流式返回每个请求的结果 """
+        chunks = list(self.embedding.batch(self.texts, max_concurrency=4, stream=True).content)
+        self.assertEqual([len(chunk) for chunk in chunks], [16] * 6 + [4])
+        self.assertEqual(sum(chunks, []), [[float(len(text))] for text in self.texts])
+
+    def test_throttle_retries_exhausted(self):
+        """ 测试超过重试次数后抛出限流异常 """
+        self.embedding.throttle_retries = 0
+        with self.assertRaises(appbuilder.TooManyRequestsException):
+            self.embedding.batch(self.texts[:3])
+
+    def test_abatch_concurrency(self):
+        """ 测试异步batch的并发上限 """
+        result = asyncio.run(self.embedding.abatch(self.texts, max_concurrency=2))
+        self.assertEqual(result.content, [[float(len(text))] for text in self.texts])
+        self.assertLessEqual(_ThrottlingHandler.max_in_flight, 2)
+
+
+class TestEmbeddingCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _ThrottlingHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        patcher = mock.patch.dict(os.environ, {"APPBUILDER_TOKEN": "test"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "cache.db")
+        _ThrottlingHandler.seen = set()
+        _ThrottlingHandler.texts = []
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _embedding(self, cache):
+        embedding = appbuilder.Embedding(cache=cache)
+        embedding.gateway = "http://127.0.0.1:{}".format(self.server.server_address[1])
+        embedding.throttle_backoff = 0.001
+        return embedding
+
+    def test_only_misses_requested(self):
+        """ 测试只有未命中缓存的文本会请求服务，且磁盘缓存可跨实例复用 """
+        cache = appbuilder.EmbeddingCache(path=self.path)
+        embedding = self._embedding(cache)
+        texts = ["a" * i for i in range(1, 21)]
+        first = embedding.batch(texts[:10], max_concurrency=2)
+        self.assertEqual(_ThrottlingHandler.texts, texts[:10])
+
+        _ThrottlingHandler.texts = []
+        second = embedding.batch(texts + texts[:3], max_concurrency=2)
+        self.assertEqual(_ThrottlingHandler.texts, texts[10:])
+        self.assertEqual(second.content, [[float(len(text))] for text in texts + texts[:3]])
+        self.assertEqual(second.content[:10], first.content)
+        stats = cache.stats()
+        self.assertEqual(stats.hits, 13)
+        self.assertEqual(stats.misses, 20)
+        self.assertEqual(stats.disk_items, 20)
+        cache.close()
+
+        # 新实例只有磁盘缓存
+        cache = appbuilder.EmbeddingCache(path=self.path)
+        embedding = self._embedding(cache)
+        _ThrottlingHandler.texts = []
+        self.assertEqual(embedding("aaa").content, [3.0])
+        self.assertEqual(asyncio.run(embedding.abatch(texts)).content, [[float(len(text))] for text in texts])
+        self.assertEqual(_ThrottlingHandler.texts, [])
+        self.assertEqual(cache.stats().disk_hits, 20)
+        cache.close()
+
+    def test_eviction_and_ttl(self):
+        """ 测试容量淘汰与过期 """
+        cache = appbuilder.EmbeddingCache(path=self.path, max_memory_items=2, max_disk_items=3)
+        cache.put_many("m", ["a", "b", "c", "d"], [[1.0], [2.0], [3.0], [4.0]])
+        stats = cache.stats()
+        self.assertEqual(stats.memory_items, 2)
+        self.assertEqual(stats.disk_items, 3)
+        self.assertEqual(cache.get_many("m", ["d", "c", "x"]), [[4.0], [3.0], None])
+        self.assertEqual(cache.get_many("other", ["d"]), [None])
+
+        cache = appbuilder.EmbeddingCache(ttl=0.05)
+        cache.put_many("m", ["a"], [[1.0]])
+        self.assertEqual(cache.get_many("m", ["a"]), [[1.0]])
+        time.sleep(0.1)
+        self.assertEqual(cache.get_many("m", ["a"]), [None])
+        self.assertEqual(cache.stats().expirations, 1)
+
+    def test_prewarm(self):
+        """ 测试从文件预热缓存 """
+        prewarm_file = os.path.join(self.tmpdir.name, "prewarm.jsonl")
+        with open(prewarm_file, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"text": "你好", "embedding": [0.5, 0.25]}, ensure_ascii=False) + "\n")
+            f.write(json.dumps({"text": "world", "embedding": [1.0], "model": "other"}) + "\n")
+        cache = appbuilder.EmbeddingCache(path=self.path)
+        self.assertEqual(cache.prewarm(prewarm_file), 2)
+        embedding = self._embedding(cache)
+        self.assertEqual(embedding("你好").content, [0.5, 0.25])
+        self.assertEqual(_ThrottlingHandler.texts, [])
+        self.assertEqual(cache.get_many("other", ["world"]), [[1.0]])
+        cache.close()
+
+    def test_hits_are_copies(self):
+        """ 测试修改命中返回的向量不影响缓存 """
+        cache = appbuilder.EmbeddingCache(path=self.path)
+        vector = [1.0, 2.0]
+        cache.put_many("m", ["a"], [vector])
+        vector.append(3.0)
+        first = cache.get_many("m", ["a", "a"])
+        first[0].append(4.0)
+        self.assertEqual(first[1], [1.0, 2.0])
+        self.assertEqual(cache.get_many("m", ["a"]), [[1.0, 2.0]])
+
+        cache.clear()
+        cache.put_many("m", ["b"], [[5.0]])
+        cache._memory.clear()
+        cache.get_many("m", ["b"])[0].append(6.0)
+        self.assertEqual(cache.get_many("m", ["b"]), [[5.0]])
+        cache.close()
+
+    def test_short_reply(self):
+        """ 测试服务返回的embedding条数少于请求的文本数时抛出明确的异常 """
+        def request(payload):
+            return {"data": [{"embedding": [float(len(text))]} for text in payload["input"][1:]]}
+
+        for cache in [None, appbuilder.EmbeddingCache()]:
+            embedding = self._embedding(cache)
+            embedding._request = request
+            with self.assertRaises(appbuilder.AppBuilderServerException):
+                list(embedding.batch(["a", "bb", "ccc"], stream=True).content)
+            with self.assertRaises(appbuilder.AppBuilderServerException):
+                embedding.batch(["a", "bb", "ccc"], max_concurrency=2)
+
+    def test_abatch_with_cache(self):
+        """ 测试异步batch在线程池中读写磁盘缓存 """
+        cache = appbuilder.EmbeddingCache(path=self.path)
+        embedding = self._embedding(cache)
+        texts = ["a" * i for i in range(1, 21)]
+        result = asyncio.run(embedding.abatch(texts + texts[:2], max_concurrency=2))
+        self.assertEqual(result.content, [[float(len(text))] for text in texts + texts[:2]])
+        self.assertEqual(cache.stats().disk_items, 20)
+        cache.close()
+
+
 if __name__ == '__main__':
     unittest.main()
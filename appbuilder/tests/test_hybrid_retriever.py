@@ -0,0 +1,164 @@
+# Copyright (c) 2023 Baidu, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import hashlib
+import math
+import threading
+import unittest
+
+import appbuilder
+from appbuilder.core.component import Component
+from appbuilder.core.components.retriever.hybrid_retriever import fuse_results, tokenize
+from appbuilder.core.message import Message
+
+
+class _HashEmbedding(Component):
+    """ 根据文本哈希生成确定的向量，文本内容与向量无关 """
+
+    def __init__(self):
+        super().__init__(secret_key="test")
+
+    def vector(self, text):
+        return [b / 255.0 - 0.5 for b in hashlib.sha256(text.encode()).digest()[:16]]
+
+    def run(self, text):
+        return Message(self.vector(text.content))
+
+    def batch(self, texts, max_concurrency=4):
+        return Message([self.vector(text) for text in texts.content])
+
+
+class TestBM25Index(unittest.TestCase):
+    def test_tokenize(self):
+        self.assertEqual(tokenize("型号 X-200 的Hello_World"), ["型", "号", "x", "200", "的", "hello_world"])
+
+    def test_scores(self):
+        """ 测试得分与 Lucene BM25 公式一致 """
+        texts = ["apple banana apple", "banana cherry", "cherry durian elderberry fig", "grape"]
+        index = appbuilder.BM25Index()
+        index.add(texts[:2], metadata="a")
+        index.add(texts[2:], metadata=["b", "c"])
+        lengths = [3, 2, 4, 1]
+        avg = sum(lengths) / 4
+
+        def expected(doc, terms):
+            score = 0.0
+            for term in terms:
+                tf = texts[doc].split().count(term)
+                df = sum(term in text.split() for text in texts)
+                if tf:
+                    idf = math.log(1 + (4 - df + 0.5) / (df + 0.5))
+                    score += idf * tf * 2.2 / (tf + 1.2 * (0.25 + 0.75 * lengths[doc] / avg))
+            return score
+
+        res = index.search("Apple cherry", top_k=10)
+        self.assertEqual([doc["text"] for doc in res], [texts[0], texts[1], texts[2]])
+        for doc in res:
+            self.assertAlmostEqual(doc["score"], expected(texts.index(doc["text"]), ["apple", "cherry"]))
+        self.assertEqual([doc["meta"] for doc in res], ["a", "a", "b"])
+        self.assertEqual(len(index.search("cherry", top_k=1)), 1)
+        self.assertEqual(index.search("kiwi"), [])
+        index.clear()
+        self.assertEqual(index.search("apple"), [])
+
+
+class TestFusion(unittest.TestCase):
+    def setUp(self):
+        self.lexical = [{"text": "a", "meta": "", "score": 8.0}, {"text": "b", "meta": "", "score": 2.0}]
+        self.vector = [{"text": "b", "meta": "", "score": 0.9}, {"text": "c", "meta": "", "score": 0.5}]
+
+    def test_rrf(self):
+        docs = fuse_results(self.lexical, self.vector, top_k=3, rrf_k=1, weights=(1.0, 2.0))
+        self.assertEqual([doc["text"] for doc in docs], ["b", "c", "a"])
+        self.assertAlmostEqual(docs[0]["score"], 1 / 3 + 2 / 2)
+        self.assertEqual((docs[0]["lexical_score"], docs[0]["vector_score"]), (2.0, 0.9))
+        self.assertIsNone(docs[1]["lexical_score"])
+
+    def test_weighted(self):
+        docs = fuse_results(self.lexical, self.vector, top_k=2, fusion="weighted", weights=(0.7, 0.3))
+        self.assertEqual([doc["text"] for doc in docs], ["a", "b"])
+        self.assertAlmostEqual(docs[0]["score"], 0.7)
+        self.assertAlmostEqual(docs[1]["score"], 0.3)
+        with self.assertRaises(ValueError):
+            fuse_results(self.lexical, self.vector, top_k=2, fusion="max")
+
+
+class TestLocalHybridRetriever(unittest.TestCase):
+    def setUp(self):
+        self.texts = ["第{}章 产品介绍".format(i) for i in range(200)] + ["型号 X-200 的保修期为两年"]
+        self.vector_index = appbuilder.LocalVectorStoreIndex.from_segments(Message(self.texts),
+                                                                          embedding=_HashEmbedding())
+
+    def test_exact_code_recall(self):
+        """ 测试向量检索无法召回的型号，通过关键词检索召回 """
+        vector_only = self.vector_index.as_retriever()(Message("X-200 保修"), top_k=5).content
+        self.assertNotIn(self.texts[-1], [doc["text"] for doc in vector_only])
+
+        retriever = self.vector_index.as_hybrid_retriever()
+        res = retriever(Message("X-200 保修"), top_k=5)
+        self.assertEqual(res.content[0]["text"], self.texts[-1])
+        stats = retriever.last_stats
+        self.assertEqual(stats.vector_hits, 10)
+        self.assertGreater(stats.lexical_hits, 0)
+        self.assertGreaterEqual(stats.total_ms, stats.lexical_ms + stats.vector_ms)
+
+    def test_sync_with_vector_index(self):
+        retriever = self.vector_index.as_hybrid_retriever(fusion="weighted", weights=(1.0, 0.0), num_candidates=3)
+        self.vector_index.add_segments(Message(["型号 Y-300 的保修期为三年"]))
+        self.assertEqual(retriever(Message("Y-300"), top_k=1).content[0]["text"], "型号 Y-300 的保修期为三年")
+        self.vector_index.delete_all_segments()
+        self.vector_index.add_segments(Message(["型号 Z-400"]))
+        self.assertEqual([doc["text"] for doc in retriever(Message("型号"), top_k=5).content], ["型号 Z-400"])
+        self.assertEqual(len(retriever.lexical_index), 1)
+        with self.assertRaises(ValueError):
+            self.vector_index.as_hybrid_retriever(weights=(1.0, -1.0))
+
+    def test_delete_then_readd(self):
+        """ 测试删除后重新写入同样多的文本，关键词索引不再返回已删除的文本 """
+        vector_index = appbuilder.LocalVectorStoreIndex.from_segments(Message(["alpha old", "beta old"]),
+                                                                      embedding=_HashEmbedding())
+        retriever = vector_index.as_hybrid_retriever(fusion="weighted", weights=(1.0, 0.0))
+        self.assertEqual(retriever(Message("old"), top_k=5).content[0]["text"], "alpha old")
+        vector_index.delete_all_segments()
+        vector_index.add_segments(Message(["alpha new", "beta new", "gamma new"]))
+        texts = [doc["text"] for doc in retriever(Message("alpha beta old"), top_k=5).content]
+        self.assertNotIn("alpha old", texts)
+        self.assertNotIn("beta old", texts)
+        self.assertEqual(len(retriever.lexical_index), 3)
+
+    def test_supplied_lexical_index(self):
+        """ 测试调用方传入的关键词索引不会被写入或清空 """
+        lexical_index = appbuilder.BM25Index()
+        lexical_index.add(["型号 X-200 的保修期为两年", "第1章 产品介绍"])
+        retriever = appbuilder.HybridRetriever(self.vector_index.as_retriever(), lexical_index=lexical_index,
+                                               fusion="weighted", weights=(1.0, 0.0))
+        self.assertEqual(retriever(Message("X-200"), top_k=1).content[0]["text"], self.texts[-1])
+        self.assertEqual(len(lexical_index), 2)
+        self.vector_index.delete_all_segments()
+        self.vector_index.add_segments(Message(["型号 Z-400"]))
+        retriever(Message("X-200"), top_k=1)
+        self.assertEqual(len(lexical_index), 2)
+
+    def test_concurrent_sync(self):
+        retriever = self.vector_index.as_hybrid_retriever()
+        self.vector_index.add_segments(Message(["型号 Y-300"]))
+        threads = [threading.Thread(target=retriever, args=(Message("Y-300"),)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(retriever.lexical_index), len(self.vector_index))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,217 @@
+# Copyright (c) 2023 Baidu, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import appbuilder
+from appbuilder.core.component import Component
+from appbuilder.core.message import Message
+
+# 设置 APPBUILDER_BENCHMARK=1 时按完整规模运行基准测试并校验耗时，默认只用小规模数据校验结果并记录耗时
+_BENCHMARK = bool(os.getenv("APPBUILDER_BENCHMARK"))
+
+
+class _TableEmbedding(Component):
+    """ 从向量表中查询文本的向量，记录每次 batch 的文本数 """
+
+    def __init__(self, table):
+        super().__init__(secret_key="test")
+        self.table = table
+        self.batch_sizes = []
+
+    def run(self, text):
+        return Message(self.table[text.content])
+
+    def batch(self, texts):
+        self.batch_sizes.append(len(texts.content))
+        return Message([self.table[text] for text in texts.content])
+
+
+def _corpus(n, dims, queries=0, seed=0, clusters=None):
+    rng = np.random.RandomState(seed)
+    if clusters:
+        centers = rng.normal(size=(clusters, dims))
+        docs = centers[rng.randint(clusters, size=n)] + 0.5 * rng.normal(size=(n, dims))
+    else:
+        docs = rng.normal(size=(n, dims))
+    table = {"doc {}".format(i): vector.tolist() for i, vector in enumerate(docs)}
+    query_vectors = docs[rng.randint(n, size=queries)] + 0.3 * rng.normal(size=(queries, dims))
+    table.update({"query {}".format(i): vector.tolist() for i, vector in enumerate(query_vectors)})
+    return docs, query_vectors, table
+
+
+def _truth(docs, queries, top_k):
+    normed = docs / np.linalg.norm(docs, axis=1, keepdims=True)
+    return [np.argsort(-(normed @ (q / np.linalg.norm(q))))[:top_k].tolist() for q in queries]
+
+
+def _ids(docs):
+    return [int(doc["text"].split()[1]) for doc in docs]
+
+
+class TestLocalVectorStoreIndex(unittest.TestCase):
+    def test_flat_search_exact(self):
+        """ 测试分块精确检索与暴力排序一致 """
+        docs, queries, table = _corpus(3000, 32, queries=20)
+        embedding = _TableEmbedding(table)
+        vector_index = appbuilder.LocalVectorStoreIndex(embedding=embedding)
+        vector_index.block_size = 700
+        stats = vector_index.add_segments(Message("doc {}".format(i) for i in range(len(docs))),
+                                          embedding_batch_size=1000)
+        self.assertEqual(stats.indexed, 3000)
+        self.assertEqual(embedding.batch_sizes, [1000, 1000, 1000])
+        self.assertEqual(vector_index.matrix.dtype, np.float32)
+
+        retriever = vector_index.as_retriever()
+        for i, expected in enumerate(_truth(docs, queries, 10)):
+            res = retriever(Message("query {}".format(i)), top_k=10)
+            self.assertEqual(_ids(res.content), expected)
+            scores = [doc["score"] for doc in res.content]
+            self.assertEqual(scores, sorted(scores, reverse=True))
+        self.assertEqual(len(retriever(Message("query 0"), top_k=5000).content), 3000)
+
+    def test_persistence(self):
+        """ 测试索引保存到磁盘，重新打开后以内存映射方式读取 """
+        docs, queries, table = _corpus(500, 16, queries=5)
+        embedding = _TableEmbedding(table)
+        with tempfile.TemporaryDirectory() as path:
+            vector_index = appbuilder.LocalVectorStoreIndex.from_segments(
+                Message(["doc {}".format(i) for i in range(300)]), embedding=embedding, path=path)
+            vector_index.add_segments(Message(["doc {}".format(i) for i in range(300, 500)]), metadata="b")
+            expected = vector_index.as_retriever().batch([Message("query 0"), Message("query 1")], top_k=5)
+
+            reopened = appbuilder.LocalVectorStoreIndex(embedding=embedding, path=path)
+            self.assertEqual(len(reopened), 500)
+            self.assertIsInstance(reopened.matrix, np.memmap)
+            res = reopened.as_retriever().batch([Message("query 0"), Message("query 1")], top_k=5)
+            self.assertEqual([r.content for r in res], [r.content for r in expected])
+            self.assertEqual(reopened.get_all_segments()[-1]["metadata"], "b")
+
+            # 模拟写入中断，多出的数据在重新打开时被丢弃
+            with open(os.path.join(path, "vectors.f32"), "ab") as f:
+                f.write(b"\0" * 10)
+            with open(os.path.join(path, "segments.jsonl"), "a") as f:
+                f.write('{"id": "x", "te')
+            reopened = appbuilder.LocalVectorStoreIndex(embedding=embedding, path=path)
+            reopened.add_segments(Message(["doc 0"]))
+            reopened = appbuilder.LocalVectorStoreIndex(embedding=embedding, path=path)
+            self.assertEqual(len(reopened), 501)
+            self.assertEqual(reopened.get_all_segments()[-1]["text"], "doc 0")
+            np.testing.assert_allclose(reopened.matrix[500], reopened.matrix[0])
+
+            reopened.delete_all_segments()
+            self.assertEqual(len(appbuilder.LocalVectorStoreIndex(embedding=embedding, path=path)), 0)
+            self.assertEqual(reopened.search([[1.0] * 16], top_k=3), [[]])
+
+    def test_failed_write(self):
+        """ 测试写入失败后不留下多余的向量，之后写入的向量与段落一一对应 """
+        embedding = _TableEmbedding({})
+        with tempfile.TemporaryDirectory() as path:
+            vector_index = appbuilder.LocalVectorStoreIndex(embedding=embedding, path=path)
+            vector_index.add_vectors(["a"], [[1.0, 0.0, 0.0]])
+            with self.assertRaises(TypeError):
+                vector_index.add_vectors(["b"], [[0.0, 1.0, 0.0]], metadata={1, 2})
+
+            # 向量已写入后段落写入失败
+            real_open = open
+
+            def failing_open(file, mode="r", *args, **kwargs):
+                if str(file).endswith("segments.jsonl") and "a" in mode:
+                    raise OSError("disk full")
+                return real_open(file, mode, *args, **kwargs)
+
+            with mock.patch("builtins.open", failing_open):
+                with self.assertRaises(OSError):
+                    vector_index.add_vectors(["b"], [[0.0, 1.0, 0.0]])
+            self.assertEqual(os.path.getsize(os.path.join(path, "vectors.f32")), 12)
+
+            vector_index.add_vectors(["c"], [[0.0, 0.0, 1.0]])
+            for index in (vector_index, appbuilder.LocalVectorStoreIndex(embedding=embedding, path=path)):
+                self.assertEqual(len(index), 2)
+                res = index.search([[0.0, 0.0, 1.0]], top_k=1)[0][0]
+                self.assertEqual((res["text"], res["score"]), ("c", 1.0))
+                self.assertEqual(index.search([[0.0, 1.0, 0.0]], top_k=2)[0][0]["score"], 0.0)
+
+            empty = appbuilder.LocalVectorStoreIndex(embedding=embedding, path=os.path.join(path, "empty"))
+            with self.assertRaises(TypeError):
+                empty.add_vectors(["b"], [[0.0, 1.0]], metadata={1})
+            empty.add_vectors(["c"], [[0.0, 0.0, 1.0]])
+            self.assertEqual(empty.matrix.shape, (1, 3))
+
+    def test_ivf_recall(self):
+        """ 测试 ivf 检索的召回率，新增段落后划分到已有的簇 """
+        docs, queries, table = _corpus(20000, 32, queries=50, clusters=64)
+        embedding = _TableEmbedding(table)
+        vector_index = appbuilder.LocalVectorStoreIndex(embedding=embedding, index_type="ivf", nprobe=8)
+        vector_index.add_vectors(["doc {}".format(i) for i in range(15000)], docs[:15000])
+        retriever = vector_index.as_retriever()
+        retriever(Message("query 0"))
+        centroids = vector_index._ivf["centroids"]
+
+        vector_index.add_vectors(["doc {}".format(i) for i in range(15000, 20000)], docs[15000:])
+        results = retriever.batch([Message("query {}".format(i)) for i in range(len(queries))], top_k=10)
+        self.assertIs(vector_index._ivf["centroids"], centroids)
+        self.assertEqual(sum(len(ids) for ids in vector_index._ivf["lists"]), 20000)
+        hits = sum(len(set(_ids(res.content)) & set(expected))
+                   for res, expected in zip(results, _truth(docs, queries, 10)))
+        self.assertGreaterEqual(hits / (10 * len(queries)), 0.9)
+
+    def test_batch_fusion(self):
+        docs, queries, table = _corpus(200, 8, queries=3)
+        embedding = _TableEmbedding(table)
+        vector_index = appbuilder.LocalVectorStoreIndex.from_segments(
+            Message(["doc {}".format(i) for i in range(200)]), embedding=embedding)
+        retriever = vector_index.as_retriever()
+        embedding.batch_sizes.clear()
+        fused = retriever.batch([Message("query 0"), Message("query 0"), Message("query 1")], top_k=3, fusion="rrf")
+        self.assertEqual(embedding.batch_sizes, [3])
+        self.assertEqual(fused.content[0]["text"], retriever(Message("query 0")).content[0]["text"])
+        self.assertAlmostEqual(fused.content[0]["score"], 2 / 61)
+        with self.assertRaises(ValueError):
+            vector_index.add_vectors(["x"], [[1.0] * 4])
+        with self.assertRaises(ValueError):
+            appbuilder.LocalVectorStoreIndex(embedding=embedding, index_type="hnsw")
+
+    def test_latency_benchmark(self):
+        """ 对比 10 万条向量下 flat 与 ivf 的检索耗时 """
+        docs, queries, table = _corpus(100000 if _BENCHMARK else 10000, 128, queries=50, clusters=256)
+        embedding = _TableEmbedding(table)
+        latencies = {}
+        results = {}
+        for index_type in ("flat", "ivf"):
+            vector_index = appbuilder.LocalVectorStoreIndex(embedding=embedding, index_type=index_type)
+            vector_index.add_vectors(["doc {}".format(i) for i in range(len(docs))], docs)
+            vector_index.search(queries[:1], top_k=10)
+            start = time.perf_counter()
+            for query in queries:
+                vector_index.search([query], top_k=10)
+            latencies[index_type] = (time.perf_counter() - start) / len(queries)
+            start = time.perf_counter()
+            results[index_type] = vector_index.search(queries, top_k=10)
+            appbuilder.logger.info("{} on {} vectors: {:.2f}ms per query, {:.2f}ms per query in batch".format(
+                index_type, len(docs), latencies[index_type] * 1000,
+                (time.perf_counter() - start) / len(queries) * 1000))
+        # flat 为精确检索，与暴力计算的结果一致
+        self.assertEqual([_ids(result) for result in results["flat"]], _truth(docs, queries, 10))
+        if _BENCHMARK:
+            self.assertLess(latencies["ivf"], latencies["flat"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,9 +6,43 @@ import sys
 
 sys.path.append('../..')
 
+import gc
+import os
+import tempfile
+import time
 import unittest
+from unittest import mock
+
+import numpy as np
 
 import appbuilder
+from appbuilder.core.component import Component
+from appbuilder.core.message import Message
+
+# 设置 APPBUILDER_BENCHMARK=1 时校验基准测试的耗时，默认只校验结果并记录耗时
+_BENCHMARK = bool(os.getenv("APPBUILDER_BENCHMARK"))
+
+
+class _TableEmbedding(Component):
+    """ 从向量表中查询文本的向量，记录请求的文本数 """
+
+    def __init__(self, table):
+        super().__init__(secret_key="test")
+        self.table = table
+        self.requested = 0
+
+    def run(self, text):
+        self.requested += 1
+        return Message(self.table[text.content])
+
+    def batch(self, texts, max_concurrency=4):
+        self.requested += len(texts.content)
+        return Message([self.table[text] for text in texts.content])
+
+
+def _table(n, dims, seed=0):
+    rng = np.random.RandomState(seed)
+    return {"text {}".format(i): vector.tolist() for i, vector in enumerate(rng.normal(size=(n, dims)))}
 
 
 class TestMatching(unittest.TestCase):
@@ -55,5 +89,178 @@ class TestMatching(unittest.TestCase):
         self.assertEqual(len(semantics.content), 2)
 
 
+class TestMatchingIndex(unittest.TestCase):
+    def setUp(self):
+        # Matching 需要 secret_key，测试不访问网络
+        patcher = mock.patch.dict(os.environ, {"APPBUILDER_TOKEN": os.getenv("APPBUILDER_TOKEN", "test")})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_search(self):
+        """ 测试多个query一次检索，结果与逐个排序一致 """
+        table = _table(500, 16)
+        embedding = _TableEmbedding(table)
+        contexts = ["text {}".format(i) for i in range(400)]
+        index = appbuilder.MatchingIndex(embedding, Message(contexts))
+        self.assertEqual(index.matrix.dtype, np.float32)
+        self.assertTrue(index.matrix.flags["C_CONTIGUOUS"])
+
+        queries = ["text {}".format(i) for i in range(400, 420)]
+        scores, indices = index.search(queries, top_k=5)
+        self.assertEqual(scores.shape, (20, 5))
+        matching = appbuilder.Matching(embedding)
+        for i, query in enumerate(queries):
+            expected = matching.semantics(table[query], [table[c] for c in contexts]).content
+            np.testing.assert_array_equal(indices[i], np.argsort(expected)[::-1][:5])
+            np.testing.assert_allclose(scores[i], np.sort(expected)[::-1][:5], rtol=1e-5)
+        scores, indices = index.search("text 0", top_k=1)
+        self.assertEqual(indices.tolist(), [[0]])
+        self.assertAlmostEqual(float(scores[0, 0]), 1.0, places=5)
+        self.assertEqual(index.search_embeddings([table["text 0"]], top_k=0)[1].shape, (1, 0))
+
+    def test_ties(self):
+        """ 测试得分相同时按位置排序，不比较文本 """
+        embedding = _TableEmbedding({"b": [1.0, 0.0], "a": [2.0, 0.0], "c": [0.0, 1.0], "q": [1.0, 0.0]})
+        index = appbuilder.MatchingIndex(embedding, ["b", "c", "a"])
+        self.assertEqual(index.search(["q"], top_k=2)[1].tolist(), [[0, 2]])
+        self.assertEqual(appbuilder.Matching(embedding)(Message("q"), Message(["c", "b", "a"])).content,
+                         ["b", "a", "c"])
+
+    def test_add_remove(self):
+        table = _table(100, 8)
+        embedding = _TableEmbedding(table)
+        index = appbuilder.MatchingIndex(embedding)
+        self.assertEqual(index.search(["text 0"])[1].shape, (1, 0))
+        self.assertEqual(index.add(["text {}".format(i) for i in range(10)]), list(range(10)))
+        self.assertEqual(index.add(["text {}".format(i) for i in range(10, 30)]), list(range(10, 30)))
+        self.assertEqual(embedding.requested, 30)
+
+        index.remove([0, 5, 29])
+        self.assertEqual(len(index), 27)
+        self.assertEqual(index.contexts[:5], ["text 1", "text 2", "text 3", "text 4", "text 6"])
+        _, indices = index.search(["text 6", "text 28"], top_k=1)
+        self.assertEqual([index.contexts[i] for i in indices[:, 0]], ["text 6", "text 28"])
+        self.assertNotIn("text 5", [index.contexts[i] for i in index.search(["text 5"])[1][0]])
+        with self.assertRaises(ValueError):
+            index.add(["x"], [[1.0, 2.0]])
+
+    def test_run_with_index(self):
+        """ 测试 Matching.run 复用 MatchingIndex，不重新计算文本的embedding """
+        table = _table(50, 8)
+        embedding = _TableEmbedding(table)
+        matching = appbuilder.Matching(embedding)
+        contexts = Message(["text {}".format(i) for i in range(40)])
+        index = matching.build_index(contexts)
+        requested = embedding.requested
+        expected = matching(Message("text 45"), contexts).content
+        embedding.requested = requested
+        self.assertEqual(matching(Message("text 45"), index).content, expected)
+        self.assertEqual(embedding.requested, requested + 1)
+
+    def test_benchmark(self):
+        """ 对比逐个 query 计算余弦相似度并排序，与一次矩阵乘法取 top_k 的耗时 """
+        table = _table(2050, 256)
+        contexts = ["text {}".format(i) for i in range(2000)]
+        queries = ["text {}".format(i) for i in range(2000, 2050)]
+        embedding = _TableEmbedding(table)
+        matching = appbuilder.Matching(embedding)
+        context_embeddings = [table[c] for c in contexts]
+
+        gc.collect()
+        start = time.perf_counter()
+        for query in queries:
+            semantics = matching.semantics(table[query], context_embeddings)
+            expected = [item[1] for item in sorted(zip(semantics.content, contexts), reverse=True)[:10]]
+        reference = time.perf_counter() - start
+
+        gc.collect()
+        start = time.perf_counter()
+        index = appbuilder.MatchingIndex(embedding, contexts, context_embeddings)
+        _, indices = index.search_embeddings([table[query] for query in queries], top_k=10)
+        elapsed = time.perf_counter() - start
+        self.assertEqual([contexts[i] for i in indices[-1]], expected)
+        appbuilder.logger.info("matching 50 queries against 2000 contexts: {:.3f}s one by one, "
+                               "{:.3f}s with MatchingIndex including build".format(reference, elapsed))
+        if _BENCHMARK:
+            self.assertLess(elapsed * 5, reference)
+
+
+class TestBatchSemantics(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(os.environ, {"APPBUILDER_TOKEN": os.getenv("APPBUILDER_TOKEN", "test")})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        rng = np.random.RandomState(0)
+        self.queries = rng.normal(size=(7, 16))
+        self.contexts = rng.normal(size=(103, 16))
+        self.matching = appbuilder.Matching(_TableEmbedding({}))
+
+    def test_query_matrix(self):
+        """ 测试多个query返回相似度矩阵，与逐个query计算一致 """
+        scores = self.matching.semantics(self.queries.tolist(), Message(self.contexts.tolist())).content
+        self.assertEqual(scores.shape, (7, 103))
+        self.assertEqual(scores.dtype, np.float32)
+        for i, query in enumerate(self.queries):
+            single = self.matching.semantics(Message(query.tolist()), self.contexts.tolist()).content
+            self.assertIsInstance(single, list)
+            np.testing.assert_allclose(scores[i], single, atol=1e-6)
+        reference = self.matching._cosine_similarity([self.queries[0]], self.contexts).flatten()
+        np.testing.assert_allclose(scores[0], reference, atol=1e-6)
+
+    def test_chunks_and_dtype(self):
+        expected = self.matching.semantics(self.queries, self.contexts).content
+        chunked = self.matching.semantics(self.queries, self.contexts, chunk_size=10).content
+        np.testing.assert_allclose(chunked, expected, atol=1e-6)
+
+        half = self.matching.semantics(self.queries, self.contexts, chunk_size=10, dtype=np.float16).content
+        self.assertEqual(half.dtype, np.float16)
+        np.testing.assert_allclose(half, expected, atol=1e-3)
+
+        blocks = (self.contexts[start:start + 25] for start in range(0, 103, 25))
+        np.testing.assert_allclose(self.matching.semantics(self.queries, blocks).content, expected, atol=1e-6)
+        self.assertEqual(self.matching.semantics(self.queries, iter([])).content.shape, (7, 0))
+        self.assertEqual(self.matching.semantics(self.queries, np.empty((0, 16))).content.shape, (7, 0))
+
+        with tempfile.TemporaryDirectory() as path:
+            stored = np.memmap(os.path.join(path, "contexts.f16"), dtype=np.float16, mode="w+", shape=(103, 16))
+            stored[:] = self.contexts
+            stored.flush()
+            stored = np.memmap(os.path.join(path, "contexts.f16"), dtype=np.float16, mode="r", shape=(103, 16))
+            scores = self.matching.semantics(self.queries, stored, chunk_size=32).content
+            np.testing.assert_allclose(scores, expected, atol=2e-3)
+            del stored, scores
+
+        with self.assertRaises(ValueError):
+            self.matching.semantics(self.queries, self.contexts, dtype=np.float64)
+        with self.assertRaises(ValueError):
+            self.matching.semantics(self.queries, self.contexts, chunk_size=0)
+
+    def test_benchmark(self):
+        """ 对比 1k 个 query 与 10 万个 context(默认规模为 100 与 1 万)的矩阵计算，与逐个 query 计算的耗时 """
+        rng = np.random.RandomState(0)
+        queries = rng.normal(size=(1000 if _BENCHMARK else 100, 64)).astype(np.float32)
+        contexts = rng.normal(size=(100000 if _BENCHMARK else 10000, 64)).astype(np.float32)
+
+        # 逐个 query 的耗时按 20 个 query 估算
+        gc.collect()
+        start = time.perf_counter()
+        for query in queries[:20]:
+            expected = self.matching._cosine_similarity([query], contexts).flatten()
+        reference = (time.perf_counter() - start) / 20 * len(queries)
+
+        for dtype in (np.float32, np.float16):
+            gc.collect()
+            start = time.perf_counter()
+            scores = self.matching.semantics(queries, contexts, chunk_size=8192, dtype=dtype).content
+            elapsed = time.perf_counter() - start
+            np.testing.assert_allclose(scores[19], expected, atol=1e-3)
+            appbuilder.logger.info("semantics {} x {} {}: {:.2f}s, per query loop: {:.2f}s (estimated), "
+                                   "result {}MB".format(len(queries), len(contexts), np.dtype(dtype).name, elapsed,
+                                                        reference, scores.nbytes // 2 ** 20))
+            if _BENCHMARK:
+                self.assertLess(elapsed * 3, reference)
+            del scores
+
+
 if __name__ == '__main__':
     unittest.main()
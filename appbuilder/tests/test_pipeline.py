@@ -0,0 +1,169 @@
+# Copyright (c) 2023 Baidu, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import threading
+import time
+import unittest
+from unittest import mock
+
+import appbuilder
+from appbuilder.core.component import Component
+from appbuilder.core.components.doc_parser.base import ParseResult
+from appbuilder.core.message import Message
+from appbuilder.core.pipeline import Pipeline
+
+
+def _produce(message):
+    for i in range(message.content):
+        yield i
+
+
+class _ParserStub(Component):
+    r"""返回与DocParser相同结构(ParseResult)的解析结果"""
+
+    def run(self, message, return_raw=False):
+        nodes = [{"node_id": 0, "text": "", "para_type": "root", "parent": None, "children": [], "position": []}]
+        for i in range(message.content):
+            nodes.append({"node_id": i + 1, "text": "第{}段内容。".format(i) * 5, "para_type": "text",
+                          "parent": 0, "children": [], "position": []})
+        return Message(ParseResult.parse_obj({"para_node_tree": nodes}))
+
+
+class TestPipeline(unittest.TestCase):
+    def test_dag(self):
+        """ 测试分支并发、按序合并与批处理 """
+        pipeline = Pipeline(queue_size=2)
+        pipeline.add_stage("numbers", lambda m: list(range(m.content)), split=True)
+        pipeline.add_stage("square", lambda m: (time.sleep(0.005), m.content ** 2)[1], inputs=["numbers"], workers=4)
+        pipeline.add_stage("negative", lambda m: -m.content, inputs=["numbers"])
+        pipeline.add_stage("join", lambda a, b: a.content + b.content, inputs=["square", "negative"])
+        pipeline.add_stage("batch", lambda m: sum(m.content), inputs=["numbers"], batch_size=3)
+        outputs = pipeline.run(Message(10))
+        self.assertEqual([m.content for m in outputs["join"]], [i * i - i for i in range(10)])
+        self.assertEqual([m.content for m in outputs["batch"]], [3, 12, 21, 9])
+
+        metrics = pipeline.metrics()
+        self.assertEqual(metrics["numbers"].items_out, 10)
+        self.assertEqual(metrics["square"].calls, 10)
+        self.assertEqual(metrics["batch"].items_in, 10)
+        self.assertEqual(metrics["batch"].calls, 4)
+        self.assertGreater(metrics["square"].throughput, 0)
+        # 4个worker并发执行，耗时明显小于串行
+        self.assertLess(metrics["square"].wall_time, metrics["square"].busy_time)
+
+    def test_streaming_with_back_pressure(self):
+        """ 测试下游在上游结束前开始处理，且上游受队列容量限制 """
+        produced = []
+        consumed_before_last = threading.Event()
+
+        def produce(message):
+            for i in range(20):
+                produced.append(i)
+                yield i
+
+        def consume(message):
+            if len(produced) < 20:
+                consumed_before_last.set()
+            time.sleep(0.002)
+            return message.content
+
+        pipeline = Pipeline(queue_size=1)
+        pipeline.add_stage("produce", produce, split=True)
+        pipeline.add_stage("consume", consume, inputs=["produce"])
+        stream = pipeline.stream(Message(None))
+        name, first = next(stream)
+        self.assertEqual((name, first.content), ("consume", 0))
+        # 下游只消费了一条，上游最多领先队列容量与处理中的条数
+        time.sleep(0.05)
+        self.assertLess(len(produced), 20)
+        rest = [m.content for _, m in stream]
+        self.assertEqual(rest, list(range(1, 20)))
+        self.assertTrue(consumed_before_last.is_set())
+
+    def test_error_stops_pipeline(self):
+        """ 测试任一stage失败时整个pipeline停止并抛出异常 """
+        def fail(message):
+            if message.content == 3:
+                raise ValueError("bad item")
+            return message.content
+
+        pipeline = Pipeline()
+        pipeline.add_stage("numbers", _produce, split=True)
+        pipeline.add_stage("fail", fail, inputs=["numbers"], workers=2)
+        with self.assertRaises(ValueError):
+            pipeline.run(Message(1000))
+        self.assertEqual(pipeline.metrics()["fail"].errors, 1)
+        # 失败后可以再次执行
+        self.assertEqual(len(pipeline.run(Message(3))["fail"]), 3)
+
+    def test_components(self):
+        """ 测试DocParser -> DocSplitter -> Embedding.batch 按组件真实的输出结构串联 """
+        patcher = mock.patch.dict(os.environ, {"APPBUILDER_TOKEN": os.environ.get("APPBUILDER_TOKEN", "test")})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        embedding = appbuilder.Embedding()
+        requests = []
+
+        def request(payload):
+            requests.append(payload["input"])
+            return {"data": [{"embedding": [float(len(text))]} for text in payload["input"]]}
+
+        embedding._request = request
+        splitter = appbuilder.DocSplitter(splitter_type="split_by_chunk", max_segment_length=60, overlap=0,
+                                          engine="local")
+        texts = [p["text"] for p in splitter(_ParserStub()(Message(40))).content["paragraphs"]]
+        self.assertGreater(len(texts), 16)
+
+        pipeline = Pipeline(queue_size=2)
+        pipeline.add_stage("parse", _ParserStub(), return_raw=True)
+        pipeline.add_stage("split", splitter, inputs=["parse"])
+        pipeline.add_stage("texts", lambda message: [p["text"] for p in message.content["paragraphs"]],
+                           inputs=["split"], split=True)
+        pipeline.add_stage("embedding", embedding.batch, inputs=["texts"], batch_size=16, workers=2)
+        outputs = pipeline.run(Message(40))
+
+        self.assertEqual(sorted(sum(requests, [])), sorted(texts))
+        self.assertEqual([len(message.content) for message in outputs["embedding"]],
+                         [len(texts[i:i + 16]) for i in range(0, len(texts), 16)])
+        self.assertEqual(sum((message.content for message in outputs["embedding"]), []),
+                         [[float(len(text))] for text in texts])
+        self.assertEqual(pipeline.metrics()["texts"].items_out, len(texts))
+
+    def test_mismatched_inputs(self):
+        """ 测试各上游经过不同的split/batch stage时拒绝逐条配对，避免错位与有界队列死锁 """
+        pipeline = Pipeline(queue_size=2)
+        pipeline.add_stage("numbers", _produce, split=True)
+        pipeline.add_stage("batch", lambda m: sum(m.content), inputs=["numbers"], batch_size=3)
+        pipeline.add_stage("negative", lambda m: -m.content, inputs=["numbers"])
+        with self.assertRaises(ValueError):
+            pipeline.add_stage("join", lambda a, b: a.content + b.content, inputs=["batch", "negative"])
+        with self.assertRaises(ValueError):
+            pipeline.add_stage("join", lambda a, b: a.content + b.content, inputs=["input", "negative"])
+        pipeline.add_stage("square", lambda m: m.content ** 2, inputs=["numbers"])
+        pipeline.add_stage("join", lambda a, b: a.content + b.content, inputs=["square", "negative"])
+        self.assertEqual([m.content for m in pipeline.run(Message(4))["join"]], [0, 0, 2, 6])
+
+    def test_invalid_stage(self):
+        pipeline = Pipeline()
+        with self.assertRaises(ValueError):
+            pipeline.add_stage("a", lambda m: m, inputs=["missing"])
+        pipeline.add_stage("a", lambda m: m)
+        with self.assertRaises(ValueError):
+            pipeline.add_stage("a", lambda m: m)
+        with self.assertRaises(ValueError):
+            pipeline.add_stage("b", lambda a, b: a, inputs=["a", "input"], batch_size=2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+# Copyright (c) 2023 Baidu, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import time
+import unittest
+
+import numpy as np
+
+import appbuilder
+from appbuilder.core.component import Component
+from appbuilder.core.message import Message
+
+
+class _TableEmbedding(Component):
+    """ 从向量表中查询文本的向量，记录请求的文本 """
+
+    def __init__(self, table):
+        super().__init__(secret_key="test")
+        self.table = table
+        self.requested = []
+
+    def run(self, text):
+        self.requested.append(text.content)
+        return Message(self.table[text.content])
+
+    def batch(self, texts, max_concurrency=4):
+        self.requested.extend(texts.content)
+        return Message([self.table[text] for text in texts.content])
+
+
+class _FilterRetriever(Component):
+    """ 按 filters 参数返回结果的 retriever，记录调用参数 """
+
+    def __init__(self, embedding):
+        super().__init__(secret_key="test")
+        self.embedding = embedding
+        self.calls = []
+
+    def run(self, query, top_k=1, filters=None):
+        self.calls.append(filters)
+        return Message([{"text": query.content, "filters": filters}])
+
+
+class TestCachedRetriever(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        vectors = rng.normal(size=(60, 16))
+        self.table = {"doc {}".format(i): vectors[i].tolist() for i in range(50)}
+        self.table.update({"query {}".format(i): vectors[50 + i].tolist() for i in range(10)})
+        # 与 query 0 语义相近的改写
+        self.table["query 0 paraphrase"] = (vectors[50] + 0.05 * rng.normal(size=16)).tolist()
+        self.embedding = _TableEmbedding(self.table)
+        self.vector_index = appbuilder.LocalVectorStoreIndex.from_segments(
+            Message(["doc {}".format(i) for i in range(40)]), embedding=self.embedding)
+        self.retriever = self.vector_index.as_retriever()
+        self.embedding.requested.clear()
+
+    def test_exact_hit(self):
+        cache = appbuilder.CachedRetriever(self.retriever)
+        first = cache(Message("query 1"), top_k=3)
+        requested = len(self.embedding.requested)
+        second = cache(Message("query 1"), top_k=3)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(len(self.embedding.requested), requested)
+        stats = cache.stats()
+        self.assertEqual((stats.hits, stats.exact_hits, stats.misses, stats.items), (1, 1, 1, 1))
+        self.assertAlmostEqual(stats.hit_rate, 0.5)
+
+        # 修改返回结果不影响缓存
+        second.content.clear()
+        self.assertEqual(cache(Message("query 1"), top_k=3).content, first.content)
+
+    def test_semantic_hit(self):
+        cache = appbuilder.CachedRetriever(self.retriever, similarity_threshold=0.95)
+        expected = cache(Message("query 0"), top_k=3).content
+        self.assertEqual(cache(Message("query 0 paraphrase"), top_k=3).content, expected)
+        self.assertEqual(cache.stats().semantic_hits, 1)
+
+        # 检索参数不同或语义不相近时不命中
+        cache(Message("query 0 paraphrase"), top_k=5)
+        cache(Message("query 2"), top_k=3)
+        stats = cache.stats()
+        self.assertEqual((stats.hits, stats.misses, stats.items), (1, 3, 3))
+
+        exact_only = appbuilder.CachedRetriever(self.retriever, similarity_threshold=None)
+        exact_only(Message("query 0"), top_k=3)
+        self.embedding.requested.clear()
+        exact_only(Message("query 0 paraphrase"), top_k=3)
+        self.assertEqual(self.embedding.requested, ["query 0 paraphrase"])
+        self.assertEqual(exact_only.stats().misses, 2)
+
+    def test_single_embedding_on_miss(self):
+        """ 测试语义查找未命中时query只计算一次embedding """
+        cache = appbuilder.CachedRetriever(self.retriever, similarity_threshold=0.95)
+        result = cache(Message("query 5"), top_k=3)
+        self.assertEqual(self.embedding.requested, ["query 5"])
+        self.assertEqual(result.content, self.retriever(Message("query 5"), top_k=3).content)
+
+        hybrid = appbuilder.CachedRetriever(self.vector_index.as_hybrid_retriever(), similarity_threshold=0.95)
+        self.embedding.requested.clear()
+        hybrid(Message("query 6"), top_k=3)
+        self.assertEqual(self.embedding.requested, ["query 6"])
+
+        # 使用其他embedding计算的向量不能用于检索
+        other = _TableEmbedding(self.table)
+        cache = appbuilder.CachedRetriever(self.retriever, embedding=other)
+        self.embedding.requested.clear()
+        cache(Message("query 7"), top_k=3)
+        self.assertEqual((other.requested, self.embedding.requested), (["query 7"], ["query 7"]))
+
+    def test_unhashable_kwargs(self):
+        retriever = _FilterRetriever(self.embedding)
+        cache = appbuilder.CachedRetriever(retriever, similarity_threshold=None)
+        filters = {"tags": ["a", "b"], "year": 2023}
+        first = cache(Message("query 1"), top_k=1, filters=filters)
+        self.assertEqual(first.content[0]["filters"], filters)
+        # 键顺序不同的相同参数命中缓存，参数不同时不命中
+        cache(Message("query 1"), top_k=1, filters={"year": 2023, "tags": ["a", "b"]})
+        cache(Message("query 1"), top_k=1, filters={"tags": ["a"], "year": 2023})
+        self.assertEqual(len(retriever.calls), 2)
+        self.assertEqual(cache.stats().exact_hits, 1)
+
+    def test_invalidation(self):
+        """ 测试向量索引被修改后缓存失效 """
+        cache = appbuilder.CachedRetriever(self.retriever)
+        cache(Message("query 3"), top_k=1)
+        self.vector_index.add_segments(Message(["doc 45"]))
+        cache(Message("query 3"), top_k=1)
+        self.assertEqual(cache.stats().misses, 2)
+        self.assertEqual(cache.stats().invalidations, 1)
+
+        self.vector_index.delete_all_segments()
+        self.assertEqual(cache(Message("query 3"), top_k=1).content, [])
+        self.assertEqual(cache.stats().invalidations, 2)
+
+        hybrid = appbuilder.CachedRetriever(self.vector_index.as_hybrid_retriever())
+        self.assertIs(hybrid.vector_index, self.vector_index)
+
+    def test_eviction_and_ttl(self):
+        cache = appbuilder.CachedRetriever(self.retriever, max_items=2, similarity_threshold=0.95)
+        for i in range(3):
+            cache(Message("query {}".format(i)), top_k=1)
+        stats = cache.stats()
+        self.assertEqual((stats.items, stats.evictions), (2, 1))
+        self.assertEqual(len(cache._table), 2)
+        # query 0 已被淘汰，改写也不会命中
+        cache(Message("query 0 paraphrase"), top_k=1)
+        self.assertEqual(cache.stats().hits, 0)
+
+        cache = appbuilder.CachedRetriever(self.retriever, ttl=0.05)
+        cache(Message("query 4"), top_k=1)
+        time.sleep(0.1)
+        cache(Message("query 4"), top_k=1)
+        stats = cache.stats()
+        self.assertEqual((stats.hits, stats.expirations, stats.items), (0, 1, 1))
+        with self.assertRaises(ValueError):
+            appbuilder.CachedRetriever(self.retriever, similarity_threshold=2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,191 @@
+# Copyright (c) 2023 Baidu, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import socketserver
+import threading
+import time
+import unittest
+
+from appbuilder import Message, UserSession, MemorySessionStore, RedisSessionStore
+from appbuilder.core.session_store import RedisError, create_session_store
+
+
+def _slice(items, start, stop):
+    n = len(items)
+    start = max(start + n if start < 0 else start, 0)
+    stop = stop + n if stop < 0 else stop
+    return items[start:stop + 1]
+
+
+class _RedisHandler(socketserver.StreamRequestHandler):
+    r"""a Redis protocol stand-in supporting the list commands used by RedisSessionStore"""
+
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = []
+            for _ in range(int(line[1:])):
+                length = int(self.rfile.readline()[1:])
+                command.append(self.rfile.read(length + 2)[:-2])
+            reply = self.server.execute(command)
+            name = command[0].decode().upper()
+            if name in self.server.drop:
+                # close the connection after executing the command, before the reply is sent
+                self.server.drop.discard(name)
+                return
+            self.wfile.write(reply)
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+
+class _RedisServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _RedisHandler)
+        self.lists = {}
+        self.connections = 0
+        self.commands = []
+        self.drop = set()
+        self.lock = threading.Lock()
+
+    def execute(self, command):
+        name, args = command[0].decode().upper(), command[1:]
+        with self.lock:
+            self.commands.append(name)
+            if name in ("SELECT", "AUTH", "PEXPIRE"):
+                return b"+OK\r\n"
+            if name == "RPUSH":
+                items = self.lists.setdefault(args[0], [])
+                items.extend(args[1:])
+                return b":%d\r\n" % len(items)
+            if name == "LTRIM":
+                self.lists[args[0]] = _slice(self.lists.get(args[0], []), int(args[1]), int(args[2]))
+                return b"+OK\r\n"
+            if name == "LRANGE":
+                items = _slice(self.lists.get(args[0], []), int(args[1]), int(args[2]))
+                return b"*%d\r\n" % len(items) + b"".join(b"$%d\r\n%b\r\n" % (len(i), i) for i in items)
+            if name == "DEL":
+                return b":%d\r\n" % (self.lists.pop(args[0], None) is not None)
+            return b"-ERR unknown command '%s'\r\n" % name.encode()
+
+
+class TestMemorySessionStore(unittest.TestCase):
+    def test_ring_buffer(self):
+        """ 测试每个 session 只保留最近的数据，并按最近使用淘汰 session """
+        store = MemorySessionStore(max_sessions=2, max_messages=3)
+        for i in range(5):
+            store.save("a", {"id": str(i)})
+        self.assertEqual([row["id"] for row in store.get("a", 10)], ["2", "3", "4"])
+        self.assertEqual([row["id"] for row in store.get("a", 2)], ["3", "4"])
+        store.save("b", {"id": "b"})
+        store.get("a", 1)
+        store.save("c", {"id": "c"})
+        self.assertEqual(store.get("b", 10), [])
+        self.assertEqual(len(store.get("a", 10)), 3)
+
+    def test_ttl(self):
+        """ 测试 session 在最后一次写入 ttl 秒后过期 """
+        store = MemorySessionStore(ttl=0.05)
+        store.save("a", {"id": "1"})
+        self.assertEqual(len(store.get("a", 10)), 1)
+        time.sleep(0.1)
+        self.assertEqual(store.get("a", 10), [])
+        self.assertEqual(len(store), 0)
+
+
+class TestRedisSessionStore(unittest.TestCase):
+    def setUp(self):
+        self.server = _RedisServer()
+        self.url = "redis://127.0.0.1:{}/1".format(self.server.server_address[1])
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_user_session(self):
+        """ 测试通过 user_session_config 选择 Redis 存储，并与 SQL 存储返回相同格式 """
+        user_session = UserSession(self.url + "?max_messages=3&ttl=60")
+        self.assertIsInstance(user_session.store, RedisSessionStore)
+        for i in range(5):
+            user_session.save_session_message("s", Message("q{}".format(i)), Message("a{}".format(i)), {"n": i})
+        history = user_session.get_session_messages("s", limit=10)
+        self.assertEqual([m.content["answer_message"]["content"] for m in history], ["a2", "a3", "a4"])
+        self.assertEqual(history[-1].content["extra"], {"n": 4})
+        self.assertEqual(set(history[0].content), {"id", "query_message", "answer_message", "extra",
+                                                   "created_at", "updated_at"})
+        self.assertLessEqual(history[0].content["created_at"], history[-1].content["created_at"])
+        self.assertEqual(user_session.get_session_messages("other"), [])
+        # 连接被复用，写入在一次往返中完成
+        self.assertEqual(self.server.connections, 1)
+        self.assertIn("PEXPIRE", self.server.commands)
+        user_session.close()
+
+    def test_reconnect(self):
+        """ 测试服务端关闭空闲连接后自动重连 """
+        store = RedisSessionStore(self.url)
+        store.save("s", {"id": "1"})
+        connection = store._pool.get_nowait()
+        connection.sock.shutdown(2)
+        store._pool.put(connection)
+        self.assertEqual(store.get("s", 10), [{"id": "1"}])
+        with self.assertRaises(RedisError):
+            store._execute(("UNKNOWN",))
+        store.close()
+
+    def test_no_retry_after_send(self):
+        """ 测试命令发出后连接断开时不重试 RPUSH，避免重复写入；只读命令仍重试一次 """
+        store = RedisSessionStore(self.url)
+        store.save("s", {"id": "1"})
+        self.server.drop.add("RPUSH")
+        with self.assertRaises((ConnectionError, OSError)):
+            store.save("s", {"id": "2"})
+        self.assertEqual(self.server.commands.count("RPUSH"), 2)
+        self.assertEqual(store.get("s", 10), [{"id": "1"}, {"id": "2"}])
+
+        self.server.drop.add("LRANGE")
+        self.assertEqual(store.get("s", 10), [{"id": "1"}, {"id": "2"}])
+        self.assertEqual(self.server.commands.count("LRANGE"), 3)
+        store.close()
+
+
+class TestCreateSessionStore(unittest.TestCase):
+    def test_create(self):
+        store = create_session_store("memory://?max_sessions=5&max_messages=2&ttl=10")
+        self.assertIsInstance(store, MemorySessionStore)
+        self.assertEqual((store.max_sessions, store.max_messages, store.ttl), (5, 2, 10.0))
+        store = create_session_store("redis://:secret@example.com:6380/2?key_prefix=app:")
+        self.assertEqual((store.host, store.port, store.db, store.password, store.key_prefix),
+                         ("example.com", 6380, 2, "secret", "app:"))
+        self.assertIs(create_session_store(store), store)
+        self.assertIsNone(create_session_store("sqlite:///foo.db"))
+        with self.assertRaises(ValueError):
+            create_session_store("memory://?unknown=1")
+
+    def test_user_session_memory(self):
+        user_session = UserSession("memory://?max_messages=2")
+        user_session.save_session_message("s", Message("q"), Message("a"))
+        self.assertTrue(user_session.flush())
+        self.assertEqual(len(user_session.get_session_messages("s")), 1)
+        self.assertIsNone(user_session.engine)
+        user_session.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+# Copyright (c) 2023 Baidu, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+import unittest
+
+from appbuilder.core._exception import AppBuilderServerException
+from appbuilder.core.components.llms.base import CompletionResponse
+from appbuilder.core.sse import SSEDecoder
+
+
+class _StreamResponse(object):
+    def __init__(self, chunks):
+        self.headers = {"X-Appbuilder-Request-Id": "test"}
+        self.chunks = chunks
+
+    def iter_content(self, chunk_size=None):
+        return iter(self.chunks)
+
+
+def _sse(*answers):
+    return b"".join(b"data: " + json.dumps({"answer": a}, ensure_ascii=False).encode() + b"\n\n" for a in answers)
+
+
+class TestSSEDecoder(unittest.TestCase):
+    def test_split_and_coalesced_events(self):
+        """ 测试事件被任意切分或合并到同一个网络包 """
+        raw = b": keep-alive\r\n\r\nevent: delta\r\nid: 7\r\ndata: {\"a\": 1}\r\n\r\n" + \
+              b"data: line1\ndata: line2\n\nretry: 100\ndata: last"
+        expected = ['{"a": 1}', "line1\nline2", "last"]
+        for split in range(1, len(raw)):
+            events = list(SSEDecoder().iter_events([raw[:split], raw[split:]]))
+            self.assertEqual([e.data for e in events], expected)
+        events = list(SSEDecoder().iter_events([raw[i:i + 1] for i in range(len(raw))]))
+        self.assertEqual([e.data for e in events], expected)
+        self.assertEqual((events[0].event, events[0].id), ("delta", "7"))
+        self.assertEqual((events[1].event, events[1].id), ("message", "7"))
+        self.assertEqual(events[2].retry, 100)
+
+    def test_feed_returns_completed_events(self):
+        """ 测试事件完整后立即返回 """
+        decoder = SSEDecoder()
+        self.assertEqual(decoder.feed(b"data: a"), [])
+        self.assertEqual([e.data for e in decoder.feed(b"\n\ndata: b\n\ndata:")], ["a", "b"])
+        self.assertEqual([e.data for e in decoder.flush()], [""])
+
+
+class TestCompletionStream(unittest.TestCase):
+    def test_stream_answers(self):
+        """ 测试流式结果逐个返回answer，并记录首token耗时 """
+        raw = b":ping\n\n" + _sse("", "你好", "，世界")
+        chunks = [raw[i:i + 5] for i in range(0, len(raw), 5)]
+        response = CompletionResponse(_StreamResponse(chunks), stream=True)
+        self.assertIsNone(response.time_to_first_token)
+        self.assertEqual(list(response.result), ["", "你好", "，世界"])
+        self.assertIsNotNone(response.time_to_first_token)
+
+    def test_stream_without_blank_lines(self):
+        """ 测试兼容事件之间缺少空行 """
+        raw = b'data: {"answer": "a"}\ndata: {"answer": "b"}\n'
+        response = CompletionResponse(_StreamResponse([raw]), stream=True)
+        self.assertEqual(list(response.result), ["ab"])
+
+    def test_stream_error(self):
+        """ 测试流式响应中的服务端错误 """
+        raw = _sse("a") + b'{"code": 1, "message": "error", "requestId": "x"}'
+        response = CompletionResponse(_StreamResponse([raw]), stream=True)
+        with self.assertRaises(AppBuilderServerException):
+            list(response.result)
+        response = CompletionResponse(_StreamResponse([b"data: not json\n\n"]), stream=True)
+        with self.assertRaises(AppBuilderServerException):
+            list(response.result)
+
+
+if __name__ == '__main__':
+    unittest.main()
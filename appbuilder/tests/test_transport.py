@@ -0,0 +1,209 @@
+# Copyright (c) 2023 Baidu, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import json
+import os
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import parse_qs
+
+import appbuilder
+from appbuilder.core.component import Component
+from appbuilder.core.components.embeddings import Embedding
+from appbuilder.core.components.llms.base import AsyncCompletionResponse
+from appbuilder.core import transport
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.paths.append(self.path)
+        content_type = "application/json"
+        if "/api/llm/" in self.path:
+            if json.loads(data)["response_mode"] == "streaming":
+                # 事件跨分块发送，按分块编码逐块写出
+                events = "".join("data: {}\n\n".format(json.dumps({"answer": a})) for a in ["he", "llo", "!"])
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.send_header("X-Appbuilder-Request-Id", "llm-stream")
+                self.end_headers()
+                for chunk in [events[:10], events[10:30], events[30:]]:
+                    chunk = chunk.encode()
+                    self.wfile.write(b"%x\r\n%b\r\n" % (len(chunk), chunk))
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+                return
+            body = json.dumps({"answer": "hello"}).encode()
+        elif "/ocr/" in self.path:
+            form = parse_qs(data.decode())
+            body = json.dumps({"log_id": 1, "words_result_num": 1,
+                               "words_result": [{"words": str(len(form["image"][0]))}]}).encode()
+        elif "/tts_online" in self.path or "/text2audio" in self.path:
+            body = self.path.encode()
+            content_type = "audio/mp3"
+        elif "embeddings" in self.path:
+            request = json.loads(data)
+            body = json.dumps({"data": [{"embedding": [float(len(text))]} for text in request["input"]]}).encode()
+        else:
+            body = b'{"result": "ok"}'
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestTransport(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        cls.server.paths = []
+        cls.gateway = "http://127.0.0.1:{}".format(cls.server.server_address[1])
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        transport.configure_transport(transport.TransportConfig())
+
+    def test_components_share_pool(self):
+        """ 测试同一网关的组件共享连接池 """
+        c1 = Component(secret_key="test", gateway=self.gateway)
+        c2 = Component(secret_key="test", gateway=self.gateway)
+        adapter1 = c1.s.get_adapter(self.gateway)
+        adapter2 = c2.s.get_adapter(self.gateway)
+        self.assertIsNot(adapter1, adapter2)
+        self.assertIs(adapter1.poolmanager, adapter2.poolmanager)
+
+    def test_connection_reuse_stats(self):
+        """ 测试多个组件的请求复用同一个连接，并统计复用率 """
+        components = [Component(secret_key="test", gateway=self.gateway) for _ in range(3)]
+        for _ in range(4):
+            for c in components:
+                response = c.s.post(c.service_url("/v1/test"), json={})
+                c.check_response_header(response)
+        stats = transport.get_transport_stats(self.gateway)[self.gateway]
+        self.assertEqual(stats.requests, 12)
+        self.assertEqual(stats.connections_created, 1)
+        self.assertEqual(stats.open_connections, 1)
+        self.assertAlmostEqual(stats.reuse_ratio, 11 / 12)
+
+    def test_configure_transport(self):
+        """ 测试修改连接池配置 """
+        c = Component(secret_key="test", gateway=self.gateway)
+        old_manager = c.s.get_adapter(self.gateway).poolmanager
+        config = transport.configure_transport(pool_maxsize=4, keep_alive=False)
+        self.assertEqual(config.pool_maxsize, 4)
+        manager = c.s.get_adapter(self.gateway).poolmanager
+        self.assertIsNot(old_manager, manager)
+        for _ in range(2):
+            c.s.post(c.service_url("/v1/test"), json={})
+        stats = transport.get_transport_stats(self.gateway)[self.gateway]
+        self.assertEqual(stats.connections_created, 2)
+
+        with self.assertRaises(ValueError):
+            transport.configure_transport(pool_maxsize=0)
+
+
+class TestAsyncTransport(unittest.IsolatedAsyncioTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        cls.server.paths = []
+        cls.gateway = "http://127.0.0.1:{}".format(cls.server.server_address[1])
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        patcher = mock.patch.dict(os.environ, {"APPBUILDER_TOKEN": "test"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def asyncTearDown(self):
+        await transport.aclose_transport()
+
+    async def test_apost(self):
+        """ 测试异步请求返回 requests.Response """
+        c = Component(secret_key="test", gateway=self.gateway)
+        response = await c._apost(c.service_url("/v1/test"), json={}, timeout=10)
+        c.check_response_header(response)
+        self.assertEqual(response.json(), {"result": "ok"})
+        self.assertIs(transport.get_async_session(self.gateway), transport.get_async_session(self.gateway))
+
+    async def test_embedding_async(self):
+        """ 测试 Embedding 的原生异步 arun 与 abatch """
+        embedding = Embedding()
+        embedding.gateway = self.gateway
+        result = await embedding.arun("hello")
+        self.assertEqual(result.content, [5.0])
+        texts = ["x" * i for i in range(40)]
+        result = await embedding.abatch(texts)
+        self.assertEqual(result.content, [[float(i)] for i in range(40)])
+
+    async def test_llm_async_stream(self):
+        """ 测试大模型组件的异步流式返回与阻塞返回 """
+        component = appbuilder.StyleWriting(model="eb-turbo-appbuilder")
+        component.gateway = self.gateway
+
+        request = component.gene_run_request(message=appbuilder.Message("足球"), style_query="通用", length=100,
+                                             stream=True)
+        response = await component.acompletion(component.version, component.base_url, request)
+        self.assertIsInstance(response, AsyncCompletionResponse)
+        self.assertEqual(response.log_id, "llm-stream")
+        self.assertTrue(hasattr(response.result, "__aiter__"))
+        self.assertEqual([answer async for answer in response.result], ["he", "llo", "!"])
+        self.assertIsNotNone(response.time_to_first_token)
+
+        answer = await component.arun(message=appbuilder.Message("足球"), stream=True)
+        self.assertEqual("".join([chunk async for chunk in answer.content]), "hello!")
+        answer = await component.arun(message=appbuilder.Message("足球"))
+        self.assertEqual(answer.content, "hello")
+
+    async def test_vision_arun(self):
+        """ 测试视觉组件的原生异步 arun 与同步 run 返回相同结果 """
+        ocr = appbuilder.GeneralOCR(secret_key="test", gateway=self.gateway)
+        message = appbuilder.Message(content={"raw_image": b"image"})
+        result = await ocr.arun(message)
+        self.assertEqual(result.content, {"words_result": [{"words": "8"}]})
+        self.assertEqual(result.content, ocr.run(message).content)
+
+    async def test_tts_arun_concurrent_models(self):
+        """ 测试并发请求不同模型时各自使用本次调用的模型 """
+        tts = appbuilder.TTS(secret_key="test", gateway=self.gateway)
+        message = appbuilder.Message(content={"text": "你好"})
+        results = await asyncio.gather(*[
+            tts.arun(message, model=model, audio_type="wav")
+            for model in ["baidu-tts", "paddlespeech-tts"] * 4])
+        for model, result in zip(["baidu-tts", "paddlespeech-tts"] * 4, results):
+            path = result.content["audio_binary"].decode()
+            self.assertIn("tts_online" if model == "baidu-tts" else "text2audio", path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+# Copyright (c) 2023 Baidu, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import sqlalchemy
+
+from appbuilder import Message, UserSession
+
+
+class TestUserSession(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.config = "sqlite:///" + os.path.join(self.tmpdir.name, "session.db")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_concurrent_write_behind(self):
+        """ 测试多线程并发写入与读取自己刚写入的数据 """
+        user_session = UserSession(self.config)
+        errors = []
+
+        def chat(worker):
+            try:
+                session_id = "session-{}".format(worker)
+                for i in range(10):
+                    user_session.save_session_message(session_id, Message("q{}".format(i)), Message("a{}".format(i)))
+                    history = user_session.get_session_messages(session_id, limit=100)
+                    self.assertEqual(len(history), i + 1)
+                    self.assertEqual(history[-1].content["answer_message"]["content"], "a{}".format(i))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=chat, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertTrue(user_session.flush(timeout=5))
+        user_session.close()
+
+        # 新实例可以读到全部数据
+        user_session = UserSession(self.config, write_behind=False)
+        for i in range(8):
+            self.assertEqual(len(user_session.get_session_messages("session-{}".format(i), limit=100)), 10)
+        user_session.close()
+
+    def test_close_flushes_pending_writes(self):
+        """ 测试 close 前写入全部排队中的数据 """
+        user_session = UserSession(self.config, max_batch=7)
+        for i in range(50):
+            user_session.save_session_message("s", Message("q"), Message(str(i)))
+        user_session.close()
+        user_session = UserSession(self.config, write_behind=False)
+        history = user_session.get_session_messages("s", limit=100)
+        self.assertEqual(len(history), 50)
+        user_session.close()
+
+    def test_failed_write_behind(self):
+        """ 测试后台提交失败时保留数据并由 flush/close 报告，恢复后随下一批数据提交 """
+        user_session = UserSession(self.config)
+        user_session.write_retries = 1
+        user_session.write_backoff = 0.001
+        error = sqlalchemy.exc.OperationalError("", {}, None)
+        with mock.patch.object(user_session, "_write", side_effect=error):
+            for i in range(3):
+                user_session.save_session_message("s", Message("q"), Message(str(i)))
+            self.assertFalse(user_session.flush(timeout=5))
+            self.assertFalse(user_session.flush("s", timeout=5))
+            self.assertTrue(user_session.flush("other", timeout=5))
+        self.assertTrue(user_session._writer.is_alive())
+
+        user_session.save_session_message("s", Message("q"), Message("3"))
+        self.assertTrue(user_session.flush(timeout=5))
+        history = user_session.get_session_messages("s", limit=100)
+        self.assertEqual(sorted(m.content["answer_message"]["content"] for m in history), ["0", "1", "2", "3"])
+
+        # close 时同步提交失败的数据
+        with mock.patch.object(user_session, "_write", side_effect=error):
+            user_session.save_session_message("s", Message("q"), Message("4"))
+            self.assertFalse(user_session.flush(timeout=5))
+        user_session.close()
+        user_session = UserSession(self.config, write_behind=False)
+        self.assertEqual(len(user_session.get_session_messages("s", limit=100)), 5)
+        user_session.close()
+
+        # 仍失败时 close 抛出异常
+        user_session = UserSession(self.config)
+        user_session.write_retries = 0
+        with mock.patch.object(user_session, "_write", side_effect=error):
+            user_session.save_session_message("s", Message("q"), Message("5"))
+            with self.assertRaises(sqlalchemy.exc.OperationalError):
+                user_session.close()
+
+    def test_sync_write_validation(self):
+        user_session = UserSession(self.config, write_behind=False)
+        with self.assertRaises(ValueError):
+            user_session.save_session_message("s", "not a message", Message("a"))
+        user_session.save_session_message("s", Message("q"), Message("a"))
+        self.assertEqual(len(user_session.get_session_messages("s")), 1)
+        user_session.close()
+
+    def test_history_index_migration(self):
+        """ 测试为旧版本创建的表补充历史查询索引 """
+        engine = sqlalchemy.create_engine(self.config)
+        with engine.begin() as connection:
+            connection.execute(sqlalchemy.text(
+                "CREATE TABLE appbuilder_session_messages (id VARCHAR(36) PRIMARY KEY, "
+                "session_id VARCHAR(36) NOT NULL, query_message JSON, answer_message JSON, extra JSON, "
+                "created_at DATETIME, updated_at DATETIME, deleted BOOLEAN)"))
+        engine.dispose()
+        user_session = UserSession(self.config, write_behind=False)
+        indexes = sqlalchemy.inspect(user_session.engine).get_indexes("appbuilder_session_messages")
+        self.assertIn("ix_appbuilder_session_messages_session_updated", [index["name"] for index in indexes])
+        user_session.save_session_message("s", Message("q"), Message("a"))
+        self.assertEqual(len(user_session.get_session_messages("s")), 1)
+        user_session.close()
+        # 重复执行不报错
+        UserSession(self.config, write_behind=False).close()
+
+    def test_history_cache(self):
+        """ 测试历史缓存命中、追加与淘汰 """
+        user_session = UserSession(self.config, history_cache_size=2, history_cache_limit=5)
+        for i in range(8):
+            user_session.save_session_message("s", Message("q"), Message(str(i)))
+        history = user_session.get_session_messages("s", limit=3)
+        self.assertEqual([m.content["answer_message"]["content"] for m in history], ["5", "6", "7"])
+        self.assertIn("s", user_session._history_cache)
+
+        user_session.save_session_message("s", Message("q"), Message("8"))
+        history = user_session.get_session_history("s", limit=5)
+        self.assertEqual([row["answer_message"]["content"] for row in history], ["4", "5", "6", "7", "8"])
+        self.assertEqual(set(history[0]), {"id", "query_message", "answer_message", "extra",
+                                           "created_at", "updated_at"})
+
+        # 超过缓存条数时查询数据库
+        self.assertEqual(len(user_session.get_session_messages("s", limit=100)), 9)
+        user_session.get_session_messages("t", limit=3)
+        user_session.get_session_messages("u", limit=3)
+        self.assertEqual(list(user_session._history_cache), ["t", "u"])
+        user_session.close()
+
+        # 缓存中的数据与数据库一致
+        user_session = UserSession(self.config, write_behind=False)
+        rows = user_session.get_session_history("s", limit=5)
+        self.assertEqual([row["answer_message"]["content"] for row in rows], ["4", "5", "6", "7", "8"])
+        user_session.close()
+
+
+if __name__ == '__main__':
+    unittest.main()